@@ -4,14 +4,21 @@ import sys
 import os
 import time
 import json
+import threading
 
 # Add parent directory to path to import from data/scripts
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'data', 'scripts'))
 
-# Set environment variable to disable signal-based timeouts in run_query
-os.environ['DISABLE_SIGNAL_TIMEOUT'] = '1'
+from run_query import (
+    query_rag_with_meta, query_rag_stream, get_index_stats, get_index_versions, get_embedding_cache_stats,
+    get_answer_cache_stats, get_llm_stats, warmup, get_warmup_status, watch_indexes, REQUEST_TIMEOUT,
+)
+from utils.deadline import Deadline
 
-from run_query import query_rag
+# Set FINORA_WARMUP=0 to skip loading the model and indexes at startup
+WARMUP_ENABLED = os.environ.get('FINORA_WARMUP', '1') == '1'
+# Set FINORA_INDEX_WATCH=0 to pick up new index versions only when queried
+INDEX_WATCH_ENABLED = os.environ.get('FINORA_INDEX_WATCH', '1') == '1'
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for Flutter
@@ -20,13 +27,39 @@ print("=" * 60)
 print("🚀 Finora AI Tax Advisor API Starting...")
 print("=" * 60)
 
+if WARMUP_ENABLED:
+    # Runs next to the server so /health can report progress while warming
+    threading.Thread(target=warmup, name='finora-warmup', daemon=True).start()
+if INDEX_WATCH_ENABLED:
+    # New index versions published by ingest are loaded and swapped in off the request path
+    watch_indexes()
+
 @app.route('/health', methods=['GET'])
 def health():
-    """Health check endpoint"""
+    """
+    Health check endpoint. Returns 503 until the startup warmup has finished,
+    so a load balancer only routes queries to warm instances.
+    """
+    warmup_status = get_warmup_status()
+    ready = not WARMUP_ENABLED or warmup_status['status'] == 'ready'
     return jsonify({
-        'status': 'healthy',
+        'status': 'healthy' if ready else warmup_status['status'],
+        'ready': ready,
         'service': 'Finora AI Tax Advisor',
-        'version': '1.0.0'
+        'version': '1.0.0',
+        'warmup': warmup_status,
+        'embedding_cache': get_embedding_cache_stats(),
+        'answer_cache': get_answer_cache_stats(),
+        'llm': get_llm_stats()
+    }), 200 if ready else 503
+
+@app.route('/indexes', methods=['GET'])
+def indexes():
+    """Version, load time and memory footprint of each index held in memory"""
+    return jsonify({
+        'success': True,
+        'index_versions': get_index_versions(),
+        'indexes': get_index_stats()
     })
 
 @app.route('/query', methods=['POST'])
@@ -44,9 +77,16 @@ def query():
         "success": true,
         "query": "What is Section 80C?",
         "answer": "Section 80C allows deductions up to ₹1,50,000...",
+        "index_versions": {"deductions_index": "20261018T093000Z-3f2a"},
+        "cached": false,
+        "timed_out": false,
         "processing_time": 1.23
     }
+    timed_out is true when the answer had to be cut off at FINORA_REQUEST_TIMEOUT
+    seconds; the answer then shows the retrieved documents instead.
     """
+    # The whole request, LLM retries and fallbacks included, must fit in this budget
+    deadline = Deadline(REQUEST_TIMEOUT)
     try:
         data = request.json
         user_query = data.get('query', '').strip()
@@ -62,16 +102,20 @@ def query():
         start_time = time.time()
         
         # Call your existing RAG system directly
-        answer = query_rag(user_query, top_k=8)
+        result = query_rag_with_meta(user_query, top_k=8, deadline=deadline)
+        answer = result['answer']
         
         processing_time = time.time() - start_time
         
-        print(f"✅ Answer generated in {processing_time:.2f}s")
+        print(f"✅ Answer {'served from cache' if result['cached'] else 'generated'} in {processing_time:.2f}s")
         
         return jsonify({
             'success': True,
             'query': user_query,
             'answer': answer,
+            'index_versions': result['index_versions'],
+            'cached': result['cached'],
+            'timed_out': result['timed_out'],
             'processing_time': round(processing_time, 2)
         })
         
@@ -138,15 +182,21 @@ def suggestions():
 @app.route('/query/stream', methods=['POST'])
 def query_stream():
     """
-    Streaming query endpoint - returns answer word by word for real-time display
+    Streaming query endpoint - streams the answer as the LLM generates it
     
     Expected JSON body:
     {
         "query": "What is Section 80C?"
     }
     
-    Returns: Server-Sent Events stream with answer chunks
+    Returns: Server-Sent Events, each a JSON object:
+        {"type": "sources", "sources": [...], "index_versions": {...}}   first, right after retrieval
+        {"type": "token", "chunk": "...", "done": false}                 answer text as it is generated
+        {"type": "answer", "answer": "...", "done": true, ...}           final answer with citations
+        {"type": "error", "error": "...", "done": true}                  if the query fails midway
+    The stream ends within FINORA_REQUEST_TIMEOUT seconds of the request.
     """
+    deadline = Deadline(REQUEST_TIMEOUT)
     try:
         data = request.json
         query_text = data.get('query', '')
@@ -158,23 +208,13 @@ def query_stream():
             }), 400
         
         def generate():
-            """Generate streaming response"""
-            # Get the full answer first (for now, we'll simulate streaming)
-            # In production, modify query_rag to support streaming
-            answer = query_rag(query_text, top_k=6)
-            
-            # Stream word by word
-            words = answer.split()
-            for i, word in enumerate(words):
-                chunk_data = {
-                    'chunk': word + ' ',
-                    'done': i == len(words) - 1
-                }
-                yield f"data: {json.dumps(chunk_data)}\n\n"
-                time.sleep(0.05)  # Small delay for streaming effect
-            
-            # Send completion signal
-            yield f"data: {json.dumps({'done': True, 'complete': True})}\n\n"
+            """Forward pipeline events as they happen"""
+            try:
+                for event in query_rag_stream(query_text, top_k=6, deadline=deadline):
+                    yield f"data: {json.dumps(event)}\n\n"
+            except Exception as e:
+                print(f"❌ Streaming error: {str(e)}")
+                yield f"data: {json.dumps({'type': 'error', 'error': str(e), 'done': True})}\n\n"
         
         return Response(
             stream_with_context(generate()),
@@ -191,11 +231,11 @@ def query_stream():
             'error': str(e)
         }), 500
 
-
 if __name__ == '__main__':
     print("\n✅ API Server Ready!")
     print("📍 Health Check: http://localhost:5001/health")
     print("📍 Query Endpoint: http://localhost:5001/query")
+    print("📍 Index Stats: http://localhost:5001/indexes")
     print("📍 Streaming Query: http://localhost:5001/query/stream")
     print("📍 Suggestions: http://localhost:5001/suggestions")
     print("\n" + "=" * 60 + "\n")
@@ -0,0 +1,90 @@
+"""
+Recall@k of quantized index scans against the exact float32 search.
+
+For each index, chunk embeddings (with a little noise) and the first words
+of the chunk text stand in for user queries, so the report runs offline
+without loading the embedding model. Usage:
+
+    python quantization_report.py [--k 8] [--queries 50] [index_name ...]
+"""
+import os
+import sys
+import contextlib
+import io
+
+import numpy as np
+
+import run_query
+from run_query import EMBED_DIR, score_index
+from utils.bm25 import tokenize
+from utils.index_registry import IndexRegistry
+
+
+def sample_queries(index, num_queries: int, rng: np.random.Generator):
+    """(query text, query vector) pairs derived from random chunks of the index."""
+    rows = rng.choice(len(index.entries), size=min(num_queries, len(index.entries)), replace=False)
+    queries = []
+    for row in rows:
+        vec = np.asarray(index.matrix[row], dtype=np.float32)
+        vec = vec + rng.normal(scale=0.02, size=vec.shape).astype(np.float32)
+        text = " ".join(index.entries[int(row)].get("text", "").split()[:8])
+        queries.append((text, vec))
+    return queries
+
+
+def run_search(index, queries, k: int):
+    results = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for text, vec in queries:
+            matches = score_index(index, text, vec, tokenize(text), top_k=k)
+            results.append([m[1].get("id") for m in matches])
+    return results
+
+
+def recall(baseline, candidate) -> float:
+    hits = total = 0
+    for expected, got in zip(baseline, candidate):
+        hits += len(set(expected) & set(got))
+        total += len(expected)
+    return hits / total if total else 1.0
+
+
+def main(argv=None):
+    args = list(argv if argv is not None else sys.argv[1:])
+    k, num_queries = 8, 50
+    for flag in ("--k", "--queries"):
+        if flag in args:
+            pos = args.index(flag)
+            value = int(args[pos + 1])
+            del args[pos:pos + 2]
+            if flag == "--k":
+                k = value
+            else:
+                num_queries = value
+    names = args or sorted(d for d in os.listdir(EMBED_DIR) if os.path.isdir(os.path.join(EMBED_DIR, d)))
+
+    exact = IndexRegistry(EMBED_DIR, quantization="none")
+    variants = [("float16", True), ("float16", False), ("int8", True), ("int8", False)]
+    registries = {mode: IndexRegistry(EMBED_DIR, quantization=mode) for mode in ("float16", "int8")}
+
+    print(f"{'index':<22}{'variant':<18}{'recall@' + str(k):>10}{'scan bytes':>14}")
+    for name in names:
+        with contextlib.redirect_stdout(io.StringIO()):
+            base_index = exact.get(name)
+        if not base_index.entries:
+            continue
+        queries = sample_queries(base_index, num_queries, np.random.default_rng(0))
+        baseline = run_search(base_index, queries, k)
+        print(f"{name:<22}{'float32':<18}{1.0:>10.3f}{base_index.matrix.nbytes:>14}")
+
+        for mode, rescore in variants:
+            with contextlib.redirect_stdout(io.StringIO()):
+                index = registries[mode].get(name)
+            run_query.QUANT_RESCORE = rescore
+            got = run_search(index, queries, k)
+            label = f"{mode}{' +rescore' if rescore else ''}"
+            print(f"{'':<22}{label:<18}{recall(baseline, got):>10.3f}{index.scan_matrix.nbytes:>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,25 @@
 import os
 import json
 import re
-import platform
+import time
+import heapq
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import numpy as np
 from dotenv import load_dotenv
-from utils.embedder import load_vector_store, embed_text
+from utils.embedder import (
+    load_vector_store, embed_query, get_embedding_cache_stats, get_embedding_model, warm_up_model,
+)
 from utils.router import route_query
+from utils.index_registry import IndexRegistry
+from utils.vector_search import cosine_scores, normalize_query, top_k_indices
+from utils.bm25 import tokenize
+from utils.dedup import mmr_select
+from utils.answer_cache import AnswerCache
+from utils.llm_client import get_llm_client, LLMTimeout
+from utils.deadline import Deadline, DeadlineExceeded
+from utils.context_packer import ContextPacker
 
 # Load environment variables from .env file
 load_dotenv()
@@ -13,19 +28,217 @@ load_dotenv()
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 EMBED_DIR = os.path.join(PROJECT_ROOT, "embeddings")
 
+# Process-wide cache: each index is parsed once and reloaded only when the file changes
+INDEX_REGISTRY = IndexRegistry(EMBED_DIR)
+
+# Score routed indexes concurrently instead of through the combined matrix
+PARALLEL_INDEX_SEARCH = os.environ.get('FINORA_PARALLEL_SEARCH') == '1'
+SEARCH_POOL_WORKERS = int(os.environ.get('FINORA_SEARCH_WORKERS', '4'))
+
+# With FINORA_QUANTIZATION=float16|int8, rescore top candidates against float32 rows
+QUANT_RESCORE = os.environ.get('FINORA_QUANT_RESCORE', '1') == '1'
+
+# Diversify retrieved chunks with MMR over top_k * MMR_POOL_FACTOR candidates, so
+# near-identical chunks (FAQ-like text, the same provision in several indexes)
+# do not fill the context; FINORA_MMR=0 keeps the plain top_k
+MMR_ENABLED = os.environ.get('FINORA_MMR', '1') == '1'
+MMR_POOL_FACTOR = int(os.environ.get('FINORA_MMR_POOL_FACTOR', '3'))
+MMR_LAMBDA = float(os.environ.get('FINORA_MMR_LAMBDA', '0.7'))
+MMR_DUPLICATE_THRESHOLD = float(os.environ.get('FINORA_MMR_DUPLICATE_THRESHOLD', '0.8'))
+_search_pool = None
+
+# Local Ollama models in order of preference; llama3.2 is better for detailed tax responses
+OLLAMA_MODELS = ['llama3.2', 'phi3']
+# Load the first model into Ollama during warmup (and keep it loaded, see
+# FINORA_OLLAMA_KEEP_ALIVE in utils/llm_client.py) so the first query skips the load
+OLLAMA_PRELOAD = os.environ.get('FINORA_OLLAMA_PRELOAD', '1') == '1'
+# Hedged generation: start the next model when the first one is unusually slow
+# to produce a token, and use whichever answer passes the quality check first
+# (thresholds in utils/llm_client.py). Runs two models at once when it hedges
+LLM_HEDGE = os.environ.get('FINORA_LLM_HEDGE', '0') == '1'
+# An answer rejected for stopping mid-sentence (or at the token limit) is
+# finished by continuing it, CONTINUATION_TOKENS at a time for at most
+# MAX_CONTINUATIONS rounds, before falling back to regenerating it
+LLM_CONTINUATION = os.environ.get('FINORA_LLM_CONTINUATION', '1') == '1'
+CONTINUATION_TOKENS = int(os.environ.get('FINORA_LLM_CONTINUATION_TOKENS', '64'))
+MAX_CONTINUATIONS = int(os.environ.get('FINORA_LLM_MAX_CONTINUATIONS', '2'))
+CONTINUABLE_ISSUES = ('truncated', 'incomplete')
+# Seconds a query may take end to end (retrieval, every LLM attempt, the
+# hosted fallback); after that the retrieved documents are shown instead
+REQUEST_TIMEOUT = float(os.environ.get('FINORA_REQUEST_TIMEOUT', '60'))
+# Answer when the deadline runs out before retrieval is done (nothing to show yet)
+DEADLINE_ANSWER = "⏱️ Sorry, looking up your question took too long. Please try again in a moment."
+
+# The prompt gets the retrieved chunks' sentences that best match the query,
+# up to CONTEXT_TOKEN_BUDGET tokens (see utils/context_packer.py);
+# FINORA_CONTEXT_PACKING=0 sends the start of each chunk instead
+CONTEXT_PACKING = os.environ.get('FINORA_CONTEXT_PACKING', '1') == '1'
+CONTEXT_TOKEN_BUDGET = int(os.environ.get('FINORA_CONTEXT_TOKENS', '1200'))
+# Packing embeds the sentences of chunks it has not seen yet; with less time
+# left than this, the request trims chunks instead and keeps the time for the LLM
+CONTEXT_PACKING_MIN_SECONDS = float(os.environ.get('FINORA_CONTEXT_PACKING_MIN_SECONDS', '10'))
+CONTEXT_PACKER = ContextPacker(
+    encode=lambda sentences: get_embedding_model().encode(sentences, batch_size=64, convert_to_numpy=True),
+    count_tokens=lambda texts: get_embedding_model().count_tokens(texts),
+    cache_size=int(os.environ.get('FINORA_CONTEXT_CACHE_SIZE', '2048')),
+)
+
+# Generated answers reused for paraphrased queries that retrieve the same chunks
+# (see utils/answer_cache.py); FINORA_ANSWER_CACHE_SIZE=0 disables it, and
+# FINORA_ANSWER_CACHE_PATH (e.g. data/cache/answers.json) persists it
+ANSWER_CACHE = AnswerCache(
+    max_size=int(os.environ.get('FINORA_ANSWER_CACHE_SIZE', '512')),
+    ttl_seconds=float(os.environ.get('FINORA_ANSWER_CACHE_TTL', str(24 * 3600))),
+    threshold=float(os.environ.get('FINORA_ANSWER_CACHE_THRESHOLD', '0.95')),
+    path=os.environ.get('FINORA_ANSWER_CACHE_PATH') or None,
+)
+# Only answers actually generated by an LLM are cached
+CACHEABLE_ORIGINS = ('ollama', 'huggingface')
+
+FAQ_FILES = [
+    os.path.join(PROJECT_ROOT, "faq", "tax_rates_faq.json"),
+    os.path.join(PROJECT_ROOT, "faq", "faqs.json"),
+]
+_faq_cache = {'key': None, 'faqs': {}}
+_faq_lock = threading.Lock()
+
+_warmup_state = {'status': 'pending', 'started_at': None, 'duration_s': None, 'components': {}}
+_warmup_lock = threading.Lock()
+
 
 def load_index(index_name: str):
-    """Load the index.jsonl file and return all vectors"""
-    index_path = os.path.join(EMBED_DIR, index_name, "index.jsonl")
+    """Return all vectors of an index, served from the in-memory registry"""
+    return INDEX_REGISTRY.get(index_name).entries
+
+
+def get_index_stats() -> dict:
+    """Load time and memory per index currently held in memory."""
+    return INDEX_REGISTRY.stats()
+
+
+def get_answer_cache_stats() -> dict:
+    """Hit rate, size and invalidations of the semantic answer cache."""
+    return ANSWER_CACHE.stats()
+
+
+def get_llm_stats() -> dict:
+    """Request counters of the shared Ollama client."""
+    return get_llm_client().stats()
+
+
+def get_index_versions() -> dict:
+    """Version served for each loaded index."""
+    return INDEX_REGISTRY.versions()
+
 
-    if not os.path.exists(index_path):
-        raise FileNotFoundError(f"Index not found: {index_path}")
+def watch_indexes(interval: float = None):
+    """Poll for newly published index versions and hot-swap them in the background."""
+    INDEX_REGISTRY.watch(interval)
 
-    entries = []
-    with open(index_path, "r") as f:
-        for line in f:
-            entries.append(json.loads(line))
-    return entries
+
+def load_faqs() -> dict:
+    """
+    All FAQ entries from tax_rates_faq.json (key-value) and faqs.json (array,
+    keyed by id). Parsed once and re-read only when either file changes.
+    """
+    key = tuple(
+        (os.path.getmtime(path), os.path.getsize(path)) if os.path.exists(path) else None
+        for path in FAQ_FILES
+    )
+    with _faq_lock:
+        if key == _faq_cache['key']:
+            return _faq_cache['faqs']
+
+        all_faqs = {}
+        # Load tax_rates_faq.json (key-value format)
+        if os.path.exists(FAQ_FILES[0]):
+            with open(FAQ_FILES[0], 'r') as f:
+                all_faqs.update(json.load(f))
+
+        # Load faqs.json (array format) and convert to key-value
+        if os.path.exists(FAQ_FILES[1]):
+            with open(FAQ_FILES[1], 'r') as f:
+                faqs_list = json.load(f)
+                # Convert array to dict with id as key
+                for faq_item in faqs_list:
+                    all_faqs[faq_item['id']] = {
+                        'question': faq_item['question'],
+                        'answer': faq_item['answer'],
+                        'tags': faq_item.get('tags', []),
+                        'category': faq_item.get('category', '')
+                    }
+
+        print(f"[faq] Loaded {len(all_faqs)} FAQ entries from both sources")
+        _faq_cache['key'], _faq_cache['faqs'] = key, all_faqs
+        return all_faqs
+
+
+def _timed(name: str, fn):
+    """Run one warmup component, recording its duration or error."""
+    start = time.perf_counter()
+    try:
+        detail = fn()
+        result = {'status': 'ready', 'duration_s': round(time.perf_counter() - start, 3)}
+        if detail is not None:
+            result['detail'] = detail
+    except Exception as e:
+        print(f"[warmup] {name} failed: {e}")
+        result = {'status': 'failed', 'duration_s': round(time.perf_counter() - start, 3), 'error': str(e)}
+    with _warmup_lock:
+        _warmup_state['components'][name] = result
+    return result
+
+
+def _warm_index(name: str):
+    index = INDEX_REGISTRY.get(name)
+    index.warm()
+    return len(index.entries)
+
+
+def _build_combined_matrix() -> int:
+    INDEX_REGISTRY.rebuild_combined()
+    return int(INDEX_REGISTRY.combined()[0].shape[0])
+
+
+def warmup(max_workers: int = None) -> dict:
+    """
+    Load everything the first query would otherwise load lazily: the
+    embedding model (plus one dummy encode), every index with its keyword,
+    phrase and scan structures, the FAQ corpus and the preferred Ollama
+    model, all in parallel.
+    The outcome is available through get_warmup_status(). Safe to call again;
+    already loaded pieces are reused.
+    """
+    with _warmup_lock:
+        _warmup_state.update(status='warming', started_at=time.time(), duration_s=None, components={})
+    start = time.perf_counter()
+
+    tasks = {'embedding_model': warm_up_model, 'faq': lambda: len(load_faqs())}
+    if OLLAMA_PRELOAD:
+        tasks[f'llm:{OLLAMA_MODELS[0]}'] = lambda: round(get_llm_client().preload(OLLAMA_MODELS[0]), 3)
+    for name in INDEX_REGISTRY.available():
+        tasks[f'index:{name}'] = lambda name=name: _warm_index(name)
+
+    workers = max_workers or min(len(tasks), (os.cpu_count() or 2) + 2)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='finora-warmup') as pool:
+        results = dict(zip(tasks, pool.map(lambda item: _timed(*item), tasks.items())))
+    # Multi-index queries scan the stacked matrix; build it now, off the request path
+    _timed('combined_matrix', _build_combined_matrix)
+
+    failed = [name for name, r in results.items() if r['status'] == 'failed']
+    with _warmup_lock:
+        _warmup_state['status'] = 'failed' if 'embedding_model' in failed else 'ready'
+        _warmup_state['duration_s'] = round(time.perf_counter() - start, 3)
+    print(
+        f"[warmup] {_warmup_state['status']} in {_warmup_state['duration_s']:.2f}s "
+        f"({len(tasks)} components{', failed: ' + ', '.join(failed) if failed else ''})"
+    )
+    return get_warmup_status()
+
+
+def get_warmup_status() -> dict:
+    with _warmup_lock:
+        return {**_warmup_state, 'components': dict(_warmup_state['components'])}
 
 
 def expand_query(query: str) -> str:
@@ -66,89 +279,188 @@ def expand_query(query: str) -> str:
     return expanded
 
 
-def bm25_score(query_terms: list, doc_text: str, avg_doc_length: float, doc_length: int, k1=1.5, b=0.75) -> float:
-    """Calculate BM25 keyword relevance score."""
-    doc_lower = doc_text.lower()
-    score = 0.0
-    
-    for term in query_terms:
-        term_lower = term.lower()
-        # Count term frequency in document
-        tf = doc_lower.count(term_lower)
-        if tf > 0:
-            # BM25 formula (simplified without IDF since we're using it as a boost)
-            numerator = tf * (k1 + 1)
-            denominator = tf + k1 * (1 - b + b * (doc_length / avg_doc_length))
-            score += numerator / denominator
-    
-    return score
-
-
-def search_vectors(query: str, index_name: str, top_k=5):
-    """Hybrid search combining semantic similarity and keyword matching."""
-    entries = load_index(index_name)
-    
-    # Expand query for better retrieval
+def prepare_query(query: str):
+    """Expand, embed and tokenize a query once, for use against any number of indexes."""
     expanded_query = expand_query(query)
     if expanded_query != query:
         print(f"[search] Expanded query: '{query}' → '{expanded_query}'")
-    
-    query_vec = embed_text(expanded_query)
-    query_terms = expanded_query.lower().split()
-    
-    # Calculate average document length for BM25
-    avg_doc_length = sum(len(e.get('text', '')) for e in entries) / len(entries) if entries else 1
+    return embed_query(expanded_query), tokenize(expanded_query)
 
-    # Use cosine similarity for semantic search
-    def cosine_similarity(a, b):
-        dot = sum(x * y for x, y in zip(a, b))
-        norm_a = sum(x * x for x in a) ** 0.5
-        norm_b = sum(x * x for x in b) ** 0.5
-        return dot / (norm_a * norm_b + 1e-9)
 
-    scored = []
-    for e in entries:
-        # Semantic similarity score
-        semantic_score = cosine_similarity(query_vec, e["embedding"])
-        
-        # Keyword matching score (BM25)
-        doc_text = e.get('text', '')
-        doc_length = len(doc_text)
-        keyword_score = bm25_score(query_terms, doc_text, avg_doc_length, doc_length)
-        
-        # Normalize keyword score to 0-1 range (approximate)
-        keyword_score_norm = min(keyword_score / 10.0, 1.0)
-        
-        # Hybrid score: 70% semantic + 30% keyword
-        # Keyword matching helps with exact section numbers, technical terms
-        hybrid_score = 0.7 * semantic_score + 0.3 * keyword_score_norm
-        
-        # Boost for exact phrase matches (e.g., "section 80C")
-        query_clean = query.lower().strip()
-        if len(query_clean) > 5 and query_clean in doc_text.lower():
-            hybrid_score *= 1.2  # 20% boost for exact matches
-        
-        scored.append((hybrid_score, e, semantic_score, keyword_score_norm))
+def score_index(index, query: str, query_vec, query_terms: list, top_k=5, semantic_scores=None):
+    """
+    Hybrid-score one loaded index and return its top_k (score, entry) pairs.
+    semantic_scores may be passed in when they were computed for several
+    indexes at once (see search_indexes).
+    """
+    entries = index.entries
+    if not entries:
+        return []
 
-    scored.sort(reverse=True, key=lambda x: x[0])
+    # Keyword matching score (BM25 with IDF over the index's postings), normalized to 0-1 range (approximate)
+    keyword_scores = index.bm25.score(query_terms)
+    keyword_scores_norm = np.minimum(keyword_scores / 10.0, 1.0)
+    
+    # Semantic similarity: one matrix-vector product against pre-normalized rows.
+    # Large indexes with an ANN index only score ANN + top keyword candidates exactly.
+    ann = index.search_ann if semantic_scores is None else None
+    if ann is not None:
+        num_candidates = max(top_k * 20, 200)
+        candidates = np.union1d(
+            ann.search(normalize_query(query_vec), num_candidates),
+            top_k_indices(keyword_scores, num_candidates),
+        )
+        semantic_scores = np.full(len(entries), -np.inf)
+        semantic_scores[candidates] = cosine_scores(index.matrix[candidates], query_vec)
+    else:
+        if semantic_scores is None:
+            semantic_scores = cosine_scores(index.scan_matrix, query_vec)
+        # Quantized scan: rescore the best semantic and keyword candidates in float32
+        if index.quantization != "none" and QUANT_RESCORE:
+            num_candidates = max(top_k * 10, 100)
+            candidates = np.union1d(
+                top_k_indices(semantic_scores, num_candidates),
+                top_k_indices(keyword_scores, num_candidates),
+            )
+            semantic_scores[candidates] = cosine_scores(index.matrix[candidates], query_vec)
+    
+    # Hybrid score: 70% semantic + 30% keyword
+    # Keyword matching helps with exact section numbers, technical terms
+    hybrid_scores = 0.7 * semantic_scores + 0.3 * keyword_scores_norm
+    
+    # Boost for exact phrase matches (e.g., "section 80C")
+    query_clean = query.lower().strip()
+    if len(query_clean) > 5:
+        phrase_hits = index.find_phrase(query_clean)  # trigram candidates, then substring check
+        hybrid_scores[phrase_hits] *= 1.2  # 20% boost for exact matches
     
     # Filter by minimum similarity threshold
     min_threshold = 0.30  # Slightly higher threshold for better quality
-    filtered = [(s, e) for s, e, sem, kw in scored if s >= min_threshold]
+    eligible = np.flatnonzero(hybrid_scores >= min_threshold)
     
     # Dynamic threshold: if too few results, lower threshold
-    if len(filtered) < 3 and min_threshold > 0.25:
+    if len(eligible) < 3 and min_threshold > 0.25:
         min_threshold = 0.25
-        filtered = [(s, e) for s, e, sem, kw in scored if s >= min_threshold]
-        if filtered:
+        eligible = np.flatnonzero(hybrid_scores >= min_threshold)
+        if len(eligible):
             print(f"[search] Lowered threshold to {min_threshold} to get more results")
     
     # Debug: show score breakdown for top result
-    if filtered and scored:
-        top_hybrid, top_chunk, top_sem, top_kw = scored[0]
-        print(f"[search] Top result: hybrid={top_hybrid:.3f} (semantic={top_sem:.3f}, keyword={top_kw:.3f})")
+    if len(eligible):
+        top = int(np.argmax(hybrid_scores))
+        print(f"[search] Top result: hybrid={hybrid_scores[top]:.3f} (semantic={semantic_scores[top]:.3f}, keyword={keyword_scores_norm[top]:.3f})")
     
-    return filtered[:top_k]
+    best = eligible[top_k_indices(hybrid_scores[eligible], top_k)]
+    return [(float(hybrid_scores[i]), entries[i]) for i in best]
+
+
+def search_vectors(query: str, index_name: str, top_k=5):
+    """Hybrid search combining semantic similarity and keyword matching."""
+    index = INDEX_REGISTRY.get(index_name)
+    query_vec, query_terms = prepare_query(query)
+    return score_index(index, query, query_vec, query_terms, top_k=top_k)
+
+
+def resolve_indexes(index_names: list) -> list:
+    """
+    (name, LoadedIndex) for each available index. A query scores against
+    exactly these objects, so a version swapped in meanwhile never mixes in.
+    """
+    indexes = []
+    for index_name in index_names:
+        try:
+            indexes.append((index_name, INDEX_REGISTRY.get(index_name)))
+        except FileNotFoundError:
+            print(f"[warning] Index {index_name} not found, skipping")
+    return indexes
+
+
+def search_indexes(query: str, index_names: list, top_k=5, parallel=None, indexes=None, prepared=None, deadline=None):
+    """
+    Search several indexes with one query embedding and return one global top_k.
+
+    By default the selected indexes stacked in the registry's combined
+    matrix are scored with one matrix-vector product per run of adjacent
+    rows, then sliced per index; the others are scanned in place. With parallel=True each index is scored in a thread pool
+    instead (NumPy releases the GIL). Per-index thresholds and keyword
+    statistics are unchanged; results are merged through one bounded heap.
+    indexes: (name, LoadedIndex) pairs from resolve_indexes, if already resolved.
+    prepared: (query_vec, query_terms) from prepare_query, if already computed.
+    deadline: a Deadline bounding the wait for the parallel searches
+    (DeadlineExceeded when it runs out).
+    """
+    if parallel is None:
+        parallel = PARALLEL_INDEX_SEARCH
+
+    if indexes is None:
+        indexes = resolve_indexes(index_names)
+    if not indexes:
+        return []
+
+    query_vec, query_terms = prepared if prepared is not None else prepare_query(query)
+
+    if parallel and len(indexes) > 1:
+        futures = [
+            _get_search_pool().submit(score_index, index, query, query_vec, query_terms, top_k=top_k)
+            for _, index in indexes
+        ]
+        try:
+            results = [f.result(timeout=deadline.timeout() if deadline else None) for f in futures]
+        except FutureTimeoutError:
+            for f in futures:
+                f.cancel()
+            raise DeadlineExceeded('search', deadline.budget) from None
+    else:
+        combined_matrix, spans, members = INDEX_REGISTRY.combined()
+        # Indexes outside the combined matrix (mmapped, quantized, searched through
+        # ANN) or stacked in a version other than the one this query holds are
+        # scored in place by score_index
+        spans = {name: spans[name] for name, index in indexes if members.get(name) is index}
+        # Only the selected rows are multiplied: one product per run of adjacent spans
+        runs = []
+        for name, (start, end) in sorted(spans.items(), key=lambda item: item[1]):
+            if runs and runs[-1][1] == start:
+                runs[-1][1] = end
+                runs[-1][2].append(name)
+            else:
+                runs.append([start, end, [name]])
+        semantic = {}
+        for run_start, run_end, names in runs:
+            scores = cosine_scores(combined_matrix[run_start:run_end], query_vec)
+            for name in names:
+                start, end = spans[name]
+                semantic[name] = scores[start - run_start:end - run_start]
+        results = [
+            score_index(index, query, query_vec, query_terms, top_k=top_k, semantic_scores=semantic.get(name))
+            for name, index in indexes
+        ]
+
+    return heapq.nlargest(top_k, itertools.chain.from_iterable(results), key=lambda m: m[0])
+
+
+def lookup_exact(text: str, index_names: list = None) -> list:
+    """
+    Chunks containing text verbatim (case-insensitive), e.g. an HSN code or
+    "section 112a", found through each index's trigram postings instead of
+    scanning every chunk. Returns (index_name, entry) pairs.
+    """
+    if index_names is None:
+        index_names = sorted(d for d in os.listdir(EMBED_DIR) if os.path.isdir(os.path.join(EMBED_DIR, d)))
+    matches = []
+    for index_name in index_names:
+        try:
+            index = INDEX_REGISTRY.get(index_name)
+        except FileNotFoundError:
+            continue
+        matches.extend((index_name, index.entries[i]) for i in index.find_phrase(text.strip()))
+    return matches
+
+
+def _get_search_pool() -> ThreadPoolExecutor:
+    global _search_pool
+    if _search_pool is None:
+        _search_pool = ThreadPoolExecutor(max_workers=SEARCH_POOL_WORKERS, thread_name_prefix="index-search")
+    return _search_pool
 
 
 def is_tax_related_query(query: str) -> bool:
@@ -446,33 +758,7 @@ def check_faq(query: str) -> str:
     """Check if query matches a common FAQ and return cached answer.
     Now checks BOTH tax_rates_faq.json and faqs.json for comprehensive coverage."""
     try:
-        # Load both FAQ sources
-        faq_files = [
-            os.path.join(PROJECT_ROOT, "faq", "tax_rates_faq.json"),
-            os.path.join(PROJECT_ROOT, "faq", "faqs.json")
-        ]
-        
-        all_faqs = {}
-        
-        # Load tax_rates_faq.json (key-value format)
-        if os.path.exists(faq_files[0]):
-            with open(faq_files[0], 'r') as f:
-                all_faqs.update(json.load(f))
-        
-        # Load faqs.json (array format) and convert to key-value
-        if os.path.exists(faq_files[1]):
-            with open(faq_files[1], 'r') as f:
-                faqs_list = json.load(f)
-                # Convert array to dict with id as key
-                for faq_item in faqs_list:
-                    all_faqs[faq_item['id']] = {
-                        'question': faq_item['question'],
-                        'answer': faq_item['answer'],
-                        'tags': faq_item.get('tags', []),
-                        'category': faq_item.get('category', '')
-                    }
-        
-        print(f"[faq] Loaded {len(all_faqs)} FAQ entries from both sources")
+        all_faqs = load_faqs()
         
         query_lower = query.lower().strip()
         
@@ -572,8 +858,8 @@ def check_faq(query: str) -> str:
         return None
 
 
-def answer_with_llm(query: str, context_chunks: list):
-    """Generate answer using local Ollama LLM or fallback to Hugging Face."""
+def precheck_answer(query: str, context_chunks: list):
+    """Answer that needs no LLM call (off-topic query, nothing retrieved, FAQ hit), else None."""
     
     # Pre-filter: Check if question is tax-related FIRST before checking FAQ
     if not is_tax_related_query(query):
@@ -590,40 +876,46 @@ def answer_with_llm(query: str, context_chunks: list):
         print("[faq] Found answer in FAQ database")
         return faq_answer
     
-    # Check chunk quality: warn if chunks are too short (may indicate poor retrieval)
-    avg_chunk_length = sum(len(c.get('text', '')) for c in context_chunks) / len(context_chunks)
-    if avg_chunk_length < 100:
-        print(f"[warning] Retrieved chunks seem short (avg {avg_chunk_length:.0f} chars)")
-    
-    # Classify query intent
-    intent = classify_query_intent(query)
-    query_lower = query.lower()
-    
-    # Build context with source tracking - smarter trimming
+    return None
+
+
+MAX_CONTEXT_CHARS = 10000  # trim_context's limit (~2500 tokens)
+
+
+def chunk_source_label(chunk: dict) -> str:
+    """Source shown for a chunk in the prompt's "[Source i: ...]" headers."""
+    source = chunk.get('metadata', {}).get('source', 'Tax Document')
+    section = chunk.get('metadata', {}).get('section')
+    if section:
+        # Section-aligned chunks (see utils/chunker.py) carry their section label
+        source = f"{source}, {section}"
+    return source
+
+
+def trim_context(context_chunks: list, labels: list) -> str:
+    """Context from the start of each chunk, within MAX_CONTEXT_CHARS (used when sentence packing is off or fails)."""
     context_with_sources = []
     total_context_chars = 0
-    max_context_chars = 10000  # Increased limit (~2500 tokens)
     chunks_included = 0
     
     # Calculate how much space each chunk gets
-    space_per_chunk = max_context_chars // min(len(context_chunks), 6)
+    space_per_chunk = MAX_CONTEXT_CHARS // min(len(context_chunks), 6)
     
-    for i, chunk in enumerate(context_chunks, 1):
-        source = chunk.get('metadata', {}).get('source', 'Tax Document')
+    for i, (chunk, source) in enumerate(zip(context_chunks, labels), 1):
         text = chunk.get('text', '')
         
-        # Trim chunk to fit available space, keeping most relevant content
+        # Trim chunk to fit available space
         if len(text) > space_per_chunk:
-            # Keep first 80% of available space (most relevant usually at start)
+            # Keep first 80% of available space
             trim_length = int(space_per_chunk * 0.8)
             text = text[:trim_length] + "..."
         
         chunk_entry = f"[Source {i}: {source}]\n{text}"
         
         # Check if we can fit this chunk
-        if total_context_chars + len(chunk_entry) > max_context_chars:
+        if total_context_chars + len(chunk_entry) > MAX_CONTEXT_CHARS:
             # Try to fit a smaller version
-            remaining_space = max_context_chars - total_context_chars
+            remaining_space = MAX_CONTEXT_CHARS - total_context_chars
             if remaining_space > 500:  # Only add if meaningful space
                 text = text[:remaining_space - 100] + "..."
                 chunk_entry = f"[Source {i}: {source}]\n{text}"
@@ -637,8 +929,49 @@ def answer_with_llm(query: str, context_chunks: list):
         total_context_chars += len(chunk_entry)
         chunks_included += 1
     
-    context_text = "\n\n".join(context_with_sources)
     print(f"[context] Total context: {total_context_chars} chars (~{total_context_chars//4} tokens)")
+    return "\n\n".join(context_with_sources)
+
+
+def build_llm_request(query: str, context_chunks: list, deadline: Deadline = None) -> dict:
+    """
+    Context, prompts and generation budget for answering query from
+    context_chunks: {'system_prompt', 'user_prompt', 'required_tokens',
+    'intent', 'confidence_level'}. Sentence packing is skipped (and cut
+    short) when the deadline leaves too little time for it.
+    """
+    
+    # Check chunk quality: warn if chunks are too short (may indicate poor retrieval)
+    avg_chunk_length = sum(len(c.get('text', '')) for c in context_chunks) / len(context_chunks)
+    if avg_chunk_length < 100:
+        print(f"[warning] Retrieved chunks seem short (avg {avg_chunk_length:.0f} chars)")
+    
+    # Classify query intent
+    intent = classify_query_intent(query)
+    query_lower = query.lower()
+    
+    # Build context with source tracking
+    labels = [chunk_source_label(chunk) for chunk in context_chunks]
+    context_text = None
+    if CONTEXT_PACKING and deadline is not None and deadline.remaining() < CONTEXT_PACKING_MIN_SECONDS:
+        print(f"[context] {deadline.remaining():.1f}s left, trimming chunks instead of packing sentences")
+    elif CONTEXT_PACKING:
+        try:
+            expanded_query = expand_query(query)
+            packed = CONTEXT_PACKER.pack(
+                embed_query(expanded_query), tokenize(expanded_query), context_chunks, labels, CONTEXT_TOKEN_BUDGET,
+                deadline=deadline,
+            )
+            context_text = packed['text'] or None
+            print(f"[context] Packed {packed['sentences']}/{packed['total_sentences']} sentences from "
+                  f"{packed['chunks']}/{len(context_chunks)} chunks: {packed['tokens']} tokens "
+                  f"(budget {CONTEXT_TOKEN_BUDGET})")
+        except DeadlineExceeded:
+            print("[context] Deadline reached while packing sentences, trimming chunks instead")
+        except Exception as e:
+            print(f"[context] Sentence packing failed ({e}), trimming chunks instead")
+    if context_text is None:
+        context_text = trim_context(context_chunks, labels)
     
     # Calculate dynamic token allocation based on query complexity
     def calculate_tokens_needed(query: str, intent: dict, context_length: int) -> int:
@@ -695,8 +1028,10 @@ def answer_with_llm(query: str, context_chunks: list):
     # Calculate confidence FIRST (needed for token allocation)
     confidence_score, confidence_level = calculate_confidence(context_chunks)
     
-    # Calculate required tokens for this query
-    base_required = calculate_tokens_needed(query, intent, len(context_text))
+    # Calculate required tokens for this query; sized by how much was retrieved
+    # (as much as trim_context would send), not by what packing kept of it
+    retrieved_chars = sum(len(chunk.get('text', '')) for chunk in context_chunks)
+    base_required = calculate_tokens_needed(query, intent, min(retrieved_chars, MAX_CONTEXT_CHARS))
     
     # Boost token allocation based on confidence level
     # HIGH confidence = good retrieval, likely needs detailed answer
@@ -787,105 +1122,243 @@ TASK: {response_instruction}
 
 Answer the question completely using the information above. Structure your response clearly and include all relevant details."""
 
-    # Try Ollama first (local, fast, free)
-    try:
-        import ollama
-        import signal
-        
-        # Check if we should disable signal-based timeouts (e.g., when running in Flask)
-        # Also disable on Windows where signal.SIGALRM is not available
-        use_signal_timeout = (os.environ.get('DISABLE_SIGNAL_TIMEOUT') != '1' and 
-                             platform.system() != 'Windows')
-        
-        # Timeout handler to prevent hanging (Unix/macOS only)
-        class TimeoutError(Exception):
-            pass
-        
-        def timeout_handler(signum, frame):
-            raise TimeoutError("LLM request timed out")
-        
-        # Try llama3.2 first (installed and fast), then phi3
-        # llama3.2 is better for detailed tax responses
-        models_to_try = ['llama3.2', 'phi3']
-        max_retries = 2  # Limit retries per model to prevent infinite loops
-        
-        for model in models_to_try:
-            retry_count = 0
-            while retry_count < max_retries:
-                try:
-                    # Set 60 second timeout for LLM calls (reduced from 90s for faster failure)
-                    # Signal timeouts only available on Unix/macOS, not Windows
-                    if use_signal_timeout:
-                        signal.signal(signal.SIGALRM, timeout_handler)
-                        signal.alarm(60)
-                    
-                    response = ollama.chat(
-                        model=model,
-                        messages=[
-                            {'role': 'system', 'content': system_prompt},
-                            {'role': 'user', 'content': user_prompt}
-                        ],
-                        options={
-                            'temperature': 0.1,  # Slightly higher for more fluent responses
-                            'top_p': 0.95,
-                            'top_k': 50,
-                            'num_predict': required_tokens,  # Dynamic token allocation
-                            'repeat_penalty': 1.15,
-                            'num_ctx': 4096,  # Larger context window for more complete answers
-                            'stop': [],  # Don't stop early
-                        }
-                    )
-                    
-                    # Cancel timeout on success (only if it was set)
-                    if use_signal_timeout:
-                        signal.alarm(0)
-                    
-                    answer = response['message']['content']
-                    
-                    # Validate answer quality
-                    if not validate_answer_quality(answer, query, intent, required_tokens, confidence_level):
-                        retry_count += 1
-                        if retry_count < max_retries:
-                            print(f"[llm] Answer quality check failed, retry {retry_count}/{max_retries}...")
-                            # Retry with more tokens if answer was too short
-                            if len(answer) < 250:
-                                required_tokens = min(int(required_tokens * 1.5), 2000)
-                            continue
-                        else:
-                            print(f"[llm] Max retries reached, using best available answer")
-                            # Use the answer anyway if we've exhausted retries
-                            pass
-                    
-                    # Add source citations
-                    answer_with_sources = add_source_citations(answer, context_chunks)
-                    return post_process_answer(answer_with_sources, intent, query)
-                    
-                except TimeoutError:
-                    if use_signal_timeout:
-                        signal.alarm(0)  # Cancel timeout
-                    print(f"[llm] Model {model} timed out, trying next...")
-                    break  # Break inner loop, go to next model
-                except Exception as model_error:
-                    if use_signal_timeout:
-                        signal.alarm(0)  # Cancel timeout
-                    print(f"[llm] Model {model} failed: {str(model_error)[:50]}")
+    return {
+        'system_prompt': system_prompt,
+        'user_prompt': user_prompt,
+        'required_tokens': required_tokens,
+        'intent': intent,
+        'confidence_level': confidence_level,
+    }
+
+
+def ollama_options(required_tokens: int) -> dict:
+    """Generation options shared by every Ollama call."""
+    return {
+        'temperature': 0.1,  # Slightly higher for more fluent responses
+        'top_p': 0.95,
+        'top_k': 50,
+        'num_predict': required_tokens,  # Dynamic token allocation
+        'repeat_penalty': 1.15,
+        'num_ctx': 4096,  # Larger context window for more complete answers
+        'stop': [],  # Don't stop early
+    }
+
+
+def answer_with_llm(query: str, context_chunks: list, deadline: Deadline = None):
+    """Generate answer using local Ollama LLM or fallback to Hugging Face."""
+    return generate_answer(query, context_chunks, deadline)[0]
+
+
+def generate_answer(query: str, context_chunks: list, deadline: Deadline = None) -> tuple:
+    """
+    answer_with_llm, plus where the answer came from: (answer, origin) with
+    origin 'precheck', 'ollama', 'huggingface', 'context' (retrieved text
+    shown because no LLM was available) or 'deadline' (retrieved text shown
+    because the deadline ran out; default REQUEST_TIMEOUT from now).
+    """
+    if deadline is None:
+        deadline = Deadline(REQUEST_TIMEOUT)
+    early_answer = precheck_answer(query, context_chunks)
+    if early_answer is not None:
+        return early_answer, 'precheck'
+
+    request = build_llm_request(query, context_chunks, deadline)
+    system_prompt, user_prompt = request['system_prompt'], request['user_prompt']
+    required_tokens, intent = request['required_tokens'], request['intent']
+    confidence_level = request['confidence_level']
+
+    if LLM_HEDGE and len(OLLAMA_MODELS) > 1:
+        result = generate_hedged_answer(query, context_chunks, request, deadline)
+        if result is not None:
+            return result
+        return answer_with_hosted_llm(query, context_chunks, request, deadline)
+
+    # Try Ollama first (local, fast, free). Every attempt gets only what is
+    # left of the deadline, so retries and the second model cannot overrun it
+    client = get_llm_client()
+    max_retries = 2  # Limit retries per model to prevent infinite loops
+
+    for model in OLLAMA_MODELS:
+        retry_count = 0
+        while retry_count < max_retries:
+            if deadline.expired():
+                print(f"[llm] Deadline reached after {deadline.elapsed():.1f}s - showing retrieved documents")
+                return format_retrieved_context(query, context_chunks), 'deadline'
+            try:
+                response = client.chat(
+                    model=model,
+                    messages=[
+                        {'role': 'system', 'content': system_prompt},
+                        {'role': 'user', 'content': user_prompt}
+                    ],
+                    options=ollama_options(required_tokens),
+                    timeout=deadline.timeout(),
+                )
+                
+                answer = response['message']['content']
+                
+                # Validate answer quality
+                issue = answer_quality_issue(answer, query, intent, required_tokens, confidence_level)
+                if should_continue(issue, response.get('done_reason')):
+                    # Cut off: finish this answer instead of generating a new one
+                    answer = continue_answer(query, request, model, answer, deadline)
+                    issue = answer_quality_issue(answer, query, intent, required_tokens, confidence_level)
+                if issue is not None:
                     retry_count += 1
-                    if retry_count >= max_retries:
-                        break  # Try next model
-                    continue  # Retry same model
+                    if retry_count < max_retries:
+                        print(f"[llm] Answer quality check failed, retry {retry_count}/{max_retries}...")
+                        # Retry with more tokens if answer was too short
+                        if len(answer) < 250:
+                            required_tokens = min(int(required_tokens * 1.5), 2000)
+                        continue
+                    else:
+                        print(f"[llm] Max retries reached, using best available answer")
+                        # Use the answer anyway if we've exhausted retries
+                        pass
                 
-    except Exception as ollama_error:
-        print(f"[llm] Ollama unavailable: {ollama_error}")
-        pass
-    
-    # Fallback to Hugging Face if Ollama fails
+                # Add source citations
+                answer_with_sources = add_source_citations(answer, context_chunks)
+                return post_process_answer(answer_with_sources, intent, query), 'ollama'
+                
+            except LLMTimeout:
+                print(f"[llm] Model {model} cancelled at the deadline ({deadline.elapsed():.1f}s)")
+                break
+            except Exception as model_error:
+                print(f"[llm] Model {model} failed: {str(model_error)[:50]}")
+                retry_count += 1
+                if retry_count >= max_retries:
+                    break  # Try next model
+                continue  # Retry same model
+
+    return answer_with_hosted_llm(query, context_chunks, request, deadline)
+
+
+def generate_hedged_answer(query: str, context_chunks: list, request: dict, deadline: Deadline):
+    """
+    generate_answer's Ollama step in hedging mode (LLM_HEDGE): the models in
+    OLLAMA_MODELS race for an answer that passes validate_answer_quality
+    (see OllamaClient.ahedged_chat). If none passes, the race is run once
+    more with a larger token budget for short answers, as in the sequential
+    mode. Returns (answer, origin), or None if no model answered at all.
+    """
+    client = get_llm_client()
+    required_tokens, intent = request['required_tokens'], request['intent']
+    confidence_level = request['confidence_level']
+    messages = [
+        {'role': 'system', 'content': request['system_prompt']},
+        {'role': 'user', 'content': request['user_prompt']},
+    ]
+    max_retries = 2
+
+    for retry_count in range(max_retries):
+        if deadline.expired():
+            print(f"[llm] Deadline reached after {deadline.elapsed():.1f}s - showing retrieved documents")
+            return format_retrieved_context(query, context_chunks), 'deadline'
+        tokens = required_tokens
+        try:
+            answer, model, accepted = client.hedged_chat(
+                OLLAMA_MODELS,
+                messages,
+                options=ollama_options(tokens),
+                accept=lambda text: validate_answer_quality(text, query, intent, tokens, confidence_level),
+                timeout=deadline.timeout(),
+            )
+        except LLMTimeout:
+            print(f"[llm] Hedged request cancelled at the deadline ({deadline.elapsed():.1f}s)")
+            return format_retrieved_context(query, context_chunks), 'deadline'
+        except Exception as e:
+            print(f"[llm] No Ollama model answered: {str(e)[:80]}")
+            return None
+
+        if not accepted and should_continue(
+            answer_quality_issue(answer, query, intent, tokens, confidence_level)
+        ):
+            answer = continue_answer(query, request, model, answer, deadline)
+            accepted = validate_answer_quality(answer, query, intent, tokens, confidence_level)
+        if not accepted and retry_count + 1 < max_retries:
+            print(f"[llm] Answer quality check failed, retry {retry_count + 1}/{max_retries}...")
+            if len(answer) < 250:
+                required_tokens = min(int(required_tokens * 1.5), 2000)
+            continue
+        if not accepted:
+            print(f"[llm] Max retries reached, using best available answer")
+        answer_with_sources = add_source_citations(answer, context_chunks)
+        return post_process_answer(answer_with_sources, intent, query), 'ollama'
+
+
+def should_continue(issue, done_reason: str = None) -> bool:
+    """A rejected answer worth continuing: cut off mid-sentence, or stopped by the token limit."""
+    return LLM_CONTINUATION and issue is not None and (issue in CONTINUABLE_ISSUES or done_reason == 'length')
+
+
+def continue_answer(query: str, request: dict, model: str, answer: str, deadline: Deadline) -> str:
+    """
+    Finish an answer that stopped too early instead of generating a new one.
+    The partial answer is sent back as the start of the assistant's reply,
+    which Ollama continues rather than answering afresh, with a budget of
+    CONTINUATION_TOKENS; repeated (up to MAX_CONTINUATIONS times) while the
+    answer still looks cut off. Everything before the partial answer is the
+    same prompt as before, so with the model kept loaded Ollama's prompt
+    cache spares re-processing it. Returns the answer with whatever was
+    added; the original text is always kept as its prefix.
+    """
+    client = get_llm_client()
+    messages = [
+        {'role': 'system', 'content': request['system_prompt']},
+        {'role': 'user', 'content': request['user_prompt']},
+    ]
+    for round_no in range(1, MAX_CONTINUATIONS + 1):
+        if deadline.expired():
+            break
+        try:
+            response = client.chat(
+                model=model,
+                messages=messages + [{'role': 'assistant', 'content': answer}],
+                options=ollama_options(CONTINUATION_TOKENS),
+                timeout=deadline.timeout(),
+            )
+        except Exception as e:
+            print(f"[llm] Continuation with {model} failed: {str(e)[:50]}")
+            break
+        more = response['message']['content']
+        if not more.strip():
+            break
+        if more.lstrip()[:40] == answer.lstrip()[:40]:
+            # The model's template does not continue assistant messages; it started over
+            print(f"[llm] {model} restarted the answer instead of continuing it")
+            break
+        answer += more
+        print(f"[llm] Continued answer by {len(more)} chars (round {round_no}/{MAX_CONTINUATIONS})")
+        issue = answer_quality_issue(
+            answer, query, request['intent'], request['required_tokens'], request['confidence_level']
+        )
+        if not should_continue(issue, response.get('done_reason')):
+            break
+    return answer
+
+
+def answer_with_hosted_llm(query: str, context_chunks: list, request: dict, deadline: Deadline = None) -> tuple:
+    """
+    Fallback when Ollama is unavailable: Hugging Face Inference API, else the
+    raw context. Returns (answer, origin) like generate_answer.
+    """
+    if deadline is None:
+        deadline = Deadline(REQUEST_TIMEOUT)
+    if deadline.expired():
+        print(f"[llm] Deadline reached after {deadline.elapsed():.1f}s - showing retrieved documents")
+        return format_retrieved_context(query, context_chunks), 'deadline'
+
+    system_prompt, user_prompt = request['system_prompt'], request['user_prompt']
+    required_tokens, intent = request['required_tokens'], request['intent']
+    confidence_level = request['confidence_level']
+
     if not os.getenv('HF_TOKEN'):
         print("[llm] No HF_TOKEN found - showing retrieved context instead")
-        return format_retrieved_context(query, context_chunks)
+        return format_retrieved_context(query, context_chunks), 'context'
     
     try:
         from huggingface_hub import InferenceClient
-        client = InferenceClient(token=os.getenv('HF_TOKEN'))
+        client = InferenceClient(token=os.getenv('HF_TOKEN'), timeout=deadline.timeout())
         
         # Try multiple models in order of preference
         models = [
@@ -900,6 +1373,10 @@ Answer the question completely using the information above. Structure your respo
         hf_tokens = min(int(required_tokens * 1.2), 2000)
         
         for model in models:
+            if deadline.expired():
+                print(f"[llm] Deadline reached after {deadline.elapsed():.1f}s - showing retrieved documents")
+                return format_retrieved_context(query, context_chunks), 'deadline'
+            client.timeout = deadline.timeout()
             try:
                 messages = [{"role": "user", "content": combined_prompt}]
                 
@@ -919,18 +1396,18 @@ Answer the question completely using the information above. Structure your respo
                 
                 # Add source citations
                 answer_with_sources = add_source_citations(answer, context_chunks)
-                return post_process_answer(answer_with_sources, intent, query)
+                return post_process_answer(answer_with_sources, intent, query), 'huggingface'
                 
             except Exception:
                 continue
         
         # If all models fail, return formatted context
         print("[llm] All API models unavailable - showing retrieved documents")
-        return format_retrieved_context(query, context_chunks)
+        return format_retrieved_context(query, context_chunks), 'context'
         
     except Exception:
         print(f"[llm] API error - showing retrieved documents")
-        return format_retrieved_context(query, context_chunks)
+        return format_retrieved_context(query, context_chunks), 'context'
 
 
 def validate_answer_quality(answer: str, query: str, intent: dict, allocated_tokens: int, confidence: str) -> bool:
@@ -938,6 +1415,16 @@ def validate_answer_quality(answer: str, query: str, intent: dict, allocated_tok
     Validate if answer is complete and useful based on query needs, not just length.
     Returns True if answer passes quality checks, False if should regenerate.
     """
+    return answer_quality_issue(answer, query, intent, allocated_tokens, confidence) is None
+
+
+def answer_quality_issue(answer: str, query: str, intent: dict, allocated_tokens: int, confidence: str):
+    """
+    The checks behind validate_answer_quality. Returns None if the answer
+    passes, else why it failed: 'cautious', 'truncated', 'incomplete',
+    'comparison', 'too_short' or 'filler'. 'truncated' and 'incomplete'
+    answers can be finished by continuing them (CONTINUABLE_ISSUES).
+    """
     query_lower = query.lower()
     answer_lower = answer.lower()
     
@@ -963,7 +1450,7 @@ def validate_answer_quality(answer: str, query: str, intent: dict, allocated_tok
         # For MEDIUM/HIGH, allow cautious phrases if there's actual content
         if not has_substance and confidence == "LOW":
             print(f"[quality] FAIL: Overly cautious without substantive information")
-            return False
+            return 'cautious'
         elif not has_substance:
             # MEDIUM/HIGH confidence but no substance - warn but don't retry
             print(f"[quality] WARN: Cautious phrasing but has {confidence} confidence")
@@ -983,7 +1470,7 @@ def validate_answer_quality(answer: str, query: str, intent: dict, allocated_tok
         
         if any(pattern in answer_end.lower() for pattern in incomplete_patterns):
             print(f"[quality] FAIL: Answer appears truncated (ends: '{answer_end[-30:]}')")
-            return False
+            return 'truncated'
         
         if last_char not in '.!?':
             # Check if truly incomplete (ends with connector words or prepositions)
@@ -991,7 +1478,7 @@ def validate_answer_quality(answer: str, query: str, intent: dict, allocated_tok
             incomplete_endings = ['the', 'a', 'an', 'is', 'are', 'was', 'were', 'and', 'or', 'but', 'for', 'with', 'under', 'to', 'of', 'in', 'on', 'at', 'by', 'from']
             if any(word.lower() in incomplete_endings for word in last_words):
                 print(f"[quality] FAIL: Incomplete sentence (ends with: '{' '.join(last_words)}')")
-                return False
+                return 'incomplete'
     
     # Check 3: For comparison queries, ensure both items mentioned
     comparison_keywords = [' vs ', ' versus ', 'difference between', 'compare', 'better']
@@ -1005,7 +1492,7 @@ def validate_answer_quality(answer: str, query: str, intent: dict, allocated_tok
                 items_in_answer = sum(1 for item in comparison_items[:2] if item in answer.upper())
                 if items_in_answer < 2:
                     print(f"[quality] FAIL: Comparison query but only mentions {items_in_answer}/2 items")
-                    return False
+                    return 'comparison'
     
     # Check 4: Severe token/output mismatch (allocated lots but got almost nothing)
     # This catches cases where LLM failed but didn't error
@@ -1013,7 +1500,7 @@ def validate_answer_quality(answer: str, query: str, intent: dict, allocated_tok
         # Unless it's a simple yes/no or number-only query
         if not intent.get('wants_brief') and not intent.get('wants_number_only'):
             print(f"[quality] FAIL: Allocated {allocated_tokens} tokens but only got {len(answer)} chars")
-            return False
+            return 'too_short'
     
     # Check 5: Answer is just "Based on..." or "According to..." without actual answer
     filler_starts = ['based on the provided', 'according to the text', 'the provided information']
@@ -1021,10 +1508,10 @@ def validate_answer_quality(answer: str, query: str, intent: dict, allocated_tok
         # If it starts with filler but has no substance after, fail
         if len(answer) < 100:
             print(f"[quality] FAIL: Starts with filler phrase but no actual content")
-            return False
+            return 'filler'
     
     print(f"[quality] PASS: {len(answer)} chars, {len(answer.split())} words")
-    return True
+    return None
 
 
 def add_source_citations(answer: str, context_chunks: list) -> str:
@@ -1088,37 +1575,245 @@ def format_retrieved_context(query: str, context_chunks: list) -> str:
 
 def query_rag(query: str, top_k=8):  # Increased from 5 to 8 for better coverage
     """Main entry for querying the RAG system."""
-    
+    return query_rag_with_meta(query, top_k=top_k)['answer']
+
+
+def retrieve_chunks(query: str, top_k=8, deadline: Deadline = None) -> dict:
+    """
+    Route the query, search the routed indexes and diversify the results.
+    Returns {'chunks', 'index_versions', 'query_vec'} with chunks as
+    {'id', 'text', 'metadata', 'score'} dicts, best first, and the version
+    of every index searched. Raises DeadlineExceeded if the deadline runs
+    out before the search is done.
+    """
+    if deadline is None:
+        deadline = Deadline(REQUEST_TIMEOUT)
+
     # Step 1: Route query → which indices
     indices = route_query(query)
 
     print(f"[router] Query routed to indices → {', '.join(indices)}")
 
-    # Step 2: Get top matches from all relevant indices
-    all_matches = []
-    for index_name in indices:
-        try:
-            matches = search_vectors(query, index_name, top_k=top_k)
-            all_matches.extend(matches)
-        except FileNotFoundError:
-            print(f"[warning] Index {index_name} not found, skipping")
-    
-    # Sort all matches by score and take top_k
-    all_matches.sort(reverse=True, key=lambda x: x[0])
-    top_matches = all_matches[:top_k]
+    # Step 2: Get one global top_k across all relevant indices
+    deadline.check('index loading')
+    indexes = resolve_indexes(indices)
+    index_versions = {name: index.version for name, index in indexes}
+    deadline.check('query embedding')
+    prepared = prepare_query(query)
+    deadline.check('search')
+    if MMR_ENABLED:
+        candidates = search_indexes(
+            query, indices, top_k=top_k * MMR_POOL_FACTOR, indexes=indexes, prepared=prepared, deadline=deadline
+        )
+        top_matches = mmr_select(candidates, top_k, MMR_LAMBDA, MMR_DUPLICATE_THRESHOLD)
+        print(f"[search] MMR picked {len(top_matches)} of {len(candidates)} candidates")
+    else:
+        top_matches = search_indexes(
+            query, indices, top_k=top_k, indexes=indexes, prepared=prepared, deadline=deadline
+        )
     
     # Log similarity scores for debugging
     if top_matches:
         print(f"[search] Top similarity scores: {[f'{m[0]:.3f}' for m in top_matches[:3]]}")
     
     # Keep both chunks and their scores for confidence calculation
-    chunks = [{'text': m[1].get('text', ''), 'metadata': m[1].get('metadata', {}), 'score': m[0]} for m in top_matches]
+    chunks = [
+        {'id': m[1].get('id', ''), 'text': m[1].get('text', ''), 'metadata': m[1].get('metadata', {}), 'score': m[0]}
+        for m in top_matches
+    ]
     print(f"[search] Retrieved {len(chunks)} chunks from {len(indices)} indices")
+    return {'chunks': chunks, 'index_versions': index_versions, 'query_vec': prepared[0]}
+
+
+def cached_answer(query: str, retrieved: dict):
+    """Answer cached for an equivalent earlier query (see ANSWER_CACHE), or None."""
+    if not retrieved['chunks']:
+        return None
+    entry = ANSWER_CACHE.get(
+        retrieved['query_vec'], [c['id'] for c in retrieved['chunks']], retrieved['index_versions']
+    )
+    if entry is None:
+        return None
+    print(f"[cache] Answer cache hit: '{query}' ≈ '{entry.query}'")
+    return entry.answer
+
+
+def cache_answer(query: str, retrieved: dict, answer: str, origin: str) -> None:
+    if origin in CACHEABLE_ORIGINS and retrieved['chunks']:
+        ANSWER_CACHE.put(
+            query, retrieved['query_vec'], [c['id'] for c in retrieved['chunks']],
+            retrieved['index_versions'], answer,
+        )
+
+
+def query_rag_with_meta(query: str, top_k=8, deadline: Deadline = None) -> dict:
+    """
+    query_rag plus the version of each index that answered, whether the
+    answer came from the answer cache and whether the deadline (default
+    REQUEST_TIMEOUT from now) ran out, in which case the answer is the
+    retrieved text, or DEADLINE_ANSWER if retrieval did not finish either:
+    {'answer': str, 'index_versions': {index_name: version}, 'cached': bool, 'timed_out': bool}
+    """
+    if deadline is None:
+        deadline = Deadline(REQUEST_TIMEOUT)
+    try:
+        retrieved = retrieve_chunks(query, top_k, deadline)
+    except DeadlineExceeded as e:
+        print(f"[search] {e}")
+        return {'answer': DEADLINE_ANSWER, 'index_versions': {}, 'cached': False, 'timed_out': True}
+    index_versions = retrieved['index_versions']
+
+    answer = cached_answer(query, retrieved)
+    if answer is not None:
+        return {'answer': answer, 'index_versions': index_versions, 'cached': True, 'timed_out': False}
 
     # Step 3: Generate LLM answer using retrieved context
-    answer = answer_with_llm(query, chunks)
+    answer, origin = generate_answer(query, retrieved['chunks'], deadline)
+    cache_answer(query, retrieved, answer, origin)
 
-    return answer
+    return {'answer': answer, 'index_versions': index_versions, 'cached': False, 'timed_out': origin == 'deadline'}
+
+
+def stream_ollama_answer(request: dict, deadline: Deadline = None):
+    """
+    Yield answer text from Ollama's streaming chat API as it is generated.
+    Models are tried in order until one starts producing text; once text
+    has been yielded there is no fallback. Yields nothing if Ollama is
+    unavailable. Raises LLMTimeout (the generation is cancelled) when the
+    deadline runs out, possibly after some text. Sets request['model'] to
+    the model that produced the text.
+    """
+    if deadline is None:
+        deadline = Deadline(REQUEST_TIMEOUT)
+    client = get_llm_client()
+    messages = [
+        {'role': 'system', 'content': request['system_prompt']},
+        {'role': 'user', 'content': request['user_prompt']},
+    ]
+    for model in OLLAMA_MODELS:
+        produced = False
+        try:
+            for text in client.chat_stream(
+                model, messages, options=ollama_options(request['required_tokens']), timeout=deadline.timeout()
+            ):
+                if not produced:
+                    request['model'] = model
+                produced = True
+                yield text
+            if produced:
+                return
+            print(f"[llm] Model {model} returned an empty answer, trying next...")
+        except LLMTimeout:
+            raise
+        except Exception as model_error:
+            if produced:
+                print(f"[llm] Stream from {model} broke off: {str(model_error)[:50]}")
+                return
+            print(f"[llm] Model {model} failed: {str(model_error)[:50]}")
+
+
+def query_rag_stream(query: str, top_k=8, deadline: Deadline = None):
+    """
+    Streaming variant of query_rag_with_meta. Yields events:
+
+        {'type': 'sources', 'sources': [...], 'index_versions': {...}}
+            once, as soon as retrieval is done
+        {'type': 'token', 'chunk': str, 'done': False}
+            answer text as the LLM produces it
+        {'type': 'answer', 'answer': str, 'index_versions': {...}, 'cached': bool,
+         'timed_out': bool, 'done': True, 'complete': bool}
+            the final answer, post-processed and with citations; it replaces
+            the streamed text when post-processing changed it. A cached
+            answer arrives as a single token. timed_out: the deadline (default
+            REQUEST_TIMEOUT from now) ran out; complete is False if that cut
+            the streamed answer short
+    """
+    start = time.perf_counter()
+    if deadline is None:
+        deadline = Deadline(REQUEST_TIMEOUT)
+    try:
+        retrieved = retrieve_chunks(query, top_k, deadline)
+    except DeadlineExceeded as e:
+        print(f"[search] {e}")
+        yield {'type': 'sources', 'sources': [], 'index_versions': {}}
+        yield {'type': 'token', 'chunk': DEADLINE_ANSWER, 'done': False}
+        yield {
+            'type': 'answer', 'answer': DEADLINE_ANSWER, 'index_versions': {}, 'cached': False,
+            'timed_out': True, 'done': True, 'complete': True,
+        }
+        return
+    chunks, index_versions = retrieved['chunks'], retrieved['index_versions']
+    yield {
+        'type': 'sources',
+        'sources': [
+            {
+                'source': c['metadata'].get('source', ''),
+                'section': c['metadata'].get('section', ''),
+                'score': round(float(c['score']), 4),
+            }
+            for c in chunks
+        ],
+        'index_versions': index_versions,
+    }
+
+    cached = timed_out = False
+    complete = True
+    final_answer = cached_answer(query, retrieved)
+    if final_answer is not None:
+        cached = True
+        yield {'type': 'token', 'chunk': final_answer, 'done': False}
+    else:
+        final_answer = precheck_answer(query, chunks)
+        if final_answer is None:
+            request = build_llm_request(query, chunks, deadline)
+            streamed = []
+            try:
+                for text in stream_ollama_answer(request, deadline):
+                    if not streamed:
+                        print(f"[llm] First token after {time.perf_counter() - start:.2f}s")
+                    streamed.append(text)
+                    yield {'type': 'token', 'chunk': text, 'done': False}
+            except LLMTimeout:
+                print(f"[llm] Stream cancelled at the deadline ({deadline.elapsed():.1f}s)")
+                timed_out = True
+
+            if streamed:
+                answer = ''.join(streamed)
+                if timed_out:
+                    # Cut short: keep what the user has already seen, but never cache it
+                    complete = False
+                    origin = 'deadline'
+                else:
+                    # Already sent, so a failed check is not retried; a cut-off
+                    # answer is finished by streaming a continuation of it
+                    issue = answer_quality_issue(
+                        answer, query, request['intent'], request['required_tokens'], request['confidence_level']
+                    )
+                    if should_continue(issue):
+                        more = continue_answer(query, request, request['model'], answer, deadline)[len(answer):]
+                        if more:
+                            answer += more
+                            yield {'type': 'token', 'chunk': more, 'done': False}
+                    origin = 'ollama'
+                final_answer = post_process_answer(add_source_citations(answer, chunks), request['intent'], query)
+            else:
+                final_answer, origin = answer_with_hosted_llm(query, chunks, request, deadline)
+                timed_out = origin == 'deadline'
+                yield {'type': 'token', 'chunk': final_answer, 'done': False}
+            cache_answer(query, retrieved, final_answer, origin)
+        else:
+            yield {'type': 'token', 'chunk': final_answer, 'done': False}
+
+    print(f"[llm] Streamed answer in {time.perf_counter() - start:.2f}s")
+    yield {
+        'type': 'answer',
+        'answer': final_answer,
+        'index_versions': index_versions,
+        'cached': cached,
+        'timed_out': timed_out,
+        'done': True,
+        'complete': complete,
+    }
 
 
 # CLI
@@ -0,0 +1,172 @@
+"""
+Approximate nearest-neighbour (ANN) index for large corpora, backed by faiss (CPU).
+
+Stored next to index.jsonl:
+
+    ann.faiss   faiss HNSW or IVF index over the normalized embeddings (inner product)
+    ann.json    kind, build parameters and chunk count
+
+Indexes smaller than FINORA_ANN_MIN_CHUNKS are always searched exactly, as
+is any index whose ANN file is missing, stale or unreadable. faiss is an
+optional dependency: without it everything falls back to exact search.
+
+Build for existing indexes with:
+    python ann_index.py [--kind hnsw|ivf] [index_name ...]
+"""
+import os
+import sys
+import json
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+ANN_FILE = "ann.faiss"
+ANN_META_FILE = "ann.json"
+
+# Below this many chunks an exhaustive scan is both exact and fast enough
+ANN_MIN_CHUNKS = int(os.environ.get("FINORA_ANN_MIN_CHUNKS", "5000"))
+# Recall/latency knobs: higher = better recall, slower queries
+ANN_EF_SEARCH = int(os.environ.get("FINORA_ANN_EF_SEARCH", "128"))
+ANN_NPROBE = int(os.environ.get("FINORA_ANN_NPROBE", "16"))
+
+
+def faiss_available() -> bool:
+    try:
+        import faiss  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def build_ann_index(
+    matrix: np.ndarray,
+    index_dir: str,
+    kind: str = "hnsw",
+    hnsw_m: int = 32,
+    ef_construction: int = 200,
+    nlist: Optional[int] = None,
+) -> bool:
+    """
+    Build and persist an ANN index over an (n, dim) matrix of normalized embeddings.
+    Returns False (and writes nothing) when faiss is not installed.
+    """
+    if kind not in ("hnsw", "ivf"):
+        raise ValueError(f"Unknown ANN index kind: {kind}")
+    try:
+        import faiss
+    except ImportError:
+        print("[ann_index] faiss not installed, skipping ANN build (exact search will be used)")
+        return False
+
+    vectors = np.ascontiguousarray(matrix, dtype=np.float32)
+    n, dim = vectors.shape
+    params = {}
+    if kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = ef_construction
+        params = {"m": hnsw_m, "ef_construction": ef_construction}
+    else:
+        # Rule of thumb: ~sqrt(n) lists, with enough points per list to train on
+        nlist = nlist or max(1, min(int(np.sqrt(n)), n // 39 or 1))
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        index.train(vectors)
+        params = {"nlist": nlist}
+    index.add(vectors)
+
+    os.makedirs(index_dir, exist_ok=True)
+    meta_file = os.path.join(index_dir, ANN_META_FILE)
+    if os.path.exists(meta_file):
+        os.remove(meta_file)
+    faiss.write_index(index, os.path.join(index_dir, ANN_FILE))
+    with open(meta_file, "w", encoding="utf-8") as f:
+        json.dump({"kind": kind, "count": n, "dim": dim, **params}, f)
+    print(f"[ann_index] Built {kind} index over {n} vectors → {index_dir}")
+    return True
+
+
+class AnnIndex:
+    """A loaded faiss index returning candidate row numbers for a query vector."""
+
+    def __init__(self, index, meta: dict):
+        self.index = index
+        self.meta = meta
+        self.kind = meta["kind"]
+        self.count = meta["count"]
+
+    def search(
+        self,
+        query_vec: np.ndarray,
+        k: int,
+        ef_search: Optional[int] = None,
+        nprobe: Optional[int] = None,
+    ) -> np.ndarray:
+        """Row numbers of (approximately) the k most similar vectors, best first."""
+        import faiss
+
+        if self.kind == "hnsw":
+            params = faiss.SearchParametersHNSW(efSearch=max(ef_search or ANN_EF_SEARCH, k))
+        else:
+            params = faiss.SearchParametersIVF(nprobe=nprobe or ANN_NPROBE)
+        query = np.ascontiguousarray(query_vec, dtype=np.float32).reshape(1, -1)
+        _, ids = self.index.search(query, k, params=params)
+        ids = ids[0]
+        return ids[ids >= 0]
+
+
+def load_ann_index(index_dir: str, expected_count: int) -> Optional[AnnIndex]:
+    """Load the ANN index of a directory, or None if absent, stale or faiss is missing."""
+    meta_file = os.path.join(index_dir, ANN_META_FILE)
+    if not os.path.exists(meta_file):
+        return None
+    try:
+        import faiss
+    except ImportError:
+        return None
+    with open(meta_file, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("count") != expected_count:
+        print(
+            f"[ann_index] Ignoring stale ANN index in {index_dir} "
+            f"({meta.get('count')} vectors, index has {expected_count})"
+        )
+        return None
+    try:
+        index = faiss.read_index(os.path.join(index_dir, ANN_FILE))
+    except Exception as e:
+        print(f"[ann_index] Could not read ANN index in {index_dir}: {e}")
+        return None
+    return AnnIndex(index, meta)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    try:
+        from .index_registry import IndexRegistry
+        from .index_versions import discard_version, fork_version, publish_version
+    except ImportError:  # run as a script from utils/
+        from index_registry import IndexRegistry
+        from index_versions import discard_version, fork_version, publish_version
+
+    args = list(argv if argv is not None else sys.argv[1:])
+    kind = "hnsw"
+    if "--kind" in args:
+        pos = args.index("--kind")
+        kind = args[pos + 1]
+        del args[pos:pos + 2]
+
+    embeddings_dir = Path(__file__).resolve().parents[2] / "embeddings"
+    registry = IndexRegistry(str(embeddings_dir))
+    names = args or registry.available()
+    for name in names:
+        loaded = registry.get(name)
+        # Built into a new version, so the live one is never rewritten under a reader
+        version, version_path = fork_version(str(embeddings_dir / name), skip=(ANN_FILE, ANN_META_FILE))
+        if build_ann_index(loaded.matrix, version_path, kind=kind):
+            publish_version(str(embeddings_dir / name), version)
+        else:
+            discard_version(str(embeddings_dir / name), version)
+
+
+if __name__ == "__main__":
+    main()
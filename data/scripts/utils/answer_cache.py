@@ -0,0 +1,248 @@
+"""
+Semantic cache of generated answers.
+
+A query is answered from the cache when an earlier query
+
+    - retrieved exactly the same chunks (same ids, same order),
+    - from the same index versions (see index_versions.py), and
+    - has a query embedding at least `threshold` cosine-similar,
+
+so paraphrases of a common question ("What is Section 80C?" / "what is sec 80C")
+skip the LLM, while anything answered from different context never does.
+Entries live in an LRU of at most `max_size` answers, expire after
+`ttl_seconds`, and are dropped as soon as an index they came from moves to
+a new version. With a `path`, the cache is saved to JSON (atomically, at most
+every `save_interval` seconds and at exit) and reloaded on start.
+"""
+import os
+import json
+import time
+import atexit
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+ChunkKey = Tuple[str, ...]
+
+
+class AnswerEntry:
+    __slots__ = ("query", "vector", "chunk_ids", "index_versions", "answer", "created_at", "hits")
+
+    def __init__(
+        self,
+        query: str,
+        vector: np.ndarray,
+        chunk_ids: ChunkKey,
+        index_versions: Dict[str, str],
+        answer: str,
+        created_at: float,
+        hits: int = 0,
+    ):
+        self.query = query
+        self.vector = vector
+        self.chunk_ids = chunk_ids
+        self.index_versions = index_versions
+        self.answer = answer
+        self.created_at = created_at
+        self.hits = hits
+
+    def to_json(self) -> Dict:
+        return {
+            "query": self.query,
+            "vector": self.vector.tolist(),
+            "chunk_ids": list(self.chunk_ids),
+            "index_versions": self.index_versions,
+            "answer": self.answer,
+            "created_at": self.created_at,
+            "hits": self.hits,
+        }
+
+    @classmethod
+    def from_json(cls, data: Dict) -> "AnswerEntry":
+        return cls(
+            data["query"],
+            _unit(data["vector"]),
+            tuple(data["chunk_ids"]),
+            dict(data["index_versions"]),
+            data["answer"],
+            float(data["created_at"]),
+            int(data.get("hits", 0)),
+        )
+
+
+def _unit(vector) -> np.ndarray:
+    vec = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(vec))
+    return vec / norm if norm > 0 else vec
+
+
+class AnswerCache:
+    """Thread-safe semantic LRU/TTL cache of answers (see the module docstring)."""
+
+    def __init__(
+        self,
+        max_size: int = 512,
+        ttl_seconds: float = 24 * 3600.0,
+        threshold: float = 0.95,
+        path: Optional[str] = None,
+        save_interval: float = 30.0,
+    ):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self.path = path
+        self.save_interval = save_interval
+        # (chunk ids, query text) → entry, least recently used first
+        self._entries: "OrderedDict[Tuple[ChunkKey, str], AnswerEntry]" = OrderedDict()
+        self._by_chunks: Dict[ChunkKey, List[Tuple[ChunkKey, str]]] = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._saved_at = time.time()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.invalidated = 0
+        self.evicted = 0
+        self._hit_seconds = 0.0
+        if path:
+            self._load()
+            atexit.register(self.save)
+
+    def _expired(self, entry: AnswerEntry, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - entry.created_at > self.ttl_seconds
+
+    def _remove(self, key: Tuple[ChunkKey, str]) -> None:
+        self._entries.pop(key, None)
+        keys = self._by_chunks.get(key[0])
+        if keys is not None:
+            keys.remove(key)
+            if not keys:
+                del self._by_chunks[key[0]]
+        self._dirty = True
+
+    def get(
+        self,
+        query_vec: Sequence[float],
+        chunk_ids: Sequence[str],
+        index_versions: Dict[str, str],
+    ) -> Optional[AnswerEntry]:
+        """Cached answer for a query that retrieved chunk_ids from index_versions, or None."""
+        start = time.perf_counter()
+        chunk_key = tuple(chunk_ids)
+        vec = _unit(query_vec)
+        now = time.time()
+        with self._lock:
+            best, best_sim = None, self.threshold
+            for key in list(self._by_chunks.get(chunk_key, ())):
+                entry = self._entries[key]
+                if self._expired(entry, now):
+                    self._remove(key)
+                    self.expired += 1
+                    continue
+                if entry.index_versions != index_versions:
+                    # Answered from an index version that is no longer served
+                    self._remove(key)
+                    self.invalidated += 1
+                    continue
+                if entry.vector.shape != vec.shape:
+                    continue
+                sim = float(entry.vector @ vec)
+                if sim >= best_sim:
+                    best, best_sim = key, sim
+            if best is None:
+                self.misses += 1
+                return None
+            entry = self._entries[best]
+            self._entries.move_to_end(best)
+            entry.hits += 1
+            self.hits += 1
+            self._hit_seconds += time.perf_counter() - start
+            return entry
+
+    def put(
+        self,
+        query: str,
+        query_vec: Sequence[float],
+        chunk_ids: Sequence[str],
+        index_versions: Dict[str, str],
+        answer: str,
+    ) -> None:
+        if self.max_size <= 0:
+            return
+        entry = AnswerEntry(query, _unit(query_vec), tuple(chunk_ids), dict(index_versions), answer, time.time())
+        key = (entry.chunk_ids, query.strip().lower())
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._by_chunks.setdefault(entry.chunk_ids, []).append(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.evicted += 1
+            self._dirty = True
+        if self.path and time.time() - self._saved_at >= self.save_interval:
+            self.save()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_chunks.clear()
+            self._dirty = True
+
+    def save(self) -> None:
+        """Write the cache to `path` (if set and changed since the last save)."""
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            data = [entry.to_json() for entry in self._entries.values()]
+            self._dirty = False
+            self._saved_at = time.time()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            now = time.time()
+            for item in data:
+                entry = AnswerEntry.from_json(item)
+                if self._expired(entry, now):
+                    continue
+                key = (entry.chunk_ids, entry.query.strip().lower())
+                self._entries[key] = entry
+                self._by_chunks.setdefault(entry.chunk_ids, []).append(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+            print(f"[answer_cache] Loaded {len(self._entries)} cached answers from {self.path}")
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[answer_cache] Ignoring unreadable answer cache {self.path}: {e}")
+            self._entries.clear()
+            self._by_chunks.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "threshold": self.threshold,
+                "persistent": bool(self.path),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "avg_hit_ms": round(self._hit_seconds / self.hits * 1000, 3) if self.hits else 0.0,
+                "expired": self.expired,
+                "invalidated": self.invalidated,
+                "evicted": self.evicted,
+            }
@@ -0,0 +1,271 @@
+"""
+Binary on-disk index format, stored next to index.jsonl:
+
+    vectors.npy   float32 (n, dim) L2-normalized embeddings, opened with mmap
+    records.bin   UTF-8 JSON records {"id", "text", "metadata"} back to back
+    offsets.npy   int64 (n, 3): byte start, byte end, text length in characters
+    bm25.npz      keyword postings (see bm25.py), so texts are not needed for scoring
+    phrase.npz    character-trigram postings for exact phrase matches (see phrase_index.py)
+    vectors.int8.npy + scales.npy / vectors.f16.npy
+                  optional quantized copies of vectors.npy for the scan (see quantize.py)
+    meta.json     count/dim/dtype; written last, so its presence marks a complete index
+
+Vectors are never parsed: the matrix is memory-mapped and shared between
+worker processes through the page cache. Chunk records are decoded one at a
+time, only when a caller asks for them.
+
+Convert existing indexes with:
+    python binary_index.py [--quantize float16|int8] [index_name ...]
+"""
+import os
+import sys
+import json
+import mmap
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+try:
+    from .bm25 import BM25Index
+    from .embedder import EMBED_DIM
+    from .phrase_index import PhraseIndex
+    from .quantize import FLOAT16_FILE, INT8_FILE, INT8_SCALES_FILE, SCAN_BLOCK_ROWS, write_quantized
+    from .vector_search import normalize_rows
+    from .index_versions import fork_version, publish_version, resolve_index_dir
+except ImportError:  # imported as a top-level module by the ingest scripts
+    from bm25 import BM25Index
+    from embedder import EMBED_DIM
+    from phrase_index import PhraseIndex
+    from quantize import FLOAT16_FILE, INT8_FILE, INT8_SCALES_FILE, SCAN_BLOCK_ROWS, write_quantized
+    from vector_search import normalize_rows
+    from index_versions import fork_version, publish_version, resolve_index_dir
+
+VECTORS_FILE = "vectors.npy"
+RECORDS_FILE = "records.bin"
+OFFSETS_FILE = "offsets.npy"
+BM25_FILE = "bm25.npz"
+PHRASE_FILE = "phrase.npz"
+META_FILE = "meta.json"
+FORMAT_VERSION = 1
+
+# Everything BinaryIndexWriter (re)writes
+BINARY_FILES = (
+    VECTORS_FILE, RECORDS_FILE, OFFSETS_FILE, BM25_FILE, PHRASE_FILE, META_FILE,
+    INT8_FILE, INT8_SCALES_FILE, FLOAT16_FILE,
+)
+
+
+def meta_path(index_dir: str) -> str:
+    return os.path.join(index_dir, META_FILE)
+
+
+def has_binary_index(index_dir: str) -> bool:
+    """True if a complete binary index exists and is not older than index.jsonl."""
+    if not os.path.exists(meta_path(index_dir)):
+        return False
+    jsonl_path = os.path.join(index_dir, "index.jsonl")
+    if not os.path.exists(jsonl_path):
+        return True
+    return os.path.getmtime(meta_path(index_dir)) >= os.path.getmtime(jsonl_path)
+
+
+class BinaryIndexWriter:
+    """
+    Append-only writer for the binary format, for indexes too large to hold
+    in memory: records stream into records.bin and normalized vectors into a
+    scratch file, and close() assembles vectors.npy, the keyword/phrase
+    postings, optional quantized copies and finally meta.json.
+    """
+
+    def __init__(self, index_dir: str, quantization: str = "none"):
+        os.makedirs(index_dir, exist_ok=True)
+        for name in (META_FILE, INT8_FILE, INT8_SCALES_FILE, FLOAT16_FILE):
+            if os.path.exists(os.path.join(index_dir, name)):
+                os.remove(os.path.join(index_dir, name))
+        self.index_dir = index_dir
+        self.quantization = quantization
+        self.count = 0
+        self.dim: Optional[int] = None
+        self._offsets: List[tuple] = []
+        self._pos = 0
+        self._records = open(os.path.join(index_dir, RECORDS_FILE), "wb")
+        self._vectors_tmp = os.path.join(index_dir, VECTORS_FILE + ".tmp")
+        self._vectors = open(self._vectors_tmp, "wb")
+
+    def add(self, records: Sequence[Dict], vectors) -> None:
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if len(records) == 0:
+            return
+        if matrix.ndim != 2 or matrix.shape[0] != len(records):
+            raise ValueError(
+                f"Expected {len(records)} vectors, got array of shape {matrix.shape}"
+            )
+        if self.dim is None:
+            self.dim = int(matrix.shape[1])
+        elif matrix.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim}-dim vectors, got {matrix.shape[1]}")
+        self._vectors.write(normalize_rows(matrix).astype(np.float32).tobytes())
+
+        for rec in records:
+            text = rec.get("text", "")
+            data = json.dumps(
+                {"id": rec.get("id"), "text": text, "metadata": rec.get("metadata", {})},
+                ensure_ascii=False,
+            ).encode("utf-8")
+            self._records.write(data)
+            self._offsets.append((self._pos, self._pos + len(data), len(text)))
+            self._pos += len(data)
+        self.count += len(records)
+
+    def close(self) -> int:
+        """Finish the index and return its chunk count."""
+        self._records.close()
+        self._vectors.close()
+        dim = self.dim or EMBED_DIM
+
+        vectors = np.lib.format.open_memmap(
+            os.path.join(self.index_dir, VECTORS_FILE), mode="w+", dtype=np.float32, shape=(self.count, dim)
+        )
+        if self.count:
+            scratch = np.memmap(self._vectors_tmp, dtype=np.float32, mode="r", shape=(self.count, dim))
+            for start in range(0, self.count, SCAN_BLOCK_ROWS):
+                vectors[start:start + SCAN_BLOCK_ROWS] = scratch[start:start + SCAN_BLOCK_ROWS]
+            del scratch
+        vectors.flush()
+        os.remove(self._vectors_tmp)
+        if self.quantization != "none":
+            write_quantized(vectors, self.index_dir, self.quantization)
+        del vectors
+
+        np.save(os.path.join(self.index_dir, OFFSETS_FILE), np.asarray(self._offsets, dtype=np.int64).reshape(-1, 3))
+        store = RecordStore(self.index_dir)
+        try:
+            texts = (store.record(i).get("text", "") for i in range(len(store)))
+            BM25Index.build(texts).save(os.path.join(self.index_dir, BM25_FILE))
+            texts = (store.record(i).get("text", "") for i in range(len(store)))
+            PhraseIndex.build(texts).save(os.path.join(self.index_dir, PHRASE_FILE))
+        finally:
+            store.close()
+
+        with open(meta_path(self.index_dir), "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "format_version": FORMAT_VERSION,
+                    "count": self.count,
+                    "dim": dim,
+                    "dtype": "float32",
+                    "normalized": True,
+                    "quantization": self.quantization,
+                },
+                f,
+            )
+        return self.count
+
+
+def write_binary_index(index_dir: str, records: Sequence[Dict], vectors, quantization: str = "none") -> None:
+    """
+    Write records (id/text/metadata dicts) and their embeddings in binary form.
+    quantization ("float16" or "int8") additionally stores a quantized copy of the vectors.
+    meta.json is removed first and rewritten last so readers never see a partial index.
+    """
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if len(records) and (matrix.ndim != 2 or matrix.shape[0] != len(records)):
+        raise ValueError(
+            f"Expected {len(records)} vectors, got array of shape {matrix.shape}"
+        )
+    writer = BinaryIndexWriter(index_dir, quantization=quantization)
+    writer.add(records, matrix)
+    writer.close()
+
+
+class RecordStore:
+    """Read-only, memory-mapped access to records.bin by row number."""
+
+    def __init__(self, index_dir: str):
+        self.offsets = np.load(os.path.join(index_dir, OFFSETS_FILE))
+        self._file = open(os.path.join(index_dir, RECORDS_FILE), "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+
+    def __len__(self) -> int:
+        return int(self.offsets.shape[0])
+
+    def record(self, i: int) -> Dict:
+        start, end, _ = self.offsets[i]
+        return json.loads(self._mm[int(start):int(end)].decode("utf-8"))
+
+    def close(self) -> None:
+        if self._mm is not None:
+            self._mm.close()
+        self._file.close()
+
+
+class LazyEntries(Sequence):
+    """List-like view over a RecordStore; each entry is decoded on access."""
+
+    def __init__(self, store: RecordStore):
+        self.store = store
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.store.record(j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self.store.record(i)
+
+
+def open_binary_index(index_dir: str):
+    """Return (mmapped embedding matrix, RecordStore, meta dict) for an index directory."""
+    with open(meta_path(index_dir), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported binary index version in {index_dir}: {meta.get('format_version')}")
+    matrix = np.load(os.path.join(index_dir, VECTORS_FILE), mmap_mode="r")
+    store = RecordStore(index_dir)
+    return matrix, store, meta
+
+
+def iter_jsonl(index_path: str) -> Iterable[Dict]:
+    with open(index_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def convert_jsonl_index(index_dir: str, quantization: str = "none") -> int:
+    """Convert <index_dir>/index.jsonl into the binary format. Returns the chunk count."""
+    entries = list(iter_jsonl(os.path.join(index_dir, "index.jsonl")))
+    write_binary_index(index_dir, entries, [e["embedding"] for e in entries], quantization=quantization)
+    return len(entries)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = list(argv if argv is not None else sys.argv[1:])
+    quantization = "none"
+    if "--quantize" in args:
+        pos = args.index("--quantize")
+        quantization = args[pos + 1]
+        del args[pos:pos + 2]
+
+    embeddings_dir = Path(__file__).resolve().parents[2] / "embeddings"
+    names = args or sorted(
+        d.name for d in embeddings_dir.iterdir()
+        if os.path.exists(os.path.join(resolve_index_dir(str(d))[0], "index.jsonl"))
+    )
+    for name in names:
+        # Converted into a new version, so the live one is never rewritten under a reader
+        index_root = str(embeddings_dir / name)
+        version, version_path = fork_version(index_root, skip=BINARY_FILES)
+        count = convert_jsonl_index(version_path, quantization=quantization)
+        publish_version(index_root, version)
+        print(f"[binary_index] Converted {name}: {count} chunks → {version_path}")
+
+
+if __name__ == "__main__":
+    main()
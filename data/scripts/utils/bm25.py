@@ -0,0 +1,110 @@
+"""
+Inverted-index BM25 for the keyword half of the hybrid score.
+
+Postings (term → documents, term frequencies), document token lengths and
+IDF are computed once per index, so a query only touches the documents that
+contain one of its terms.
+"""
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase alphanumeric tokens; keeps section numbers like '112a' or '80ccd' whole."""
+    return TOKEN_RE.findall(text.lower())
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed set of documents, with Lucene-style non-negative IDF."""
+
+    def __init__(
+        self,
+        postings: Dict[str, Tuple[np.ndarray, np.ndarray]],
+        doc_lengths: np.ndarray,
+        k1: float = 1.5,
+        b: float = 0.75,
+    ):
+        self.k1 = k1
+        self.b = b
+        self.postings = postings
+        self.doc_lengths = doc_lengths.astype(np.float32)
+        self.num_docs = int(doc_lengths.shape[0])
+        self.avg_doc_length = float(self.doc_lengths.mean()) if self.num_docs else 1.0
+
+        self.idf: Dict[str, float] = {}
+        self._weights: Dict[str, np.ndarray] = {}
+        length_norm = k1 * (1 - b + b * self.doc_lengths / max(self.avg_doc_length, 1e-9))
+        for term, (doc_ids, tfs) in postings.items():
+            df = len(doc_ids)
+            self.idf[term] = float(np.log(1 + (self.num_docs - df + 0.5) / (df + 0.5)))
+            # Term-frequency saturation per posting, precomputed once
+            self._weights[term] = tfs * (k1 + 1) / (tfs + length_norm[doc_ids])
+
+    @classmethod
+    def build(cls, texts: Iterable[str], **kwargs) -> "BM25Index":
+        term_docs: Dict[str, List[int]] = {}
+        term_tfs: Dict[str, List[int]] = {}
+        doc_lengths = []
+        for doc_id, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                term_docs.setdefault(term, []).append(doc_id)
+                term_tfs.setdefault(term, []).append(tf)
+        postings = {
+            term: (np.asarray(ids, dtype=np.int32), np.asarray(term_tfs[term], dtype=np.float32))
+            for term, ids in term_docs.items()
+        }
+        return cls(postings, np.asarray(doc_lengths, dtype=np.int32), **kwargs)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by posting and weight arrays."""
+        return int(
+            sum(ids.nbytes + tfs.nbytes for ids, tfs in self.postings.values())
+            + sum(w.nbytes for w in self._weights.values())
+            + self.doc_lengths.nbytes
+        )
+
+    def score(self, query_terms: List[str]) -> np.ndarray:
+        """BM25 score of every document; repeated query terms count repeatedly."""
+        scores = np.zeros(self.num_docs, dtype=np.float64)
+        for term, qtf in Counter(query_terms).items():
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            scores[posting[0]] += qtf * self.idf[term] * self._weights[term]
+        return scores
+
+    def save(self, path: str) -> None:
+        """Persist postings as flat arrays (no pickling) in an .npz file."""
+        terms = sorted(self.postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        for i, term in enumerate(terms):
+            offsets[i + 1] = offsets[i] + len(self.postings[term][0])
+        doc_ids = np.concatenate([self.postings[t][0] for t in terms]) if terms else np.zeros(0, np.int32)
+        tfs = np.concatenate([self.postings[t][1] for t in terms]) if terms else np.zeros(0, np.float32)
+        np.savez(
+            path,
+            terms=np.asarray(terms, dtype=str),
+            offsets=offsets,
+            doc_ids=doc_ids.astype(np.int32),
+            tfs=tfs.astype(np.float32),
+            doc_lengths=self.doc_lengths.astype(np.int32),
+        )
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> "BM25Index":
+        with np.load(path) as data:
+            terms, offsets = data["terms"], data["offsets"]
+            doc_ids, tfs = data["doc_ids"], data["tfs"]
+            postings = {
+                str(term): (doc_ids[offsets[i]:offsets[i + 1]], tfs[offsets[i]:offsets[i + 1]])
+                for i, term in enumerate(terms)
+            }
+            return cls(postings, data["doc_lengths"], **kwargs)
@@ -1,42 +1,201 @@
-from typing import List, Dict
+"""
+Structure-aware chunking.
+
+Text is split into whitespace-delimited tokens, and every chunk is a
+character span [start, end) of the source text holding at most
+`chunk_size` tokens. Chunks are cut at the strongest boundary that fits
+the budget:
+
+    1. section      chapter headings, "B.—Salaries" part headings and numbered
+                    sections such as "80C. (1)" or "2.In this Act"
+    2. sub-section  "(2)", "(3A)" ... and blank lines
+    3. sentence     ". " / "; " / ": " followed by a capital or "("
+
+and only hard-cut mid-sentence when none is available. Consecutive short
+sections share a chunk as long as they fit. A chunk that ends inside a
+section is followed by one starting `chunk_overlap` tokens earlier; a chunk
+ending on a section boundary is not, so sections never bleed into each
+other's chunks.
+"""
+import re
+from bisect import bisect_left
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+_TOKEN_RE = re.compile(r"\S+")
+
+_SECTION_RE = re.compile(
+    r"(?<!\S)(?:"
+    r"(?P<chapter>CHAPTER\s*[IVXLC]+(?:-[A-Z])?)"
+    r"|(?P<part>[A-Z])\.—"
+    r"|(?P<section>\d{1,3}[A-Z]{0,3})\.\s*(?=\(1\)|[A-Z“\"])"
+    r")"
+)
+_SUBSECTION_RE = re.compile(r"(?<!\S)\(\d{1,3}[A-Z]{0,2}\)|\n\s*\n\s*(?=\S)")
+_SENTENCE_RE = re.compile(r"(?<=[.;:])\s+(?=[A-Z(“\"])")
+
+# Tokens read past a chunk's budget before it is cut, so a boundary pattern
+# is never split across two pieces of a stream
+_LOOKAHEAD_TOKENS = 16
+
+
+class ChunkSpan(NamedTuple):
+    start: int  # character offsets into the source text
+    end: int
+    section: str  # section the chunk starts in, e.g. "Section 80C" ("" before the first one)
+
+
+def _section_label(match: "re.Match") -> str:
+    if match.group("chapter"):
+        return "Chapter " + re.sub(r"^CHAPTER\s*", "", match.group("chapter"))
+    if match.group("part"):
+        return f"Part {match.group('part')}"
+    return f"Section {match.group('section')}"
+
+
+class _SpanBuilder:
+    """Finds chunk spans over a text that arrives piece by piece."""
+
+    def __init__(self, chunk_size: int, chunk_overlap: int):
+        self.chunk_size = max(chunk_size, 1)
+        self.chunk_overlap = min(max(chunk_overlap, 0), self.chunk_size - 1)
+        self.buf = ""
+        self.base = 0  # offset of buf[0] in the full text
+        self.pos = 0  # start of the next chunk in the full text
+        self.section = ""
+        self.started = False
+
+    def feed(self, text: str) -> None:
+        if self.started:
+            self.buf += "\n"
+        self.buf += text
+        self.started = True
+
+    def take(self, final: bool) -> Iterator[Tuple[ChunkSpan, str]]:
+        while True:
+            result = self._next(final)
+            if result is None:
+                return
+            yield result
+
+    def _next(self, final: bool) -> Optional[Tuple[ChunkSpan, str]]:
+        buf, base = self.buf, self.base
+        # Only the next chunk_size tokens plus the look-ahead matter for this chunk
+        window = self.chunk_size + _LOOKAHEAD_TOKENS
+        tokens: List[Tuple[int, int]] = []
+        for m in _TOKEN_RE.finditer(buf, self.pos - base):
+            tokens.append((m.start(), m.end()))
+            if len(tokens) >= window:
+                break
+        if not tokens or (not final and len(tokens) < window):
+            return None
+        starts = [s for s, _ in tokens]
+
+        sections: Dict[int, str] = {}
+        for m in _SECTION_RE.finditer(buf, starts[0], tokens[-1][1]):
+            sections.setdefault(bisect_left(starts, m.start()), _section_label(m))
+        label = sections.get(0, self.section)
+
+        if self.chunk_size >= len(tokens):
+            end_tok, clean = len(tokens), True
+        else:
+            end_tok, clean = self._cut(buf, starts, sections, self.chunk_size)
+        next_tok = end_tok if clean else max(end_tok - self.chunk_overlap, 1)
+
+        span = ChunkSpan(base + starts[0], base + tokens[end_tok - 1][1], label)
+        text = buf[starts[0]:tokens[end_tok - 1][1]]
+
+        self.section = label
+        for tok in sorted(t for t in sections if 0 < t <= next_tok):
+            self.section = sections[tok]
+        self.pos = base + (starts[next_tok] if next_tok < len(tokens) else tokens[-1][1])
+
+        # Drop consumed text now and then; a few characters of context stay
+        # for the look-behind patterns
+        keep = max(self.pos - base - 8, 0)
+        if keep > len(buf) // 2:
+            self.buf = buf[keep:]
+            self.base = base + keep
+        return span, text
+
+    def _cut(self, buf: str, starts: List[int], sections: Dict[int, str], limit: int) -> Tuple[int, bool]:
+        """Token index the chunk ends before, and whether that is a section boundary."""
+        section_toks = [t for t in sections if 0 < t <= limit]
+        if section_toks:
+            return max(section_toks), True
+
+        lo, hi = starts[0], starts[limit]
+        for pattern, min_len in ((_SUBSECTION_RE, self.chunk_size // 4), (_SENTENCE_RE, self.chunk_size // 2)):
+            toks = [
+                bisect_left(starts, m.end() if pattern is _SENTENCE_RE else m.start())
+                for m in pattern.finditer(buf, lo, hi + 1)
+            ]
+            toks = [t for t in toks if max(min_len, 1) <= t <= limit]
+            if toks:
+                return max(toks), False
+        return limit, False
+
+
+def iter_chunk_spans(
+    texts: Iterable[str],
+    chunk_size: int = 400,
+    chunk_overlap: int = 60,
+) -> Iterator[Tuple[ChunkSpan, str]]:
+    """
+    Chunk spans of the newline-joined `texts`, consumed one piece (e.g. one
+    page) at a time; yields (span, source text of the span). Only about one
+    chunk's worth of text is buffered.
+    """
+    builder = _SpanBuilder(chunk_size, chunk_overlap)
+    for text in texts:
+        builder.feed(text)
+        yield from builder.take(final=False)
+    yield from builder.take(final=True)
+
+
+def chunk_spans(text: str, chunk_size: int = 400, chunk_overlap: int = 60) -> List[ChunkSpan]:
+    """Chunk spans of one text; text[span.start:span.end] is the chunk."""
+    return [span for span, _ in iter_chunk_spans([text], chunk_size, chunk_overlap)]
+
+
+def iter_chunks(
+    texts: Iterable[str],
+    chunk_size: int = 400,
+    chunk_overlap: int = 60,
+    source_name: str = "",
+) -> Iterator[Dict]:
+    """
+    Streaming version of chunk_text over text pieces (e.g. pages), which are
+    treated as joined by newlines; metadata offsets refer to that joined text.
+    """
+    for idx, (span, text) in enumerate(iter_chunk_spans(texts, chunk_size, chunk_overlap)):
+        yield {
+            "id": f"{source_name}_{idx}",
+            # Whitespace is collapsed so phrases broken across PDF lines still match
+            "text": " ".join(text.split()),
+            "metadata": {
+                "source": source_name,
+                "chunk_index": idx,
+                "start": span.start,
+                "end": span.end,
+                "section": span.section,
+            },
+        }
 
 
 def chunk_text(
     text: str,
-    chunk_size: int = 1200,
-    chunk_overlap: int = 200,
+    chunk_size: int = 400,
+    chunk_overlap: int = 60,
     source_name: str = "",
 ) -> List[Dict]:
     """
-    Split long text into overlapping chunks.
+    Split long text into overlapping, section-aligned chunks of at most
+    chunk_size tokens (see the module docstring).
     Returns list of:
     {
         "id": "<source_name_i>",
         "text": "...",
-        "metadata": {...}
+        "metadata": {"source", "chunk_index", "start", "end", "section"}
     }
     """
-    words = text.split()
-    chunks: List[Dict] = []
-    start = 0
-    idx = 0
-
-    while start < len(words):
-        end = start + chunk_size
-        chunk_words = words[start:end]
-        chunk_text_str = " ".join(chunk_words)
-
-        chunks.append(
-            {
-                "id": f"{source_name}_{idx}",
-                "text": chunk_text_str,
-                "metadata": {
-                    "source": source_name,
-                    "chunk_index": idx,
-                },
-            }
-        )
-        idx += 1
-        start = max(end - chunk_overlap, end)
-
-    return chunks
+    return list(iter_chunks([text], chunk_size, chunk_overlap, source_name))
@@ -0,0 +1,196 @@
+"""
+Token-budgeted prompt context.
+
+Retrieved chunks are long stretches of Act text of which usually only a few
+sentences bear on the question. ContextPacker.pack() splits every chunk
+into sentences (clauses, for long provisions), scores each one against the
+query the way chunks are scored at retrieval (0.7 x embedding cosine +
+0.3 x BM25 over the query terms, here normalized by the best sentence) and
+keeps the best sentences until a token budget is spent. Kept sentences are
+shown per source, in their original order, with " … " where text was left out.
+
+Tokens are counted with the embedding model's WordPiece tokenizer, which
+splits English text at least as finely as the LLMs' BPE vocabularies, so
+the budget errs on the safe side. Sentence splits, vectors and token counts
+are cached per chunk; a chunk retrieved again only costs the scoring.
+"""
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+try:
+    from .bm25 import BM25Index
+except ImportError:  # imported as a top-level module by the ingest scripts
+    from bm25 import BM25Index
+
+SEMANTIC_WEIGHT = 0.7
+MIN_SENTENCE_CHARS = 40
+MAX_SENTENCE_CHARS = 600
+GAP = " … "
+GAP_TOKENS = 2  # what joining one more sentence costs, roughly
+
+# Sentence ends, paragraph breaks, and line breaks before a clause marker like "(a)", "2." or "•"
+_BOUNDARY_RE = re.compile(
+    r"(?<=[.;?!])\s+(?=[\"'(\[A-Z0-9])"
+    r"|\s*\n\s*\n\s*"
+    r"|\n(?=\s*(?:\([0-9a-zA-Z]{1,5}\)|[0-9]{1,3}[.)]|[-•*])\s)"
+)
+# Abbreviations a period does not end a sentence after ("Rs. 1,50,000", "sec. 80C", "i.e.")
+_ABBREVIATIONS = {
+    "sec", "secs", "no", "nos", "rs", "cl", "viz", "etc", "vs", "i.e", "e.g", "u/s", "ltd", "pvt", "co",
+    "art", "para", "sub-sec", "mr", "ms", "dr",
+}
+
+
+def _ends_with_abbreviation(piece: str) -> bool:
+    words = piece.rsplit(None, 1)
+    return bool(words) and piece.endswith(".") and words[-1].lower().rstrip(".") in _ABBREVIATIONS
+
+
+def _split_long(sentence: str) -> List[str]:
+    parts = []
+    while len(sentence) > MAX_SENTENCE_CHARS:
+        cut = sentence.rfind(", ", 0, MAX_SENTENCE_CHARS)
+        if cut < MAX_SENTENCE_CHARS // 2:
+            cut = sentence.rfind(" ", 0, MAX_SENTENCE_CHARS)
+        if cut <= 0:
+            cut = MAX_SENTENCE_CHARS
+        parts.append(sentence[:cut + 1].strip())
+        sentence = sentence[cut + 1:].strip()
+    if sentence:
+        parts.append(sentence)
+    return parts
+
+
+def split_sentences(text: str) -> List[str]:
+    """
+    Sentences of `text`, with whitespace collapsed. Fragments shorter than
+    MIN_SENTENCE_CHARS are joined to a neighbour and pieces longer than
+    MAX_SENTENCE_CHARS are cut at a comma or space.
+    """
+    merged: List[str] = []
+    for piece in _BOUNDARY_RE.split(text):
+        piece = " ".join(piece.split())
+        if not piece:
+            continue
+        if merged and (_ends_with_abbreviation(merged[-1]) or len(merged[-1]) < MIN_SENTENCE_CHARS):
+            merged[-1] = f"{merged[-1]} {piece}"
+        else:
+            merged.append(piece)
+    if len(merged) > 1 and len(merged[-1]) < MIN_SENTENCE_CHARS:
+        tail = merged.pop()
+        merged[-1] = f"{merged[-1]} {tail}"
+    sentences = []
+    for sentence in merged:
+        sentences.extend(_split_long(sentence))
+    return sentences
+
+
+class ContextPacker:
+    """
+    encode: texts → L2-normalized vectors (the model that embedded the query);
+    count_tokens: texts → token counts.
+    """
+
+    def __init__(
+        self,
+        encode: Callable[[List[str]], np.ndarray],
+        count_tokens: Callable[[List[str]], List[int]],
+        cache_size: int = 2048,
+    ):
+        self.encode = encode
+        self.count_tokens = count_tokens
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, Tuple[List[str], np.ndarray, np.ndarray]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def sentences(self, chunk: Dict) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        """(sentences, their vectors, their token counts) of a chunk."""
+        text = chunk.get("text", "")
+        # The text is part of the key: a re-ingested index may reuse a chunk id for new text
+        key = f"{chunk.get('id', '')}:{hash(text)}"
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+        sentences = split_sentences(text) or [" ".join(text.split())]
+        vectors = np.asarray(self.encode(sentences), dtype=np.float32).reshape(len(sentences), -1)
+        tokens = np.asarray(self.count_tokens(sentences), dtype=np.int64)
+        with self._lock:
+            self._cache[key] = (sentences, vectors, tokens)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return sentences, vectors, tokens
+
+    def pack(
+        self,
+        query_vec: Sequence[float],
+        query_terms: List[str],
+        chunks: List[Dict],
+        labels: List[str],
+        budget: int,
+        deadline=None,
+    ) -> Dict:
+        """
+        Best sentences of `chunks` for the query within `budget` tokens, each
+        chunk's kept sentences under its "[Source i: label]" header.
+        Returns {'text', 'tokens', 'sentences', 'total_sentences', 'chunks'}.
+        deadline: a Deadline checked before each chunk is split and embedded
+        (DeadlineExceeded when it runs out).
+        """
+        per_chunk = []
+        for chunk in chunks:
+            if deadline is not None:
+                deadline.check("context packing")
+            per_chunk.append(self.sentences(chunk))
+        rows = [(ci, si) for ci, (sentences, _, _) in enumerate(per_chunk) for si in range(len(sentences))]
+        if not rows:
+            return {"text": "", "tokens": 0, "sentences": 0, "total_sentences": 0, "chunks": 0}
+
+        query = np.asarray(query_vec, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        semantic = np.vstack([vectors for _, vectors, _ in per_chunk]) @ query
+        keyword = BM25Index.build(s for sentences, _, _ in per_chunk for s in sentences).score(query_terms)
+        if keyword.max() > 0:
+            keyword = keyword / keyword.max()
+        scores = SEMANTIC_WEIGHT * semantic + (1 - SEMANTIC_WEIGHT) * keyword
+
+        headers = [f"[Source {i}: {label}]" for i, label in enumerate(labels, 1)]
+        header_tokens = self.count_tokens(headers)
+        chosen: Dict[int, List[int]] = {}
+        kept_texts = set()  # overlapping chunks repeat sentences; each is sent once
+        used = 0
+        for row in np.argsort(-scores, kind="stable"):
+            ci, si = rows[row]
+            if per_chunk[ci][0][si] in kept_texts:
+                continue
+            cost = int(per_chunk[ci][2][si]) + GAP_TOKENS + (0 if ci in chosen else int(header_tokens[ci]))
+            if used + cost > budget:
+                continue  # a shorter, lower-ranked sentence may still fit
+            chosen.setdefault(ci, []).append(si)
+            kept_texts.add(per_chunk[ci][0][si])
+            used += cost
+
+        blocks = []
+        for ci in sorted(chosen):
+            sentences = per_chunk[ci][0]
+            kept = sorted(chosen[ci])
+            body = "" if kept[0] == 0 else GAP.lstrip()
+            for n, si in enumerate(kept):
+                if n:
+                    body += " " if si == kept[n - 1] + 1 else GAP
+                body += sentences[si]
+            if kept[-1] != len(sentences) - 1:
+                body += GAP.rstrip()
+            blocks.append(f"{headers[ci]}\n{body}")
+        return {
+            "text": "\n\n".join(blocks),
+            "tokens": used,
+            "sentences": sum(len(kept) for kept in chosen.values()),
+            "total_sentences": len(rows),
+            "chunks": len(chosen),
+        }
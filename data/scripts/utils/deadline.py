@@ -0,0 +1,59 @@
+"""
+Per-request time budgets.
+
+The API creates one Deadline per request and hands it down through
+retrieval and every LLM attempt. Each stage asks it how much time is left
+(timeout()) or stops early (check() / expired()), so a request as a whole
+never runs past its budget, however many models or retries it goes through.
+This replaces signal.alarm, which only works in the main thread (and so was
+switched off in the API) and cannot bound a whole request.
+"""
+import time
+from typing import Optional
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised by Deadline.check() once the budget is spent."""
+
+    def __init__(self, stage: str, budget: Optional[float]):
+        budget_text = f"deadline of {budget:.1f}s" if budget is not None else "deadline"
+        super().__init__(f"{budget_text} exceeded at {stage}")
+        self.stage = stage
+
+
+class Deadline:
+    """A point in time (monotonic clock) a request must finish by; seconds=None never expires."""
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.budget = seconds
+        self.started_at = time.monotonic()
+        self.expires_at = None if seconds is None else self.started_at + seconds
+
+    def remaining(self) -> float:
+        """Seconds left (inf without a budget, 0 once expired)."""
+        if self.expires_at is None:
+            return float("inf")
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def timeout(self, cap: Optional[float] = None) -> Optional[float]:
+        """Timeout for the next blocking call: the time left, at most `cap`; None if unbounded."""
+        if self.expires_at is None:
+            return cap
+        remaining = self.remaining()
+        return remaining if cap is None else min(remaining, cap)
+
+    def check(self, stage: str) -> None:
+        """Raise DeadlineExceeded if the budget is spent before `stage`."""
+        if self.expired():
+            raise DeadlineExceeded(stage, self.budget)
+
+    def __repr__(self) -> str:
+        if self.expires_at is None:
+            return "Deadline(unbounded)"
+        return f"Deadline({self.budget:.1f}s, {self.remaining():.2f}s left)"
@@ -0,0 +1,162 @@
+"""
+Near-duplicate chunk detection.
+
+Texts are compared as sets of hashed word 3-grams ("shingles"), by Jaccard similarity:
+
+    MinHasher             64 MinHash values per text; the fraction of equal
+                          values estimates the Jaccard similarity of two texts
+    NearDuplicateFilter   ingest-time filter over a chunk stream: a chunk whose
+                          estimated similarity to an earlier kept chunk reaches
+                          the threshold is dropped. LSH banding (16 bands of 4
+                          values) means each chunk is only compared with chunks
+                          sharing a band, not with every earlier one
+    mmr_select            query-time Maximal Marginal Relevance: picks results
+                          that are relevant but unlike the ones already picked
+
+Text similarity is used rather than embeddings so that results from indexes
+embedded with different models (e.g. the 1536-dim custom_index) compare too.
+"""
+import re
+import zlib
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_WORD_RE = re.compile(r"\w+")
+# Odd 64-bit multipliers combining word hashes into a shingle hash (wrapping arithmetic)
+_MIX = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9], dtype=np.uint64)
+
+SHINGLE_SIZE = 3
+NUM_PERM = 64
+LSH_BANDS = 16
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> np.ndarray:
+    """
+    Sorted unique 64-bit hashes of the lower-cased word n-grams; a text
+    shorter than n words is one shingle.
+    """
+    words = _WORD_RE.findall(text.lower())
+    if not words:
+        return np.zeros(0, dtype=np.uint64)
+    word_hashes = np.fromiter((zlib.crc32(w.encode("utf-8")) for w in words), dtype=np.uint64, count=len(words))
+    size = min(size, len(words))
+    n = len(words) - size + 1
+    mixed = np.zeros(n, dtype=np.uint64)
+    for j in range(size):
+        mixed ^= word_hashes[j:j + n] * _MIX[j % len(_MIX)]
+    return np.unique(mixed)
+
+
+def jaccard(a: np.ndarray, b: np.ndarray) -> float:
+    """Jaccard similarity of two shingles() results."""
+    if not a.size or not b.size:
+        return 0.0
+    common = np.intersect1d(a, b, assume_unique=True).size
+    return common / (a.size + b.size - common)
+
+
+class MinHasher:
+    """Fixed family of NUM_PERM hash permutations (seeded, so stable across runs)."""
+
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        # Multiply-shift hashing: (a * x + b) mod 2**64, top 32 bits
+        self._a = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64)
+
+    def signature(self, shingle_hashes: np.ndarray) -> Optional[np.ndarray]:
+        """MinHash signature of a shingles() result, or None for an empty text."""
+        if shingle_hashes.size == 0:
+            return None
+        return ((shingle_hashes[:, None] * self._a + self._b) >> np.uint64(32)).min(axis=0)
+
+
+class NearDuplicateFilter:
+    """
+    Remembers the signature of every chunk kept so far and drops chunks
+    that nearly duplicate one of them.
+    """
+
+    def __init__(self, threshold: float = 0.9, num_perm: int = NUM_PERM, bands: int = LSH_BANDS):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm)
+        self.rows = num_perm // bands
+        self._buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(bands)]
+        self._signatures: List[np.ndarray] = []
+        self._ids: List[str] = []
+        self.kept = 0
+        self.dropped: List[Tuple[str, str]] = []  # (dropped chunk id, id of the chunk it duplicates)
+
+    def _bands(self, signature: np.ndarray) -> Iterator[Tuple[int, bytes]]:
+        for band in range(len(self._buckets)):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def duplicate_of(self, text: str, chunk_id: str = "") -> Optional[str]:
+        """
+        Id of a kept chunk that `text` nearly duplicates, or None, in which
+        case the text is remembered as kept.
+        """
+        signature = self.hasher.signature(shingles(text))
+        if signature is None:
+            self.kept += 1
+            return None
+        candidates = set()
+        for band, key in self._bands(signature):
+            candidates.update(self._buckets[band].get(key, ()))
+        for row in sorted(candidates):
+            if np.mean(self._signatures[row] == signature) >= self.threshold:
+                return self._ids[row]
+
+        row = len(self._signatures)
+        self._signatures.append(signature)
+        self._ids.append(chunk_id)
+        for band, key in self._bands(signature):
+            self._buckets[band].setdefault(key, []).append(row)
+        self.kept += 1
+        return None
+
+    def filter(self, chunks: Iterable[Dict]) -> Iterator[Dict]:
+        """Pass chunks through, minus near-duplicates of earlier ones."""
+        for chunk in chunks:
+            original = self.duplicate_of(chunk.get("text", ""), chunk.get("id", ""))
+            if original is None:
+                yield chunk
+            else:
+                self.dropped.append((chunk.get("id", ""), original))
+        if self.dropped:
+            examples = ", ".join(f"{d} ≈ {o}" for d, o in self.dropped[:3])
+            print(
+                f"[dedup] Dropped {len(self.dropped)} near-duplicate chunks of {self.kept + len(self.dropped)} "
+                f"(threshold {self.threshold}; e.g. {examples})"
+            )
+
+
+def mmr_select(
+    matches: Sequence[Tuple[float, Dict]],
+    k: int,
+    lambda_mult: float = 0.7,
+    duplicate_threshold: float = 0.9,
+) -> List[Tuple[float, Dict]]:
+    """
+    Choose k of the (score, entry) matches by Maximal Marginal Relevance:
+    each pick maximizes lambda_mult * score - (1 - lambda_mult) * (highest
+    shingle similarity to an earlier pick). Matches at least
+    duplicate_threshold similar to an earlier pick are never chosen.
+    """
+    sets = [shingles(entry.get("text", "")) for _, entry in matches]
+    max_sim = [0.0] * len(matches)
+    remaining = list(range(len(matches)))
+    selected: List[int] = []
+    while remaining and len(selected) < k:
+        best = max(remaining, key=lambda i: lambda_mult * matches[i][0] - (1 - lambda_mult) * max_sim[i])
+        remaining.remove(best)
+        if max_sim[best] >= duplicate_threshold:
+            continue
+        selected.append(best)
+        for i in remaining:
+            max_sim[i] = max(max_sim[i], jaccard(sets[best], sets[i]))
+    return [matches[i] for i in selected]
@@ -1,23 +1,118 @@
 import os
 import json
-from typing import List, Dict, Optional
+import time
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple
 
 EMBED_DIM = 384  # sentence-transformers/all-MiniLM-L6-v2 dimension
+EMBEDDING_MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+
+# "torch" (SentenceTransformer on PyTorch), "onnx" or "onnx-int8" (ONNX Runtime,
+# see onnx_backend.py). ONNX variants fall back to torch until exported and validated.
+EMBED_BACKEND = os.environ.get("FINORA_EMBED_BACKEND", "torch")
+
+
+class EmbeddingBackend:
+    """
+    An embedding model behind SentenceTransformer's encode() contract: a str
+    gives one vector, a list gives a 2-D array, rows are L2-normalized
+    EMBED_DIM vectors. `name` tells backends apart in cache keys.
+    """
+
+    name = "base"
+
+    def encode(self, sentences, batch_size: int = 32, convert_to_numpy: bool = True, **kwargs):
+        raise NotImplementedError
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        """Tokens per text under the model's tokenizer, untruncated; estimated at 4 chars/token here."""
+        return [(len(text) + 3) // 4 for text in texts]
+
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    """The reference backend: sentence-transformers on PyTorch."""
+
+    name = "torch"
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL_NAME):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name)
+
+    def encode(self, sentences, batch_size: int = 32, convert_to_numpy: bool = True, **kwargs):
+        return self.model.encode(sentences, batch_size=batch_size, convert_to_numpy=convert_to_numpy, **kwargs)
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        encoded = self.model.tokenizer(list(texts), add_special_tokens=False, verbose=False)
+        return [len(ids) for ids in encoded["input_ids"]]
+
+    # Multi-process encoding pools (used by batched ingest) only exist for this backend
+    def start_multi_process_pool(self, *args, **kwargs):
+        return self.model.start_multi_process_pool(*args, **kwargs)
+
+    def encode_multi_process(self, *args, **kwargs):
+        return self.model.encode_multi_process(*args, **kwargs)
+
+    def stop_multi_process_pool(self, pool) -> None:
+        self.model.stop_multi_process_pool(pool)
+
 
 # Initialize the embedding model once (lazy loading)
 _embedding_model = None
+_embedding_model_lock = threading.Lock()
+_resolved_backend = None
+
 
-def get_embedding_model():
-    """Lazy load the sentence transformer model."""
+def resolve_backend_name() -> str:
+    """Backend that get_embedding_model() uses, without loading it."""
+    global _resolved_backend
+    if _resolved_backend is None:
+        name = EMBED_BACKEND
+        if name != "torch":
+            try:
+                from .onnx_backend import validated_variant_reason
+            except ImportError:  # imported as a top-level module by the ingest scripts
+                from onnx_backend import validated_variant_reason
+            reason = validated_variant_reason(name)
+            if reason:
+                print(f"[embedder] Not using {name} backend: {reason}; falling back to torch")
+                name = "torch"
+        _resolved_backend = name
+    return _resolved_backend
+
+
+def embedding_model_id() -> str:
+    """Identity of the vectors produced (model + backend), for caches and the ingest manifest."""
+    name = resolve_backend_name()
+    return EMBEDDING_MODEL_NAME if name == "torch" else f"{EMBEDDING_MODEL_NAME}@{name}"
+
+
+def get_embedding_model() -> EmbeddingBackend:
+    """Lazy load the embedding backend selected by FINORA_EMBED_BACKEND."""
     global _embedding_model
     if _embedding_model is None:
-        from sentence_transformers import SentenceTransformer
-        print("[embedder] Loading embedding model (first time only)...")
-        _embedding_model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
-        print("[embedder] Model loaded successfully")
+        with _embedding_model_lock:
+            if _embedding_model is None:
+                name = resolve_backend_name()
+                print(f"[embedder] Loading embedding model ({name} backend, first time only)...")
+                if name == "torch":
+                    _embedding_model = SentenceTransformerBackend()
+                else:
+                    try:
+                        from .onnx_backend import OnnxEmbeddingBackend
+                    except ImportError:  # imported as a top-level module by the ingest scripts
+                        from onnx_backend import OnnxEmbeddingBackend
+                    _embedding_model = OnnxEmbeddingBackend(name)
+                print("[embedder] Model loaded successfully")
     return _embedding_model
 
 
+def warm_up_model() -> Dict:
+    """Load the model and run one dummy encode (first-call kernels, tokenizer)."""
+    model = get_embedding_model()
+    return {"backend": model.name, "dim": int(len(model.encode("warmup", convert_to_numpy=True)))}
+
+
 def embed_text(text: str, use_fake: bool = False) -> List[float]:
     """
     Embed a single text string using local sentence-transformers.
@@ -42,6 +137,95 @@ def embed_text(text: str, use_fake: bool = False) -> List[float]:
         return [0.0] * EMBED_DIM
 
 
+class EmbeddingCache:
+    """
+    Bounded, thread-safe LRU cache of embeddings with an optional TTL.
+    Keys are (model name, text) so vectors from different models never mix.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl_seconds: float = 3600.0):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, List[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple[str, str]) -> Optional[List[float]]:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None and self.ttl_seconds > 0 and time.time() - item[0] > self.ttl_seconds:
+                del self._entries[key]
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return list(item[1])
+
+    def put(self, key: Tuple[str, str], vector: List[float]) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.time(), list(vector))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+_query_embedding_cache = EmbeddingCache(
+    max_size=int(os.environ.get("FINORA_EMBED_CACHE_SIZE", "1024")),
+    ttl_seconds=float(os.environ.get("FINORA_EMBED_CACHE_TTL", "3600")),
+)
+
+
+def embed_query(text: str) -> List[float]:
+    """
+    Embed a search query, reusing cached vectors for repeated query texts
+    (across routed indexes and across requests). Fallback zero vectors
+    from a failed encode are never cached.
+    """
+    key = (embedding_model_id(), text)
+    cached = _query_embedding_cache.get(key)
+    if cached is not None:
+        return cached
+
+    try:
+        model = get_embedding_model()
+        vector = model.encode(text, convert_to_numpy=True).tolist()
+    except Exception as e:
+        print(f"[embedder] Warning: Failed to generate embedding: {e}")
+        print("[embedder] Falling back to fake embeddings")
+        return [0.0] * EMBED_DIM
+
+    _query_embedding_cache.put(key, vector)
+    return vector
+
+
+def get_embedding_cache_stats() -> Dict:
+    """Hit/miss counters and occupancy of the query embedding cache."""
+    return _query_embedding_cache.stats()
+
+
 def load_vector_store(index_path: str) -> List[Dict]:
     """
     Load vectors from a JSONL index file.
@@ -79,39 +263,289 @@ def fake_embed(texts: List[str]) -> List[List[float]]:
     return [[0.0] * EMBED_DIM for _ in texts]
 
 
+def iter_embedding_batches(
+    text_batches: Iterable[List[str]],
+    batch_size: int = 64,
+    num_workers: int = 0,
+    use_fake: bool = False,
+    total: Optional[int] = None,
+) -> Iterator[List[List[float]]]:
+    """
+    Embed batches of texts as they arrive, yielding one list of vectors per
+    batch and printing progress and throughput.
+
+    num_workers > 1 encodes through a sentence-transformers multi-process
+    pool on that many CPU workers, kept open until the input is exhausted.
+    Unlike embed_text, a failing batch raises instead of silently producing
+    zero vectors.
+    """
+    model = pool = None
+    done = 0
+    start_time = time.perf_counter()
+    try:
+        for batch in text_batches:
+            if not batch:
+                yield []
+                continue
+            if use_fake:
+                yield fake_embed(batch)
+                continue
+            if model is None:
+                model = get_embedding_model()
+                if num_workers > 1 and not hasattr(model, "start_multi_process_pool"):
+                    print(f"[embedder] {model.name} backend has no process pool; encoding in one process")
+                elif num_workers > 1:
+                    pool = model.start_multi_process_pool(target_devices=["cpu"] * num_workers)
+                    print(f"[embedder] Started {num_workers} embedding workers")
+            try:
+                if pool is not None:
+                    embeddings = model.encode_multi_process(batch, pool, batch_size=batch_size)
+                else:
+                    embeddings = model.encode(batch, batch_size=batch_size, convert_to_numpy=True)
+            except Exception as e:
+                raise RuntimeError(
+                    f"Embedding failed for chunks {done}-{done + len(batch) - 1}: {e}"
+                ) from e
+            done += len(batch)
+
+            elapsed = time.perf_counter() - start_time
+            print(
+                f"[embedder] Progress: {done}{'/' + str(total) if total is not None else ''} chunks embedded "
+                f"({done / max(elapsed, 1e-9):.1f} chunks/sec)"
+            )
+            yield embeddings.tolist()
+    finally:
+        if pool is not None:
+            model.stop_multi_process_pool(pool)
+
+
+def embedding_step(batch_size: int, num_workers: int) -> int:
+    """Texts per encode call; multi-process mode hands each worker several batches per round trip."""
+    return batch_size * max(num_workers, 1) * 4 if num_workers > 1 else batch_size
+
+
+def embed_texts_batched(
+    texts: List[str],
+    batch_size: int = 64,
+    num_workers: int = 0,
+    use_fake: bool = False,
+) -> List[List[float]]:
+    """Embed many texts in batches (see iter_embedding_batches)."""
+    if use_fake:
+        return fake_embed(texts)
+    step = embedding_step(batch_size, num_workers)
+    vectors: List[List[float]] = []
+    text_batches = (texts[start:start + step] for start in range(0, len(texts), step))
+    for batch_vectors in iter_embedding_batches(text_batches, batch_size, num_workers, total=len(texts)):
+        vectors.extend(batch_vectors)
+    return vectors
+
+
+def embed_chunk_batches(
+    chunk_batches: Iterable[List[Dict]],
+    batch_size: int = 64,
+    num_workers: int = 0,
+    use_fake: bool = False,
+    embedding_cache=None,
+) -> Iterator[Tuple[List[Dict], List[List[float]]]]:
+    """
+    Yield (chunks, vectors) for each batch of chunks. With an embedding_cache
+    (ChunkEmbeddingCache, see ingest_cache.py) only chunks whose text is not
+    cached yet are sent to the model.
+    """
+    if embedding_cache is None or use_fake:
+        chunk_batches = iter(chunk_batches)
+        pending: List[List[Dict]] = []
+
+        def texts():
+            for batch in chunk_batches:
+                pending.append(batch)
+                yield [chunk["text"] for chunk in batch]
+
+        for vectors in iter_embedding_batches(texts(), batch_size, num_workers, use_fake):
+            yield pending.pop(0), vectors
+        return
+
+    try:
+        from .ingest_cache import text_sha256
+    except ImportError:  # imported as a top-level module by the ingest scripts
+        from ingest_cache import text_sha256
+
+    pending = []
+
+    def missing_texts():
+        for batch in chunk_batches:
+            hashes = [text_sha256(chunk["text"]) for chunk in batch]
+            vectors = [embedding_cache.get(h) for h in hashes]
+            missing = [i for i, v in enumerate(vectors) if v is None]
+            pending.append((batch, hashes, vectors, missing))
+            yield [batch[i]["text"] for i in missing]
+
+    cached = 0
+    for fresh in iter_embedding_batches(missing_texts(), batch_size, num_workers):
+        batch, hashes, vectors, missing = pending.pop(0)
+        for i, vec in zip(missing, fresh):
+            vectors[i] = vec
+            embedding_cache.put(hashes[i], vec)
+        cached += len(batch) - len(missing)
+        yield batch, vectors
+    print(f"[embedder] {cached} chunk embeddings reused from cache")
+
+
+def write_index_stream(
+    chunks: Iterable[Dict],
+    index_dir: str,
+    index_name: str,
+    use_fake: bool = False,
+    output_format: str = "jsonl",
+    quantization: str = "none",
+    batch_size: int = 64,
+    num_workers: int = 0,
+    embedding_cache=None,
+) -> int:
+    """
+    Embed a stream of chunks and write them as a new version of the index
+    (see index_versions.py) as they go; returns the chunk count. Embedding
+    runs on a background thread behind a bounded queue, so the model is busy
+    while earlier batches are written, and only a few batches are ever held
+    in memory. The version is published only once every file is complete;
+    a failed run leaves the live version untouched.
+    See build_embeddings_for_chunks for the options.
+    """
+    if output_format not in ("jsonl", "binary", "both"):
+        raise ValueError(f"Unknown output_format: {output_format}")
+    try:
+        from .ann_index import ANN_MIN_CHUNKS, build_ann_index
+        from .binary_index import iter_jsonl
+        from .index_versions import discard_version, new_version, publish_version
+    except ImportError:  # imported as a top-level module by the ingest scripts
+        from ann_index import ANN_MIN_CHUNKS, build_ann_index
+        from binary_index import iter_jsonl
+        from index_versions import discard_version, new_version, publish_version
+
+    index_root = os.path.join(index_dir, index_name)
+    version, out_dir = new_version(index_root)
+    index_path = os.path.join(out_dir, "index.jsonl")
+
+    try:
+        count = _write_version(
+            chunks, out_dir, output_format, quantization, batch_size, num_workers, use_fake, embedding_cache
+        )
+        if output_format in ("jsonl", "both"):
+            print(f"[embedder] Stored {count} vectors to embeddings/{index_name}/versions/{version}/index.jsonl")
+        if output_format in ("binary", "both"):
+            print(f"[embedder] Stored {count} vectors to embeddings/{index_name}/versions/{version}/{{vectors.npy,records.bin}}")
+
+        if count >= ANN_MIN_CHUNKS:
+            import numpy as np
+            if output_format != "jsonl":
+                matrix = np.load(os.path.join(out_dir, "vectors.npy"), mmap_mode="r")
+            else:
+                try:
+                    from .vector_search import build_embedding_matrix
+                except ImportError:  # imported as a top-level module by the ingest scripts
+                    from vector_search import build_embedding_matrix
+                matrix = build_embedding_matrix(list(iter_jsonl(index_path)))
+            build_ann_index(matrix, out_dir)
+    except BaseException:
+        discard_version(index_root, version)
+        raise
+
+    publish_version(index_root, version)
+    return count
+
+
+def _write_version(
+    chunks: Iterable[Dict],
+    out_dir: str,
+    output_format: str,
+    quantization: str,
+    batch_size: int,
+    num_workers: int,
+    use_fake: bool,
+    embedding_cache,
+) -> int:
+    """Embed chunks into index.jsonl and/or the binary files of one version directory."""
+    try:
+        from .binary_index import BinaryIndexWriter
+        from .pipeline import batched, prefetch
+    except ImportError:  # imported as a top-level module by the ingest scripts
+        from binary_index import BinaryIndexWriter
+        from pipeline import batched, prefetch
+
+    jsonl_file = (
+        open(os.path.join(out_dir, "index.jsonl"), "w", encoding="utf-8")
+        if output_format in ("jsonl", "both") else None
+    )
+    binary_writer = BinaryIndexWriter(out_dir, quantization=quantization) if output_format in ("binary", "both") else None
+    count = 0
+    try:
+        embedded = prefetch(
+            embed_chunk_batches(
+                batched(chunks, embedding_step(batch_size, num_workers)),
+                batch_size=batch_size,
+                num_workers=num_workers,
+                use_fake=use_fake,
+                embedding_cache=embedding_cache,
+            ),
+            maxsize=2,
+            name="embed",
+        )
+        for batch, vectors in embedded:
+            if jsonl_file is not None:
+                for chunk, vec in zip(batch, vectors):
+                    rec = {
+                        "id": chunk["id"],
+                        "text": chunk["text"],
+                        "metadata": chunk["metadata"],
+                        "embedding": vec,
+                    }
+                    jsonl_file.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            if binary_writer is not None:
+                binary_writer.add(batch, vectors)
+            count += len(batch)
+    finally:
+        if jsonl_file is not None:
+            jsonl_file.close()
+    if binary_writer is not None:
+        binary_writer.close()
+    return count
+
+
 def build_embeddings_for_chunks(
     chunks: List[Dict],
     index_dir: str,
     index_name: str,
     use_fake: bool = False,
     model: Optional[str] = None,
+    output_format: str = "jsonl",
+    quantization: str = "none",
+    batch_size: int = 64,
+    num_workers: int = 0,
+    embedding_cache=None,
 ) -> None:
     """
-    Create embeddings for each chunk and save to a simple JSONL index.
+    Create embeddings for each chunk and save them to the index directory.
     Uses Hugging Face for real embeddings by default.
-    """
-    os.makedirs(os.path.join(index_dir, index_name), exist_ok=True)
-    index_path = os.path.join(index_dir, index_name, "index.jsonl")
 
+    output_format: "jsonl" (index.jsonl), "binary" (mmap-able vectors.npy +
+    records.bin, see binary_index.py) or "both".
+    quantization: "float16" or "int8" also stores a quantized copy of the
+    binary vectors (see quantize.py).
+    batch_size / num_workers: see embed_texts_batched. Embedding failures
+    raise, so an index is never written with zero vectors.
+    embedding_cache: optional ChunkEmbeddingCache (see ingest_cache.py);
+    only chunks whose text is not cached yet are embedded.
+    """
     print(f"[embedder] Generating embeddings for {len(chunks)} chunks...")
-    
-    vectors = []
-    for i, chunk in enumerate(chunks):
-        if (i + 1) % 10 == 0:
-            print(f"[embedder] Progress: {i + 1}/{len(chunks)} chunks embedded")
-        vec = embed_text(chunk["text"], use_fake=use_fake)
-        vectors.append(vec)
-
-    with open(index_path, "w", encoding="utf-8") as f:
-        for chunk, vec in zip(chunks, vectors):
-            rec = {
-                "id": chunk["id"],
-                "text": chunk["text"],
-                "metadata": chunk["metadata"],
-                "embedding": vec,
-            }
-            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
-
-    print(
-        f"[embedder] Stored {len(chunks)} vectors to embeddings/{index_name}/index.jsonl"
+    write_index_stream(
+        chunks,
+        index_dir,
+        index_name,
+        use_fake=use_fake,
+        output_format=output_format,
+        quantization=quantization,
+        batch_size=batch_size,
+        num_workers=num_workers,
+        embedding_cache=embedding_cache,
     )
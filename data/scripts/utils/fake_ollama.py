@@ -0,0 +1,298 @@
+"""
+Stand-in for the Ollama HTTP API, for exercising llm_client.py (and the
+whole /query path) without Ollama or a GPU:
+
+    python fake_ollama.py [--port 11435] [--models llama3.2,phi3]
+                          [--load-delay 2.0] [--token-delay 0.02]
+                          [--first-token-delay llama3.2=3.0,phi3=0.5]
+    OLLAMA_HOST=http://localhost:11435 python backend/api.py
+
+Serves /api/chat (streamed NDJSON or a single JSON response), /api/generate
+(load / unload only), /api/ps, /api/tags and /api/version. Residency is
+simulated like Ollama does it: the first request for a model that is not
+loaded waits `load_delay` seconds, and a model stays loaded for the
+request's keep_alive (default 5m; 0 unloads, negative keeps it forever).
+A per-model first-token delay simulates a slow model (e.g. for hedging).
+Answers echo the question, so responses are deterministic.
+"""
+import re
+import sys
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_KEEP_ALIVE = 300.0
+_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_keep_alive(value) -> float:
+    """Seconds a model stays loaded: numbers are seconds, strings like "30m"/"1h30m"; negative = forever."""
+    if value is None or value == "":
+        return DEFAULT_KEEP_ALIVE
+    if isinstance(value, (int, float)):
+        return float(value)
+    text, total, number = str(value).strip(), 0.0, ""
+    i = 0
+    while i < len(text):
+        if text[i].isdigit() or text[i] in ".-":
+            number += text[i]
+            i += 1
+            continue
+        unit = "ms" if text.startswith("ms", i) else text[i]
+        if unit not in _UNITS or not number:
+            raise ValueError(f"invalid keep_alive: {value!r}")
+        total += float(number) * _UNITS[unit]
+        number = ""
+        i += len(unit)
+    if number:
+        total += float(number)
+    return total
+
+
+class FakeOllama:
+    """Model residency bookkeeping and answer generation behind the HTTP handler."""
+
+    def __init__(self, models: List[str], load_delay: float = 2.0, token_delay: float = 0.02,
+                 first_token_delay: Optional[Dict[str, float]] = None):
+        self.models = list(models)
+        self.load_delay = load_delay
+        self.token_delay = token_delay
+        self.first_token_delay = dict(first_token_delay or {})  # model → extra seconds before the first token
+        self._expires: Dict[str, float] = {}  # loaded model → expiry (inf = forever)
+        self._lock = threading.Lock()
+        self._load_locks = {model: threading.Lock() for model in self.models}
+        self.loads = 0
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def loaded(self) -> Dict[str, float]:
+        now = time.time()
+        with self._lock:
+            for model in [m for m, expires in self._expires.items() if expires <= now]:
+                del self._expires[model]
+            return dict(self._expires)
+
+    def touch(self, model: str, keep_alive) -> float:
+        """Load `model` if needed and reset its expiry; returns the load time spent."""
+        seconds = parse_keep_alive(keep_alive)
+        start = time.perf_counter()
+        # Concurrent requests for a model being loaded wait for that one load
+        with self._load_locks.setdefault(model.split(":")[0], threading.Lock()):
+            if model not in self.loaded() and seconds != 0:
+                time.sleep(self.load_delay)
+                with self._lock:
+                    self.loads += 1
+            with self._lock:
+                if seconds == 0:
+                    self._expires.pop(model, None)
+                else:
+                    self._expires[model] = float("inf") if seconds < 0 else time.time() + seconds
+        return time.perf_counter() - start
+
+    def reply(self, messages: List[Dict], options: Dict) -> Tuple[List[str], str]:
+        """(answer tokens, done_reason): 'length' if num_predict cut the answer short, else 'stop'."""
+        question = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+        question = " ".join(question.split())[:80]
+        text = f"This is a fake answer to: {question}. It is generated offline for testing."
+        if messages and messages[-1].get("role") == "assistant":
+            # A trailing assistant message is continued, as Ollama does for templates that allow it
+            prefix = messages[-1].get("content", "")
+            text = text[len(prefix):] if text.startswith(prefix) else " That is all."
+        tokens = re.findall(r"\s*\S+", text)
+        limit = int(options.get("num_predict") or 0)
+        if 0 < limit < len(tokens):
+            return tokens[:limit], "length"
+        return tokens, "stop"
+
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Many clients connect at once in concurrency tests; the default backlog of 5 resets some
+    request_queue_size = 128
+
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = "FakeOllama/0.1"
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def fake(self) -> FakeOllama:
+        return self.server.fake
+
+    def log_message(self, format, *args):  # keep test output quiet
+        pass
+
+    def _send_json(self, status: int, payload: Dict) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> Dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _check_model(self, body: Dict) -> Optional[str]:
+        model = body.get("model", "")
+        if model not in self.fake.models and model.split(":")[0] not in self.fake.models:
+            self._send_json(404, {"error": f"model '{model}' not found, try pulling it first"})
+            return None
+        return model
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json(200, {"models": [{"name": m, "model": m} for m in self.fake.models]})
+        elif self.path == "/api/ps":
+            models = []
+            for model, expires in self.fake.loaded().items():
+                expires_at = "forever" if expires == float("inf") else time.strftime(
+                    "%Y-%m-%dT%H:%M:%SZ", time.gmtime(expires))
+                models.append({"name": model, "model": model, "expires_at": expires_at})
+            self._send_json(200, {"models": models})
+        elif self.path == "/api/version":
+            self._send_json(200, {"version": "0.0.0-fake"})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        try:
+            body = self._read_json()
+        except ValueError:
+            self._send_json(400, {"error": "invalid JSON"})
+            return
+        if self.path == "/api/generate":
+            self._generate(body)
+        elif self.path == "/api/chat":
+            self._chat(body)
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def _generate(self, body: Dict) -> None:
+        # Only the load/unload form is supported (no prompt)
+        model = self._check_model(body)
+        if model is None:
+            return
+        try:
+            load = self.fake.touch(model, body.get("keep_alive"))
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        self._send_json(200, {"model": model, "response": "", "done": True,
+                              "done_reason": "unload" if body.get("keep_alive") == 0 else "load",
+                              "load_duration": int(load * 1e9)})
+
+    def _chat(self, body: Dict) -> None:
+        model = self._check_model(body)
+        if model is None:
+            return
+        fake = self.fake
+        with fake._lock:
+            fake.requests += 1
+            fake.in_flight += 1
+            fake.max_in_flight = max(fake.max_in_flight, fake.in_flight)
+        try:
+            start = time.perf_counter()
+            load = fake.touch(model, body.get("keep_alive"))
+            tokens, done_reason = fake.reply(body.get("messages") or [], body.get("options") or {})
+            time.sleep(fake.first_token_delay.get(model.split(":")[0], 0.0))
+            if body.get("stream", True):
+                self._stream(model, tokens, start, load, done_reason)
+            else:
+                time.sleep(fake.token_delay * len(tokens))
+                self._send_json(200, self._final(model, "".join(tokens), tokens, start, load, done_reason))
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True  # client gave up (e.g. timed out) before the answer
+        finally:
+            with fake._lock:
+                fake.in_flight -= 1
+
+    def _final(self, model: str, content: str, tokens: List[str], start: float, load: float, done_reason: str) -> Dict:
+        return {
+            "model": model,
+            "message": {"role": "assistant", "content": content},
+            "done": True,
+            "done_reason": done_reason,
+            "total_duration": int((time.perf_counter() - start) * 1e9),
+            "load_duration": int(load * 1e9),
+            "eval_count": len(tokens),
+        }
+
+    def _stream(self, model: str, tokens: List[str], start: float, load: float, done_reason: str) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write(part: Dict) -> None:
+            line = json.dumps(part).encode("utf-8") + b"\n"
+            self.wfile.write(f"{len(line):X}\r\n".encode("ascii") + line + b"\r\n")
+            self.wfile.flush()
+
+        try:
+            for token in tokens:
+                time.sleep(self.fake.token_delay)
+                write({"model": model, "message": {"role": "assistant", "content": token}, "done": False})
+            write(self._final(model, "", tokens, start, load, done_reason))
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True  # client stopped reading, like Ollama cancelling the generation
+
+
+def start_fake_ollama(
+    port: int = 0,
+    models: Tuple[str, ...] = ("llama3.2", "phi3"),
+    load_delay: float = 2.0,
+    token_delay: float = 0.02,
+    first_token_delay: Optional[Dict[str, float]] = None,
+) -> Tuple[FakeOllamaServer, str]:
+    """Serve a FakeOllama in a background thread; returns (server, base URL). port=0 picks a free port."""
+    server = FakeOllamaServer(("127.0.0.1", port), Handler)
+    server.fake = FakeOllama(list(models), load_delay, token_delay, first_token_delay)
+    threading.Thread(target=server.serve_forever, name="fake-ollama", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main(argv=None):
+    args = list(argv if argv is not None else sys.argv[1:])
+    options = {
+        "--port": "11435",
+        "--models": "llama3.2,phi3",
+        "--load-delay": "2.0",
+        "--token-delay": "0.02",
+        "--first-token-delay": "",
+    }
+    while args:
+        flag = args.pop(0)
+        if flag not in options or not args:
+            print(f"Usage: python fake_ollama.py {' '.join(f'[{k} {v}]' for k, v in options.items())}")
+            sys.exit(2)
+        options[flag] = args.pop(0)
+
+    server, url = start_fake_ollama(
+        int(options["--port"]),
+        tuple(m.strip() for m in options["--models"].split(",") if m.strip()),
+        float(options["--load-delay"]),
+        float(options["--token-delay"]),
+        {
+            model.strip(): float(seconds)
+            for model, seconds in (item.split("=") for item in options["--first-token-delay"].split(",") if item)
+        },
+    )
+    print(f"[fake_ollama] Serving {options['--models']} at {url} (load {options['--load-delay']}s, "
+          f"{options['--token-delay']}s/token); set OLLAMA_HOST={url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,501 @@
+"""
+Process-wide registry of loaded vector indexes.
+
+Each index's live version (see index_versions.py) is parsed once and kept
+in memory. When the index directory also holds the binary format (see
+binary_index.py), that is opened instead: vectors are memory-mapped and
+chunk records decoded lazily.
+
+When a new version is published, the registry notices (on use, at most every
+RELOAD_INTERVAL seconds, or through the watcher thread), loads and warms it
+in the background and then swaps it in. Queries never wait for a reload:
+until the swap they are served by the previous version, and a query that
+already holds a LoadedIndex keeps using it to the end.
+"""
+import os
+import sys
+import json
+import mmap
+import time
+import threading
+from functools import cached_property
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    from .ann_index import ANN_MIN_CHUNKS, AnnIndex, load_ann_index
+    from .bm25 import BM25Index
+    from .embedder import EMBED_DIM
+    from .phrase_index import PhraseIndex
+    from .quantize import QUANTIZATION_MODES, QuantizedMatrix, load_quantized
+    from .vector_search import build_embedding_matrix
+    from .binary_index import BM25_FILE, PHRASE_FILE, LazyEntries, has_binary_index, meta_path, open_binary_index
+    from .index_versions import resolve_index_dir
+except ImportError:  # imported as a top-level module by the ingest scripts
+    from ann_index import ANN_MIN_CHUNKS, AnnIndex, load_ann_index
+    from bm25 import BM25Index
+    from embedder import EMBED_DIM
+    from phrase_index import PhraseIndex
+    from quantize import QUANTIZATION_MODES, QuantizedMatrix, load_quantized
+    from vector_search import build_embedding_matrix
+    from binary_index import BM25_FILE, PHRASE_FILE, LazyEntries, has_binary_index, meta_path, open_binary_index
+    from index_versions import resolve_index_dir
+
+# Seconds between checks for a newly published version of a loaded index
+RELOAD_INTERVAL = float(os.environ.get("FINORA_INDEX_RELOAD_INTERVAL", "2"))
+# Most bytes of in-RAM float32 matrices copied into the combined scan matrix
+COMBINED_MAX_BYTES = int(float(os.environ.get("FINORA_COMBINED_MAX_MB", "64")) * 1e6)
+
+
+class LoadedIndex:
+    """
+    An index held in memory together with the file state it was loaded from.
+    Scoring inputs (normalized embedding matrix, BM25 postings, phrase
+    trigrams) are derived once here instead of on every query.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        path: str,
+        entries: Sequence[Dict],
+        mtime: float,
+        size: int,
+        load_time: float = 0.0,
+        matrix: Optional[np.ndarray] = None,
+        bm25_path: Optional[str] = None,
+        quantization: str = "none",
+        store_format: str = "jsonl",
+        version: str = "",
+    ):
+        self.name = name
+        self.path = path
+        self.version = version
+        self.entries = entries
+        self.mtime = mtime
+        self.size = size
+        self.load_time = load_time
+        self.loaded_at = time.time()
+        self.store_format = store_format
+
+        self.matrix = matrix if matrix is not None else build_embedding_matrix(entries)
+        self.bm25_path = bm25_path
+        self.quantization = quantization
+        self._base_bytes = estimate_entries_bytes(entries) if isinstance(entries, list) else 0
+
+    @cached_property
+    def bm25(self) -> BM25Index:
+        if self.bm25_path and os.path.exists(self.bm25_path):
+            return BM25Index.load(self.bm25_path)
+        return BM25Index.build(self.texts)
+
+    @cached_property
+    def scan_matrix(self):
+        """
+        Matrix used for the full similarity scan: the float32 matrix, or a
+        quantized copy (persisted next to a binary index, else built here).
+        """
+        if self.quantization == "none":
+            return self.matrix
+        if self.store_format == "binary":
+            persisted = load_quantized(os.path.dirname(self.path), self.quantization, self.matrix.shape[0])
+            if persisted is not None:
+                return persisted
+        return QuantizedMatrix.from_matrix(self.matrix, self.quantization)
+
+    @cached_property
+    def ann(self) -> Optional[AnnIndex]:
+        """ANN index persisted next to this index, if one matches its current contents."""
+        return load_ann_index(os.path.dirname(self.path), len(self.entries))
+
+    @property
+    def search_ann(self) -> Optional[AnnIndex]:
+        """ANN index to search with, or None when the index is small enough to scan exactly."""
+        return self.ann if len(self.entries) >= ANN_MIN_CHUNKS else None
+
+    @cached_property
+    def phrase(self) -> PhraseIndex:
+        persisted = os.path.join(os.path.dirname(self.path), PHRASE_FILE)
+        if self.store_format == "binary" and os.path.exists(persisted):
+            return PhraseIndex.load(persisted)
+        return PhraseIndex.build(self.texts)
+
+    def text_lower(self, i: int) -> str:
+        if "texts_lower" in self.__dict__:
+            return self.texts_lower[i]
+        return self.entries[i].get("text", "").lower()
+
+    def find_phrase(self, phrase: str) -> List[int]:
+        """Rows whose text contains the phrase (case-insensitive), checking only trigram candidates."""
+        phrase = phrase.lower()
+        return [int(i) for i in self.phrase.candidates(phrase) if phrase in self.text_lower(int(i))]
+
+    @cached_property
+    def texts(self) -> List[str]:
+        return [e.get("text", "") for e in self.entries]
+
+    @cached_property
+    def texts_lower(self) -> List[str]:
+        return [t.lower() for t in self.texts]
+
+    @property
+    def mapped_bytes(self) -> int:
+        """Bytes served from a memory-mapped file (shared through the page cache)."""
+        return int(self.matrix.nbytes) if isinstance(self.matrix, np.memmap) else 0
+
+    @property
+    def memory_bytes(self) -> int:
+        """Approximate private memory held by this index."""
+        total = self._base_bytes + int(self.matrix.nbytes) - self.mapped_bytes
+        for attr in ("texts", "texts_lower"):
+            if attr in self.__dict__:
+                total += sum(sys.getsizeof(t) for t in self.__dict__[attr])
+        if "bm25" in self.__dict__:
+            total += self.bm25.nbytes
+        if "phrase" in self.__dict__:
+            total += self.phrase.nbytes
+        scan = self.__dict__.get("scan_matrix")
+        if isinstance(scan, QuantizedMatrix) and not isinstance(scan.data, np.memmap):
+            total += scan.nbytes
+        return total
+
+    def warm(self) -> None:
+        """Build every derived structure a query would otherwise build on first use."""
+        self.bm25
+        self.phrase
+        self.scan_matrix
+        if len(self.entries) >= ANN_MIN_CHUNKS:
+            self.ann
+
+    def is_stale(self, version: str, mtime: float, size: int) -> bool:
+        return version != self.version or mtime != self.mtime or size != self.size
+
+    def stats(self) -> Dict:
+        return {
+            "version": self.version,
+            "path": self.path,
+            "format": self.store_format,
+            "chunks": len(self.entries),
+            "file_bytes": self.size,
+            "load_time_ms": round(self.load_time * 1000, 2),
+            "memory_bytes": self.memory_bytes,
+            "mapped_bytes": self.mapped_bytes,
+            "loaded_at": self.loaded_at,
+        }
+
+
+def is_private_array(matrix) -> bool:
+    """True for a float32 ndarray held in process memory (not memory-mapped, not quantized)."""
+    if not isinstance(matrix, np.ndarray) or matrix.dtype != np.float32:
+        return False
+    base = matrix
+    while isinstance(base, np.ndarray):
+        if isinstance(base, np.memmap):
+            return False
+        base = base.base
+    return not isinstance(base, mmap.mmap)
+
+
+def estimate_entries_bytes(entries: List[Dict]) -> int:
+    """Rough in-memory size of parsed index entries (containers, strings and floats)."""
+    total = sys.getsizeof(entries)
+    for e in entries:
+        total += sys.getsizeof(e)
+        for key, value in e.items():
+            total += sys.getsizeof(key)
+            if isinstance(value, list):
+                total += sys.getsizeof(value) + sum(sys.getsizeof(v) for v in value)
+            elif isinstance(value, dict):
+                total += sys.getsizeof(value) + sum(
+                    sys.getsizeof(k) + sys.getsizeof(v) for k, v in value.items()
+                )
+            else:
+                total += sys.getsizeof(value)
+    return total
+
+
+class IndexRegistry:
+    """
+    Loads each index once and serves it from memory, swapping in newly
+    published versions in the background. Safe to share between Flask
+    request threads.
+    """
+
+    def __init__(self, embed_dir: str, quantization: Optional[str] = None, reload_interval: Optional[float] = None):
+        self.embed_dir = embed_dir
+        # "none", "float16" or "int8": storage used for the similarity scan
+        self.quantization = quantization or os.environ.get("FINORA_QUANTIZATION", "none")
+        if self.quantization not in QUANTIZATION_MODES:
+            # Checked here: an unknown mode would otherwise fail every query's scan
+            print(
+                f"[index_registry] Unknown quantization {self.quantization!r} "
+                f"(expected one of {', '.join(QUANTIZATION_MODES)}), scanning float32"
+            )
+            self.quantization = "none"
+        self.reload_interval = RELOAD_INTERVAL if reload_interval is None else reload_interval
+        self._indexes: Dict[str, LoadedIndex] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+        self._checked_at: Dict[str, float] = {}
+        self._reloading: set = set()
+        self._watcher: Optional[threading.Thread] = None
+        self._combined_key = None
+        self._combined_lock = threading.Lock()
+        self._combined_thread: Optional[threading.Thread] = None
+        self._combined_dirty = False
+        self._combined: Tuple = (np.zeros((0, 0), np.float32), {}, {})
+
+    def locate(self, index_name: str) -> Tuple[str, str]:
+        """
+        (file whose presence marks the live version complete, version name).
+        Unversioned indexes are named after the file's mtime, "legacy@<mtime>".
+        """
+        index_dir, version = resolve_index_dir(os.path.join(self.embed_dir, index_name))
+        path = meta_path(index_dir) if has_binary_index(index_dir) else os.path.join(index_dir, "index.jsonl")
+        if version is None:
+            try:
+                version = f"legacy@{int(os.path.getmtime(path))}"
+            except OSError:
+                version = "legacy"
+        return path, version
+
+    def index_path(self, index_name: str) -> str:
+        """File whose mtime/size identifies the current version of an index."""
+        return self.locate(index_name)[0]
+
+    def _lock_for(self, index_name: str) -> threading.Lock:
+        with self._guard:
+            lock = self._locks.get(index_name)
+            if lock is None:
+                lock = self._locks[index_name] = threading.Lock()
+            return lock
+
+    def _stat(self, index_name: str) -> Tuple[str, str, os.stat_result]:
+        index_path, version = self.locate(index_name)
+        try:
+            return index_path, version, os.stat(index_path)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Index not found: {index_path}")
+
+    def get(self, index_name: str) -> LoadedIndex:
+        """
+        Return the loaded index. Only the first load of an index blocks; a
+        newer version on disk is loaded in the background and served from
+        the next call after it is ready.
+        """
+        cached = self._indexes.get(index_name)
+        if cached is not None:
+            now = time.monotonic()
+            if now - self._checked_at.get(index_name, 0.0) >= self.reload_interval:
+                self._checked_at[index_name] = now
+                self.refresh(index_name)
+            return cached
+
+        # Only one thread parses a given index; others wait and reuse the result
+        with self._lock_for(index_name):
+            cached = self._indexes.get(index_name)
+            if cached is not None:
+                return cached
+            index_path, version, st = self._stat(index_name)
+            loaded = self._load(index_name, index_path, version, st)
+            self._indexes[index_name] = loaded
+            self._checked_at[index_name] = time.monotonic()
+        # Until the background rebuild includes it, queries scan this index in place
+        self.schedule_rebuild_combined()
+        return loaded
+
+    def refresh(self, index_name: Optional[str] = None, wait: bool = False) -> None:
+        """
+        Start a background reload of each loaded index (or just `index_name`)
+        whose live version changed on disk. wait=True blocks until done.
+        """
+        threads = []
+        for name in [index_name] if index_name else self.loaded():
+            cached = self._indexes.get(name)
+            try:
+                _, version, st = self._stat(name)
+            except FileNotFoundError:
+                continue  # keep serving what is loaded
+            if cached is None or not cached.is_stale(version, st.st_mtime, st.st_size):
+                continue
+            with self._guard:
+                if name in self._reloading:
+                    continue
+                self._reloading.add(name)
+            thread = threading.Thread(target=self._reload, args=(name,), name=f"finora-reload-{name}", daemon=True)
+            thread.start()
+            threads.append(thread)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def _reload(self, index_name: str) -> None:
+        old = self._indexes.get(index_name)
+        try:
+            with self._lock_for(index_name):
+                index_path, version, st = self._stat(index_name)
+                loaded = self._load(index_name, index_path, version, st)
+                # Everything a query would build lazily is built before the swap
+                loaded.warm()
+                with self._guard:
+                    self._indexes[index_name] = loaded
+            print(f"[index_registry] Swapped {index_name}: {old.version if old else '-'} → {loaded.version}")
+            self.rebuild_combined()
+        except Exception as e:
+            print(
+                f"[index_registry] Reloading {index_name} failed, still serving "
+                f"{old.version if old else 'nothing'}: {e}"
+            )
+        finally:
+            with self._guard:
+                self._reloading.discard(index_name)
+
+    def watch(self, interval: Optional[float] = None) -> None:
+        """Check for new versions every `interval` seconds on a daemon thread, even while idle."""
+        interval = interval or max(self.reload_interval, 1.0)
+        if self._watcher is not None:
+            return
+
+        def run() -> None:
+            while True:
+                time.sleep(interval)
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"[index_registry] Version check failed: {e}")
+
+        self._watcher = threading.Thread(target=run, name="finora-index-watcher", daemon=True)
+        self._watcher.start()
+
+    def _load(self, index_name: str, index_path: str, version: str, st: os.stat_result) -> LoadedIndex:
+        start = time.perf_counter()
+        if os.path.basename(index_path) == "index.jsonl":
+            entries = []
+            with open(index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entries.append(json.loads(line))
+            loaded = LoadedIndex(
+                index_name, index_path, entries, st.st_mtime, st.st_size,
+                quantization=self.quantization,
+                version=version,
+            )
+        else:
+            matrix, store, _ = open_binary_index(os.path.dirname(index_path))
+            loaded = LoadedIndex(
+                index_name, index_path, LazyEntries(store), st.st_mtime, st.st_size,
+                matrix=matrix,
+                bm25_path=os.path.join(os.path.dirname(index_path), BM25_FILE),
+                quantization=self.quantization,
+                store_format="binary",
+                version=version,
+            )
+        loaded.load_time = time.perf_counter() - start
+
+        print(
+            f"[index_registry] Loaded {index_name} {version} ({loaded.store_format}): {len(loaded.entries)} chunks in "
+            f"{loaded.load_time * 1000:.1f} ms (~{loaded.memory_bytes / 1e6:.1f} MB)"
+        )
+        return loaded
+
+    def combined(self) -> Tuple:
+        """
+        The last built (matrix, spans, members): one scan matrix stacking
+        small in-RAM indexes, each index's (start, end) row span in it and
+        the LoadedIndex those rows belong to. Lets a multi-index query score
+        them in a single matrix-vector product. Never builds anything, so a
+        query does not wait for it; indexes missing from it (or present in
+        another version) are scanned in place.
+        """
+        return self._combined
+
+    def rebuild_combined(self) -> None:
+        """
+        Restack the combined matrix after the set of loaded indexes changed
+        (reloads, warmup, or in the background through
+        schedule_rebuild_combined). Only exactly-scanned float32 matrices
+        held in process memory are copied, up to COMBINED_MAX_BYTES: mmapped
+        and quantized matrices are left out, so they are not duplicated in RAM.
+        """
+        with self._combined_lock:
+            with self._guard:
+                indexes = sorted(self._indexes.items())
+            key = tuple(indexes)  # LoadedIndex compares by identity, so reloads invalidate it
+            if key == self._combined_key:
+                return
+            blocks, spans, members, row, size = [], {}, {}, 0, 0
+            for name, idx in indexes:
+                if idx.quantization != "none":
+                    continue  # quantized scans stay in place; their copies are not built here
+                matrix = idx.matrix
+                if (
+                    not is_private_array(matrix) or idx.search_ann is not None
+                    or matrix.shape[0] == 0 or matrix.shape[1] != EMBED_DIM
+                    or size + matrix.nbytes > COMBINED_MAX_BYTES
+                ):
+                    continue
+                blocks.append(matrix)
+                spans[name] = (row, row + matrix.shape[0])
+                members[name] = idx
+                row += matrix.shape[0]
+                size += matrix.nbytes
+            combined = np.concatenate(blocks) if blocks else np.zeros((0, 0), np.float32)
+            self._combined_key, self._combined = key, (combined, spans, members)
+
+    def schedule_rebuild_combined(self) -> None:
+        """
+        rebuild_combined() on a background thread, so the caller does not
+        wait for it. Requests made while a rebuild runs are folded into one
+        more rebuild after it.
+        """
+        with self._guard:
+            if self._combined_thread is not None:
+                self._combined_dirty = True
+                return
+            self._combined_dirty = False
+            self._combined_thread = threading.Thread(
+                target=self._rebuild_combined_loop, name="finora-combined", daemon=True
+            )
+            self._combined_thread.start()
+
+    def _rebuild_combined_loop(self) -> None:
+        while True:
+            try:
+                self.rebuild_combined()
+            except Exception as e:
+                print(f"[index_registry] Rebuilding the combined matrix failed: {e}")
+            with self._guard:
+                if not self._combined_dirty:
+                    self._combined_thread = None
+                    return
+                self._combined_dirty = False
+
+    def available(self) -> List[str]:
+        """Names of all indexes present on disk, loaded or not."""
+        if not os.path.isdir(self.embed_dir):
+            return []
+        return sorted(
+            name for name in os.listdir(self.embed_dir)
+            if os.path.isdir(os.path.join(self.embed_dir, name)) and os.path.exists(self.index_path(name))
+        )
+
+    def loaded(self) -> List[str]:
+        return list(self._indexes.keys())
+
+    def versions(self) -> Dict[str, str]:
+        """Version currently served for each loaded index."""
+        return {name: idx.version for name, idx in list(self._indexes.items())}
+
+    def stats(self) -> Dict[str, Dict]:
+        """Load time and memory footprint per loaded index."""
+        return {name: idx.stats() for name, idx in list(self._indexes.items())}
+
+    def evict(self, index_name: Optional[str] = None) -> None:
+        """Drop one index (or all of them) from memory."""
+        with self._guard:
+            if index_name is None:
+                self._indexes.clear()
+            else:
+                self._indexes.pop(index_name, None)
+        self.schedule_rebuild_combined()
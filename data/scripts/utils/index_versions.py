@@ -0,0 +1,135 @@
+"""
+Versioned index snapshots.
+
+Every build of an index goes to a directory of its own and is published by
+atomically replacing a small pointer file:
+
+    embeddings/<index_name>/
+        CURRENT               name of the live version, e.g. 20261018T093000Z-3f2a
+        versions/<version>/   index.jsonl, binary files, ANN index ...
+
+A version directory is never modified once published, so a reader that
+resolved CURRENT sees one complete snapshot however long it takes to load,
+while ingest writes the next one next to it. Publishing is a single
+os.replace of CURRENT. The newest KEEP_VERSIONS versions stay on disk so
+processes still serving an older one can finish; older ones are pruned.
+
+Indexes written before versioning (files directly in embeddings/<index_name>/)
+are still read; their version is reported as "legacy@<mtime>".
+"""
+import os
+import time
+import shutil
+from typing import Iterable, List, Optional, Tuple
+
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+
+# Published versions kept per index, the live one included
+KEEP_VERSIONS = int(os.environ.get("FINORA_INDEX_KEEP_VERSIONS", "3"))
+
+
+def new_version_id() -> str:
+    """Sortable, unique-enough version name: UTC build time plus a random suffix."""
+    return time.strftime("%Y%m%dT%H%M%SZ", time.gmtime()) + "-" + os.urandom(2).hex()
+
+
+def version_dir(index_root: str, version: str) -> str:
+    return os.path.join(index_root, VERSIONS_DIR, version)
+
+
+def current_version(index_root: str) -> Optional[str]:
+    """Version named by CURRENT, or None for an unversioned (legacy) index."""
+    try:
+        with open(os.path.join(index_root, CURRENT_FILE), "r", encoding="utf-8") as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return version if version and os.path.isdir(version_dir(index_root, version)) else None
+
+
+def resolve_index_dir(index_root: str) -> Tuple[str, Optional[str]]:
+    """(directory holding the live index files, version or None if unversioned)."""
+    version = current_version(index_root)
+    if version is None:
+        return index_root, None
+    return version_dir(index_root, version), version
+
+
+def new_version(index_root: str) -> Tuple[str, str]:
+    """Create an empty, unpublished version directory; returns (version, directory)."""
+    while True:
+        version = new_version_id()
+        path = version_dir(index_root, version)
+        try:
+            os.makedirs(path)
+            return version, path
+        except FileExistsError:
+            continue
+
+
+def fork_version(index_root: str, skip: Iterable[str] = ()) -> Tuple[str, str]:
+    """
+    New unpublished version holding the live version's files, except `skip`,
+    so a tool can add or rebuild files without touching the published copy.
+    Files are hard-linked where possible, so `skip` must name every file the
+    tool will rewrite in place.
+    """
+    source_dir, _ = resolve_index_dir(index_root)
+    version, path = new_version(index_root)
+    skip = set(skip)
+    for name in os.listdir(source_dir):
+        src = os.path.join(source_dir, name)
+        if name in skip or name in (CURRENT_FILE, VERSIONS_DIR) or not os.path.isfile(src):
+            continue
+        try:
+            os.link(src, os.path.join(path, name))
+        except OSError:
+            shutil.copy2(src, os.path.join(path, name))
+    return version, path
+
+
+def publish_version(index_root: str, version: str) -> None:
+    """Make `version` the live one (atomic), then prune old versions."""
+    pointer = os.path.join(index_root, CURRENT_FILE)
+    with open(pointer + ".tmp", "w", encoding="utf-8") as f:
+        f.write(version + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer + ".tmp", pointer)
+    print(f"[index_versions] Published {os.path.basename(index_root)} version {version}")
+    prune_versions(index_root)
+
+
+def discard_version(index_root: str, version: str) -> None:
+    """Remove an unpublished version, e.g. after a failed build."""
+    if version != current_version(index_root):
+        shutil.rmtree(version_dir(index_root, version), ignore_errors=True)
+
+
+def list_versions(index_root: str) -> List[str]:
+    """All version directories of an index, oldest first."""
+    root = os.path.join(index_root, VERSIONS_DIR)
+    if not os.path.isdir(root):
+        return []
+    return sorted(d for d in os.listdir(root) if os.path.isdir(os.path.join(root, d)))
+
+
+def prune_versions(index_root: str, keep: int = KEEP_VERSIONS) -> List[str]:
+    """
+    Delete all but the newest `keep` versions; the live one and anything
+    newer (a build in progress) are never deleted. Returns the removed ones.
+    """
+    versions = list_versions(index_root)
+    live = current_version(index_root)
+    if live is None:
+        return []
+    older = [v for v in versions if v < live]
+    removed = []
+    for version in older[:max(len(older) - max(keep - 1, 0), 0)]:
+        try:
+            shutil.rmtree(version_dir(index_root, version))
+            removed.append(version)
+        except OSError as e:  # e.g. still memory-mapped by a process on Windows
+            print(f"[index_versions] Could not remove {index_root} version {version}: {e}")
+    return removed
@@ -1,15 +1,59 @@
+"""
+Ingest: raw PDFs → chunks → embeddings → one index per topic.
+
+Each index is built as a streaming pipeline (see pipeline.py):
+
+    PDF pages ─▶ chunks ─▶ embedded batches ─▶ index files
+
+Stages run concurrently with bounded queues between them, so peak memory
+does not grow with the size of the corpus. Each build is written as a new
+index version and published atomically once complete (see index_versions.py),
+so a running API keeps serving the previous version meanwhile.
+"""
 import os
+import json
+import itertools
 from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
 
-from pdf_reader import load_all_pdfs
-from chunker import chunk_text
-from embedder import save_chunks_to_jsonl, build_embeddings_for_chunks
+from pdf_reader import iter_pages, list_pdfs
+from chunker import iter_chunks
+from embedder import embedding_model_id, write_index_stream
+from binary_index import iter_jsonl
+from index_versions import current_version, resolve_index_dir
+from dedup import NearDuplicateFilter
+from ingest_cache import ChunkDigest, ChunkEmbeddingCache, IngestManifest, chunks_digest, file_sha256, text_sha256
+from pipeline import prefetch
 
 
 PROJECT_ROOT = Path(__file__).resolve().parents[2]
 RAW_PDFS_DIR = PROJECT_ROOT / "raw_pdfs"
 PROCESSED_DIR = PROJECT_ROOT / "processed_text"
 EMBEDDINGS_DIR = PROJECT_ROOT / "embeddings"
+CACHE_DIR = PROJECT_ROOT / "cache"
+MANIFEST_PATH = CACHE_DIR / "ingest_manifest.json"
+
+# "jsonl", "binary" (memory-mapped, see binary_index.py) or "both"
+INDEX_FORMAT = os.environ.get("FINORA_INDEX_FORMAT", "jsonl")
+# "none", "float16" or "int8": quantized copy of binary index vectors
+INDEX_QUANTIZATION = os.environ.get("FINORA_QUANTIZATION", "none")
+# Embedding batch size and CPU worker processes (0 = single process)
+EMBED_BATCH_SIZE = int(os.environ.get("FINORA_EMBED_BATCH_SIZE", "64"))
+EMBED_WORKERS = int(os.environ.get("FINORA_EMBED_WORKERS", "0"))
+# PDF extraction worker processes (0 = single process)
+PDF_WORKERS = int(os.environ.get("FINORA_PDF_WORKERS", str(os.cpu_count() or 1)))
+# Items (pages or chunks) buffered between two pipeline stages
+PIPELINE_QUEUE_SIZE = int(os.environ.get("FINORA_INGEST_QUEUE_SIZE", "256"))
+# Chunk token budget and overlap (see chunker.py); part of each source's manifest
+# entry, so changing them re-chunks every source
+CHUNK_TOKENS = int(os.environ.get("FINORA_CHUNK_TOKENS", "400"))
+CHUNK_OVERLAP = int(os.environ.get("FINORA_CHUNK_OVERLAP", "60"))
+CHUNKING = f"sections-v1:{CHUNK_TOKENS}:{CHUNK_OVERLAP}"
+# Chunks at least this similar (estimated Jaccard over word 3-grams) to an earlier
+# chunk of the same index are dropped (see dedup.py); 0 keeps everything.
+# Part of each index's manifest digest, so changing it rebuilds the indexes
+DEDUP_THRESHOLD = float(os.environ.get("FINORA_DEDUP_THRESHOLD", "0.9"))
+DEDUP = f"minhash-v1:{DEDUP_THRESHOLD}" if DEDUP_THRESHOLD > 0 else "none"
 
 
 # Map logical source names → which index they belong to
@@ -25,48 +69,148 @@ INDEX_ROUTING = {
 }
 
 
-def process_single_source(source_name: str, text: str) -> None:
-    """Extract chunks, save them, then embed + index."""
-    print(f"\n[ingest] Processing source: {source_name}")
+def iter_source_chunks(
+    source_name: str,
+    pdf_path: Optional[str],
+    file_hash: Optional[str],
+    manifest: IngestManifest,
+) -> Iterator[Dict]:
+    """
+    Stream the chunks of one source. Unchanged sources (same PDF hash, or a
+    PDF that is gone) replay their saved chunks file; otherwise pages are
+    extracted and chunked on the fly and the chunks file is rewritten as they
+    pass through. The manifest entry is updated once the stream is exhausted.
+    """
+    out_jsonl = str(PROCESSED_DIR / f"{source_name}_chunks.jsonl")
+    index_name = INDEX_ROUTING.get(source_name, "custom_index")
+    digest = ChunkDigest()
+
+    if pdf_path is None or manifest.is_source_unchanged(source_name, file_hash, out_jsonl, CHUNKING):
+        rec = manifest.source(source_name)
+        print(f"[ingest] Unchanged: {source_name} (reusing {os.path.basename(out_jsonl)})")
+        for chunk in iter_jsonl(out_jsonl):
+            digest.add(text_sha256(chunk["text"]))
+            yield chunk
+        manifest.record_source(
+            source_name, rec["file"], rec["file_hash"], index_name, out_jsonl,
+            digest.hexdigest(), digest.count, rec.get("chunking", ""),
+        )
+        return
 
-    # 1) Chunk
-    chunks = chunk_text(
-        text,
-        chunk_size=1200,
-        chunk_overlap=200,
-        source_name=source_name,
+    print(f"\n[ingest] Processing source: {source_name}")
+    pages = prefetch(
+        iter_pages(pdf_path, num_workers=PDF_WORKERS, cache_dir=str(CACHE_DIR / "pages"), file_hash=file_hash),
+        maxsize=PIPELINE_QUEUE_SIZE,
+        name="extract",
+    )
+    os.makedirs(PROCESSED_DIR, exist_ok=True)
+    tmp_path = out_jsonl + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for chunk in iter_chunks(pages, chunk_size=CHUNK_TOKENS, chunk_overlap=CHUNK_OVERLAP, source_name=source_name):
+            f.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+            digest.add(text_sha256(chunk["text"]))
+            yield chunk
+    os.replace(tmp_path, out_jsonl)
+    if digest.count == 0:
+        print(f"[ingest] WARNING: No text extracted from {source_name}")
+    print(f"[ingest] Saved {digest.count} chunks → {out_jsonl}")
+
+    manifest.record_source(
+        source_name, os.path.basename(pdf_path), file_hash, index_name, out_jsonl,
+        digest.hexdigest(), digest.count, CHUNKING,
     )
 
-    # 2) Save raw chunks
-    out_jsonl = PROCESSED_DIR / f"{source_name}_chunks.jsonl"
-    save_chunks_to_jsonl(chunks, str(out_jsonl))
 
-    # 3) Find which index to store in
-    index_name = INDEX_ROUTING.get(source_name, "custom_index")
-    build_embeddings_for_chunks(
-        chunks,
+def build_index(
+    index_name: str,
+    source_names: List[str],
+    sources: Dict[str, Tuple[Optional[str], Optional[str]]],
+    manifest: IngestManifest,
+    embedding_cache: ChunkEmbeddingCache,
+) -> None:
+    """
+    Stream ALL sources routed to one index through chunk → embed → write,
+    unless none of them changed since the index was last built.
+    """
+    live_dir, _ = resolve_index_dir(str(EMBEDDINGS_DIR / index_name))
+    index_path = os.path.join(live_dir, "meta.json" if INDEX_FORMAT == "binary" else "index.jsonl")
+
+    def index_digest() -> Optional[str]:
+        digests = [(manifest.source(name) or {}).get("digest") for name in source_names]
+        return None if None in digests else chunks_digest(digests + [DEDUP])
+
+    unchanged = all(
+        path is None or manifest.is_source_unchanged(
+            name, file_hash, str(PROCESSED_DIR / f"{name}_chunks.jsonl"), CHUNKING
+        )
+        for name, (path, file_hash) in ((n, sources[n]) for n in source_names)
+    )
+    if unchanged and manifest.is_index_unchanged(index_name, embedding_model_id(), index_digest(), index_path):
+        print(f"[ingest] Index {index_name} is up to date")
+        return
+
+    print(f"\n[ingest] Building {index_name} from {', '.join(source_names)}")
+    chunks = itertools.chain.from_iterable(
+        iter_source_chunks(name, sources[name][0], sources[name][1], manifest) for name in source_names
+    )
+    if DEDUP_THRESHOLD > 0:
+        # Across all sources of the index; saved per-source chunk files stay complete
+        chunks = NearDuplicateFilter(DEDUP_THRESHOLD).filter(chunks)
+    count = write_index_stream(
+        prefetch(chunks, maxsize=PIPELINE_QUEUE_SIZE, name="chunk"),
         index_dir=str(EMBEDDINGS_DIR),
         index_name=index_name,
         use_fake=False,  # Using real HuggingFace embeddings
+        output_format=INDEX_FORMAT,
+        quantization=INDEX_QUANTIZATION,
+        batch_size=EMBED_BATCH_SIZE,
+        num_workers=EMBED_WORKERS,
+        embedding_cache=embedding_cache,
+    )
+    embedding_cache.save()
+    manifest.record_index(
+        index_name, embedding_model_id(), index_digest(), source_names, count,
+        version=current_version(str(EMBEDDINGS_DIR / index_name)),
     )
+    manifest.save()
 
 
 def main():
     print(f"[ingest] Project root: {PROJECT_ROOT}")
     print(f"[ingest] Raw PDFs: {RAW_PDFS_DIR}")
 
-    pdf_texts = load_all_pdfs(str(RAW_PDFS_DIR))
+    manifest = IngestManifest(str(MANIFEST_PATH))
+    embedding_cache = ChunkEmbeddingCache(str(CACHE_DIR / "embeddings"), embedding_model_id())
 
-    if not pdf_texts:
+    pdf_paths = list_pdfs(str(RAW_PDFS_DIR))
+
+    if not pdf_paths:
         print("[ingest] No PDFs found. Check data/raw_pdfs.")
         return
 
-    for source_name, text in pdf_texts.items():
-        if not text.strip():
-            print(f"[ingest] WARNING: No text extracted from {source_name}, skipping.")
-            continue
-        process_single_source(source_name, text)
-
+    # source name → (PDF path, content hash); (None, None) = replay saved chunks
+    sources: Dict[str, Tuple[Optional[str], Optional[str]]] = {
+        source_name: (pdf_path, file_sha256(pdf_path)) for source_name, pdf_path in pdf_paths.items()
+    }
+
+    # Sources ingested before whose PDF is no longer present keep their saved chunks,
+    # so a partial raw_pdfs folder never shrinks an index
+    for source_name, rec in manifest.sources().items():
+        if source_name not in sources and os.path.exists(rec["chunks_file"]):
+            print(f"[ingest] WARNING: {rec['file']} not in raw_pdfs, keeping its saved chunks")
+            sources[source_name] = (None, None)
+
+    # Merge every source routed to the same index into one build
+    index_sources: Dict[str, List[str]] = {}
+    for source_name in sorted(sources):
+        index_name = INDEX_ROUTING.get(source_name, "custom_index")
+        index_sources.setdefault(index_name, []).append(source_name)
+
+    for index_name, source_names in index_sources.items():
+        build_index(index_name, source_names, sources, manifest, embedding_cache)
+
+    manifest.save()
+    print(f"\n[ingest] Embedding cache: {embedding_cache.hits} hits, {embedding_cache.misses} misses")
     print("\n[ingest] ✅ Finished processing all PDFs.")
 
 
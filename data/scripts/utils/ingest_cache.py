@@ -0,0 +1,216 @@
+"""
+State that lets ingest skip unchanged work between runs.
+
+    IngestManifest        file hash, chunk hashes and target index per source,
+                          plus a digest of each index's chunk list
+    ChunkEmbeddingCache   embeddings keyed by (model, chunk text hash), in
+                          append-only .npy segments that are memory-mapped
+
+Both live under data/cache/ and can be deleted at any time to force a full rebuild.
+"""
+import os
+import json
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# New cache entries are written out as a segment once this many are pending
+CACHE_SEGMENT_SIZE = 4096
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def text_sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunks_digest(chunk_hashes: List[str]) -> str:
+    """Identity of an ordered list of chunks; changes if any chunk or the order changes."""
+    digest = ChunkDigest()
+    for chunk_hash in chunk_hashes:
+        digest.add(chunk_hash)
+    return digest.hexdigest()
+
+
+class ChunkDigest:
+    """Incremental chunks_digest, for chunk streams that are never held as a list."""
+
+    def __init__(self):
+        self._sha = hashlib.sha256()
+        self.count = 0
+
+    def add(self, chunk_hash: str) -> None:
+        if self.count:
+            self._sha.update(b"\n")
+        self._sha.update(chunk_hash.encode("ascii"))
+        self.count += 1
+
+    def hexdigest(self) -> str:
+        return self._sha.hexdigest()
+
+
+class IngestManifest:
+    """JSON record of what the last ingest run produced."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.data = {"sources": {}, "indexes": {}}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.data = json.load(f)
+            self.data.setdefault("sources", {})
+            self.data.setdefault("indexes", {})
+
+    def source(self, source_name: str) -> Optional[Dict]:
+        return self.data["sources"].get(source_name)
+
+    def sources(self) -> Dict[str, Dict]:
+        return self.data["sources"]
+
+    def is_source_unchanged(self, source_name: str, file_hash: str, chunks_file: str, chunking: str = "") -> bool:
+        rec = self.source(source_name)
+        return (
+            bool(rec)
+            and rec.get("file_hash") == file_hash
+            and rec.get("chunking", "") == chunking
+            and "digest" in rec
+            and os.path.exists(chunks_file)
+        )
+
+    def record_source(
+        self,
+        source_name: str,
+        file_name: str,
+        file_hash: str,
+        index_name: str,
+        chunks_file: str,
+        digest: str,
+        chunk_count: int,
+        chunking: str = "",
+    ) -> None:
+        self.data["sources"][source_name] = {
+            "file": file_name,
+            "file_hash": file_hash,
+            "chunking": chunking,
+            "index": index_name,
+            "chunks_file": chunks_file,
+            "chunk_count": chunk_count,
+            "digest": digest,
+        }
+
+    def is_index_unchanged(self, index_name: str, model: str, digest: str, index_path: str) -> bool:
+        rec = self.data["indexes"].get(index_name)
+        return (
+            bool(rec)
+            and rec.get("model") == model
+            and rec.get("digest") == digest
+            and os.path.exists(index_path)
+        )
+
+    def record_index(
+        self,
+        index_name: str,
+        model: str,
+        digest: str,
+        sources: List[str],
+        chunk_count: int,
+        version: Optional[str] = None,
+    ) -> None:
+        self.data["indexes"][index_name] = {
+            "model": model,
+            "digest": digest,
+            "sources": sources,
+            "chunk_count": chunk_count,
+            "version": version,
+        }
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+class ChunkEmbeddingCache:
+    """
+    Embeddings of previously seen chunk texts for one model, stored under
+    <cache_dir>/<model>/ as numbered segments: NNNNN.npy (vectors) plus
+    NNNNN.json (text hashes, row order). Segments are memory-mapped on load
+    and new entries are appended as new segments, so neither loading nor
+    saving touches the existing vectors.
+    """
+
+    def __init__(self, cache_dir: str, model_name: str, segment_size: int = CACHE_SEGMENT_SIZE):
+        self.dir = os.path.join(cache_dir, model_name.replace("/", "__"))
+        self.model_name = model_name
+        self.segment_size = segment_size
+        self._segments: List[np.ndarray] = []
+        self._rows: Dict[str, Tuple[int, int]] = {}
+        self._pending: Dict[str, List[float]] = {}
+        self.hits = 0
+        self.misses = 0
+        if os.path.isdir(self.dir):
+            for name in sorted(f for f in os.listdir(self.dir) if f.endswith(".json")):
+                self._load_segment(os.path.join(self.dir, name))
+
+    def _load_segment(self, keys_path: str) -> None:
+        vectors_path = keys_path[:-len(".json")] + ".npy"
+        if not os.path.exists(vectors_path):
+            return
+        with open(keys_path, "r", encoding="utf-8") as f:
+            keys = json.load(f)
+        vectors = np.load(vectors_path, mmap_mode="r")
+        if len(keys) != vectors.shape[0]:
+            print(f"[ingest_cache] Ignoring inconsistent embedding cache segment {vectors_path}")
+            return
+        seg = len(self._segments)
+        self._segments.append(vectors)
+        for row, key in enumerate(keys):
+            self._rows[key] = (seg, row)
+
+    def __len__(self) -> int:
+        return len(self._rows) + len(self._pending)
+
+    def get(self, text_hash: str) -> Optional[List[float]]:
+        if text_hash in self._pending:
+            self.hits += 1
+            return self._pending[text_hash]
+        loc = self._rows.get(text_hash)
+        if loc is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self._segments[loc[0]][loc[1]].tolist()
+
+    def put(self, text_hash: str, vector: List[float]) -> None:
+        if text_hash not in self._rows:
+            self._pending[text_hash] = vector
+            if len(self._pending) >= self.segment_size:
+                self.save()
+
+    def save(self) -> None:
+        """Write pending entries as a new segment."""
+        if not self._pending:
+            return
+        os.makedirs(self.dir, exist_ok=True)
+        seg = len(self._segments)
+        base = os.path.join(self.dir, f"{seg:05d}")
+        while os.path.exists(base + ".json"):
+            seg += 1
+            base = os.path.join(self.dir, f"{seg:05d}")
+        keys = list(self._pending)
+        np.save(base + ".npy", np.asarray(list(self._pending.values()), dtype=np.float32))
+        # Keys last: a segment without its .json is ignored on load
+        with open(base + ".json.tmp", "w", encoding="utf-8") as f:
+            json.dump(keys, f)
+        os.replace(base + ".json.tmp", base + ".json")
+        self._pending = {}
+        self._load_segment(base + ".json")
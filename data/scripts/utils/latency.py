@@ -0,0 +1,61 @@
+"""
+Latency histograms.
+
+LatencyHistogram counts durations in log-spaced buckets (each 25% wider than
+the one before, from 10 ms to about 10 minutes), so it takes any number of
+samples in fixed memory and answers percentile queries to within one
+bucket. Percentiles are reported as the bucket's upper bound: they may
+overestimate a latency slightly, never underestimate it.
+"""
+import bisect
+import math
+import threading
+from typing import Dict, List, Optional
+
+MIN_SECONDS = 0.01
+GROWTH = 1.25
+NUM_BUCKETS = 50
+
+
+class LatencyHistogram:
+    def __init__(self, min_seconds: float = MIN_SECONDS, growth: float = GROWTH, num_buckets: int = NUM_BUCKETS):
+        self.bounds: List[float] = [min_seconds * growth ** i for i in range(num_buckets)]
+        self.counts: List[int] = [0] * (num_buckets + 1)  # the last bucket takes everything above bounds[-1]
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        seconds = max(seconds, 0.0)
+        with self._lock:
+            self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Upper bound of the bucket holding the p-th percentile (0-100), or None without samples."""
+        with self._lock:
+            if not self.count:
+                return None
+            rank = max(math.ceil(p / 100.0 * self.count), 1)
+            seen = 0
+            for i, n in enumerate(self.counts):
+                seen += n
+                if seen >= rank:
+                    return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+            return self.max
+
+    def stats(self) -> Dict:
+        def rounded(value):
+            return None if value is None else round(value, 3)
+
+        return {
+            "count": self.count,
+            "mean_s": round(self.total / self.count, 3) if self.count else None,
+            "p50_s": rounded(self.percentile(50)),
+            "p95_s": rounded(self.percentile(95)),
+            "p99_s": rounded(self.percentile(99)),
+            "max_s": round(self.max, 3),
+        }
@@ -0,0 +1,479 @@
+"""
+Shared client for the local Ollama server.
+
+One OllamaClient per process talks to Ollama over a pool of keep-alive HTTP
+connections (httpx) and offers every call in two flavours:
+
+    achat / achat_stream / apreload   asyncio coroutines and async generators
+    chat / chat_stream / preload      blocking wrappers for request threads and scripts
+
+All requests run on one background event loop, so any number of
+concurrent generations are multiplexed over that loop and its connection
+pool; a request thread only waits on a future (or pulls streamed tokens
+from one) instead of driving its own HTTP connection.
+
+Every streamed call records the model's time to first token and total time
+in latency histograms (stats()). ahedged_chat / hedged_chat use them to hedge:
+when the first model has not produced a token within HEDGE_PERCENTILE of its
+usual first-token latency, the next model is started alongside it, and the
+first acceptable answer wins.
+
+Model residency: every request passes keep_alive (FINORA_OLLAMA_KEEP_ALIVE,
+default 30m) so Ollama keeps the model in memory between queries instead of
+unloading it after its 5 minute default; preload() loads a model before the
+first query needs it and unload() evicts it.
+
+fake_ollama.py serves the same endpoints for testing without Ollama.
+"""
+import os
+import json
+import time
+import queue
+import asyncio
+import threading
+import concurrent.futures
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import httpx
+
+try:
+    from .latency import LatencyHistogram
+except ImportError:  # imported as a top-level module
+    from latency import LatencyHistogram
+
+OLLAMA_HOST = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+# How long Ollama keeps a model loaded after a request ("30m", "1h", "-1" = forever)
+KEEP_ALIVE = os.environ.get("FINORA_OLLAMA_KEEP_ALIVE", "30m")
+# Pooled connections to Ollama (= generations in flight at once)
+MAX_CONNECTIONS = int(os.environ.get("FINORA_OLLAMA_MAX_CONNECTIONS", "16"))
+CONNECT_TIMEOUT = float(os.environ.get("FINORA_OLLAMA_CONNECT_TIMEOUT", "5"))
+# Longest wait for the next response bytes (a streamed token, or a whole non-streamed answer)
+READ_TIMEOUT = float(os.environ.get("FINORA_OLLAMA_READ_TIMEOUT", "60"))
+# Hedging: start the next model once the running one has gone this percentile
+# of its observed first-token latency without producing a token...
+HEDGE_PERCENTILE = float(os.environ.get("FINORA_LLM_HEDGE_PERCENTILE", "95"))
+# ...given at least this many observations; until then wait HEDGE_DEFAULT_DELAY seconds
+HEDGE_MIN_SAMPLES = int(os.environ.get("FINORA_LLM_HEDGE_MIN_SAMPLES", "20"))
+HEDGE_DEFAULT_DELAY = float(os.environ.get("FINORA_LLM_HEDGE_DELAY", "10"))
+
+
+class LLMError(RuntimeError):
+    """Ollama answered with an error (e.g. unknown model) or could not be reached."""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class LLMTimeout(LLMError):
+    """The caller's time budget ran out first; the request to Ollama was cancelled."""
+
+
+class _StreamEnd:
+    def __init__(self, error: Optional[BaseException] = None):
+        self.error = error
+
+
+def _base_url(host: str) -> str:
+    # OLLAMA_HOST may be given without a scheme, e.g. "0.0.0.0:11434"
+    return (host if "://" in host else f"http://{host}").rstrip("/")
+
+
+def _keep_alive(value):
+    # Numeric strings mean seconds; Ollama expects them as numbers
+    if isinstance(value, str) and value.lstrip("-").isdigit():
+        return int(value)
+    return value
+
+
+def _error_message(body: bytes) -> str:
+    try:
+        return json.loads(body).get("error") or body.decode("utf-8", "replace")
+    except ValueError:
+        return body.decode("utf-8", "replace")
+
+
+class OllamaClient:
+    def __init__(
+        self,
+        host: str = OLLAMA_HOST,
+        keep_alive=KEEP_ALIVE,
+        max_connections: int = MAX_CONNECTIONS,
+        read_timeout: float = READ_TIMEOUT,
+    ):
+        self.host = _base_url(host)
+        self.keep_alive = _keep_alive(keep_alive)
+        self.max_connections = max_connections
+        self.read_timeout = read_timeout
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._http: Optional[httpx.AsyncClient] = None
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.hedges = 0  # hedged_chat calls that started a second model
+        self.hedge_wins = 0  # ...where the later model's answer was used
+        self._latency: Dict[str, Dict[str, LatencyHistogram]] = {}
+
+    def latency(self, model: str) -> Dict[str, LatencyHistogram]:
+        """{'first_token': histogram, 'total': histogram} of a model's streamed calls."""
+        with self._lock:
+            if model not in self._latency:
+                self._latency[model] = {"first_token": LatencyHistogram(), "total": LatencyHistogram()}
+            return self._latency[model]
+
+    def hedge_delay(self, model: str, percentile: float = HEDGE_PERCENTILE) -> float:
+        """Seconds to wait for a first token from `model` before hedging."""
+        first_token = self.latency(model)["first_token"]
+        if first_token.count < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        return first_token.percentile(percentile)
+
+    # Event loop and connection pool
+
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """The background event loop all requests run on (started on first use)."""
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="finora-llm-loop", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def _client(self) -> httpx.AsyncClient:
+        # Created lazily on the loop thread; an AsyncClient belongs to one loop
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                base_url=self.host,
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+                timeout=httpx.Timeout(self.read_timeout, connect=CONNECT_TIMEOUT),
+            )
+        return self._http
+
+    def run(self, coro, timeout: Optional[float] = None):
+        """
+        Run a coroutine on the client loop from any (non-loop) thread and wait
+        for its result, at most `timeout` seconds; after that it is cancelled
+        (closing its HTTP request) and LLMTimeout is raised.
+        """
+        if timeout is not None and timeout <= 0:
+            coro.close()
+            raise LLMTimeout("no time left for the request")
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop())
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise LLMTimeout(f"no response within {timeout:.1f}s") from None
+        except BaseException:
+            future.cancel()
+            raise
+
+    def iter_async(self, agen: AsyncIterator, timeout: Optional[float] = None) -> Iterator:
+        """
+        Consume an async generator running on the client loop as a plain
+        iterator. The whole iteration may take at most `timeout` seconds, after
+        which LLMTimeout is raised. Stopping early (timeout, close(), an
+        exception in the consumer) cancels the generator, which closes its
+        HTTP stream and so makes Ollama stop generating.
+        """
+        if timeout is not None and timeout <= 0:
+            raise LLMTimeout("no time left for the request")
+        items: "queue.Queue" = queue.Queue()
+
+        async def pump():
+            error = None
+            try:
+                async for item in agen:
+                    items.put(item)
+            except Exception as e:
+                error = e
+            finally:
+                items.put(_StreamEnd(error))
+
+        end = None if timeout is None else time.monotonic() + timeout
+        future = asyncio.run_coroutine_threadsafe(pump(), self.loop())
+        try:
+            while True:
+                try:
+                    item = items.get(timeout=None if end is None else max(end - time.monotonic(), 0))
+                except queue.Empty:
+                    raise LLMTimeout(f"stream not finished within {timeout:.1f}s") from None
+                if isinstance(item, _StreamEnd):
+                    if item.error is not None:
+                        raise item.error
+                    return
+                yield item
+        finally:
+            future.cancel()
+
+    def close(self) -> None:
+        if self._loop is None:
+            return
+        if self._http is not None:
+            self.run(self._http.aclose())
+            self._http = None
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop = None
+
+    # Async API
+
+    def _chat_payload(self, model: str, messages: List[Dict], options: Optional[Dict], stream: bool, keep_alive) -> Dict:
+        return {
+            "model": model,
+            "messages": messages,
+            "options": options or {},
+            "stream": stream,
+            "keep_alive": self.keep_alive if keep_alive is None else _keep_alive(keep_alive),
+        }
+
+    async def _post(self, path: str, payload: Dict) -> Dict:
+        self._started()
+        try:
+            response = await self._client().post(path, json=payload)
+            if response.status_code >= 400:
+                raise LLMError(f"{response.status_code}: {_error_message(response.content)}", response.status_code)
+            return response.json()
+        except httpx.HTTPError as e:
+            self.errors += 1
+            raise LLMError(f"Ollama request failed: {e!r}") from e
+        except LLMError:
+            self.errors += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+    def _started(self) -> None:
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    async def achat(self, model: str, messages: List[Dict], options: Optional[Dict] = None, keep_alive=None) -> Dict:
+        """One complete chat response: {'message': {'role', 'content'}, 'done': True, ...}."""
+        start = time.perf_counter()
+        response = await self._post("/api/chat", self._chat_payload(model, messages, options, False, keep_alive))
+        self.latency(model)["total"].record(time.perf_counter() - start)
+        return response
+
+    async def achat_stream(
+        self, model: str, messages: List[Dict], options: Optional[Dict] = None, keep_alive=None
+    ) -> AsyncIterator[str]:
+        """
+        Answer text as Ollama generates it. Time to first token and total time
+        go into latency(model); a call cancelled before its first token records
+        the time it waited as first-token latency (a lower bound), so slow
+        calls cut short by hedging or a deadline still count.
+        """
+        payload = self._chat_payload(model, messages, options, True, keep_alive)
+        histograms = self.latency(model)
+        start = time.perf_counter()
+        first_token = False
+        self._started()
+        try:
+            async with self._client().stream("POST", "/api/chat", json=payload) as response:
+                if response.status_code >= 400:
+                    raise LLMError(
+                        f"{response.status_code}: {_error_message(await response.aread())}", response.status_code
+                    )
+                async for line in response.aiter_lines():
+                    if not line.strip():
+                        continue
+                    part = json.loads(line)
+                    if part.get("error"):
+                        raise LLMError(part["error"])
+                    text = part.get("message", {}).get("content", "")
+                    if text:
+                        if not first_token:
+                            first_token = True
+                            histograms["first_token"].record(time.perf_counter() - start)
+                        yield text
+                    if part.get("done"):
+                        histograms["total"].record(time.perf_counter() - start)
+                        return
+        except httpx.HTTPError as e:
+            self.errors += 1
+            raise LLMError(f"Ollama stream failed: {e!r}") from e
+        except LLMError:
+            self.errors += 1
+            raise
+        except asyncio.CancelledError:
+            if not first_token:
+                histograms["first_token"].record(time.perf_counter() - start)
+            raise
+        finally:
+            self.in_flight -= 1
+
+    async def _collect(self, model: str, messages: List[Dict], options: Optional[Dict], keep_alive,
+                       first_token: asyncio.Event) -> str:
+        parts = []
+        async for text in self.achat_stream(model, messages, options, keep_alive):
+            first_token.set()
+            parts.append(text)
+        return "".join(parts)
+
+    async def ahedged_chat(
+        self,
+        models: Sequence[str],
+        messages: List[Dict],
+        options: Optional[Dict] = None,
+        accept: Optional[Callable[[str], bool]] = None,
+        keep_alive=None,
+        percentile: float = HEDGE_PERCENTILE,
+    ) -> Tuple[str, str, bool]:
+        """
+        Race `models` (in order of preference) for one answer; returns
+        (answer, model, accepted).
+
+        models[0] starts at once. Whenever hedge_delay() of the latest started
+        model passes before any model has produced a token, or every started
+        model has failed or given a rejected answer, the next one is started.
+        The first complete answer for which accept(answer) is true wins and
+        the other calls are cancelled. If no answer is accepted, the first
+        non-empty one is returned with accepted=False; LLMError if there is none.
+        """
+        waiting = list(models)
+        running: Dict[asyncio.Task, str] = {}
+        first_token = asyncio.Event()
+        fallback: Optional[Tuple[str, str]] = None
+        errors: List[str] = []
+        started_at = time.perf_counter()
+        token_wait: Optional[asyncio.Future] = None
+
+        def launch() -> str:
+            model = waiting.pop(0)
+            running[asyncio.ensure_future(self._collect(model, messages, options, keep_alive, first_token))] = model
+            return model
+
+        latest = launch()
+        try:
+            while running:
+                delay = None
+                wait_for = set(running)
+                if waiting and not first_token.is_set():
+                    delay = self.hedge_delay(latest, percentile)
+                    token_wait = asyncio.ensure_future(first_token.wait())
+                    wait_for.add(token_wait)
+                done, _ = await asyncio.wait(wait_for, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+                if token_wait is not None:
+                    token_wait.cancel()
+                    token_wait = None
+                if not done:
+                    print(f"[llm_client] No token from {latest} after {delay:.2f}s, hedging with {waiting[0]}")
+                    self.hedges += 1
+                    latest = launch()
+                    continue
+
+                for task in done:
+                    model = running.pop(task, None)
+                    if model is None:  # the first-token wait
+                        continue
+                    try:
+                        answer = task.result()
+                    except Exception as e:
+                        errors.append(f"{model}: {str(e)[:80]}")
+                        print(f"[llm_client] {model} failed: {str(e)[:80]}")
+                        continue
+                    if not answer.strip():
+                        errors.append(f"{model}: empty answer")
+                        continue
+                    if accept is None or accept(answer):
+                        if model != models[0]:
+                            self.hedge_wins += 1
+                        print(f"[llm_client] {model} answered first ({time.perf_counter() - started_at:.2f}s)")
+                        return answer, model, True
+                    if fallback is None:
+                        fallback = (answer, model)
+
+                if not running and waiting:
+                    latest = launch()  # nothing left running: fail over to the next model
+        finally:
+            for task in running:
+                task.cancel()
+            if token_wait is not None:
+                token_wait.cancel()
+
+        if fallback is not None:
+            return fallback[0], fallback[1], False
+        raise LLMError(f"no answer from {', '.join(models)} ({'; '.join(errors)})")
+
+    async def apreload(self, model: str, keep_alive=None) -> float:
+        """Load a model into memory without generating anything; returns the seconds it took."""
+        start = time.perf_counter()
+        await self._post("/api/generate", {
+            "model": model,
+            "keep_alive": self.keep_alive if keep_alive is None else _keep_alive(keep_alive),
+        })
+        return time.perf_counter() - start
+
+    async def aunload(self, model: str) -> None:
+        await self._post("/api/generate", {"model": model, "keep_alive": 0})
+
+    async def arunning_models(self) -> List[Dict]:
+        """Models currently loaded by Ollama, with their expiry time."""
+        self._started()
+        try:
+            response = await self._client().get("/api/ps")
+            if response.status_code >= 400:
+                raise LLMError(f"{response.status_code}: {_error_message(response.content)}", response.status_code)
+            return response.json().get("models", [])
+        except httpx.HTTPError as e:
+            raise LLMError(f"Ollama request failed: {e!r}") from e
+        finally:
+            self.in_flight -= 1
+
+    # Blocking API
+
+    def chat(self, model: str, messages: List[Dict], options: Optional[Dict] = None, keep_alive=None,
+             timeout: Optional[float] = None) -> Dict:
+        return self.run(self.achat(model, messages, options, keep_alive), timeout)
+
+    def chat_stream(self, model: str, messages: List[Dict], options: Optional[Dict] = None, keep_alive=None,
+                    timeout: Optional[float] = None) -> Iterator[str]:
+        return self.iter_async(self.achat_stream(model, messages, options, keep_alive), timeout)
+
+    def hedged_chat(self, models: Sequence[str], messages: List[Dict], options: Optional[Dict] = None,
+                    accept: Optional[Callable[[str], bool]] = None, keep_alive=None,
+                    timeout: Optional[float] = None) -> Tuple[str, str, bool]:
+        return self.run(self.ahedged_chat(models, messages, options, accept, keep_alive), timeout)
+
+    def preload(self, model: str, keep_alive=None) -> float:
+        return self.run(self.apreload(model, keep_alive))
+
+    def unload(self, model: str) -> None:
+        self.run(self.aunload(model))
+
+    def running_models(self) -> List[Dict]:
+        return self.run(self.arunning_models())
+
+    def stats(self) -> Dict:
+        with self._lock:
+            latency = sorted(self._latency.items())
+        return {
+            "host": self.host,
+            "keep_alive": self.keep_alive,
+            "max_connections": self.max_connections,
+            "requests": self.requests,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "latency": {
+                model: {kind: histogram.stats() for kind, histogram in histograms.items()}
+                for model, histograms in latency
+            },
+        }
+
+
+_client: Optional[OllamaClient] = None
+_client_lock = threading.Lock()
+
+
+def get_llm_client() -> OllamaClient:
+    """Process-wide OllamaClient, created on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = OllamaClient()
+        return _client
@@ -0,0 +1,253 @@
+"""
+ONNX Runtime backend for the MiniLM embedding model (CPU, no PyTorch at runtime).
+
+Model files live in FINORA_ONNX_MODEL_DIR (default data/models/all-MiniLM-L6-v2-onnx):
+
+    model.onnx        transformer exported from the Hugging Face checkpoint
+    model.int8.onnx   same, with weights dynamically quantized to int8
+    tokenizer.json    fast tokenizer (loaded with the `tokenizers` package)
+    validation.json   per-variant agreement with the stored index embeddings
+
+Pooling and normalization match the SentenceTransformer pipeline
+(mean over non-padding tokens, then L2), so vectors are interchangeable with
+the ones already in the indexes. A variant is only used once validation.json
+records that it passed, for the exact model file on disk.
+
+Export (needs torch + transformers once), quantize and validate with:
+    python onnx_backend.py [--tolerance 0.99] [--samples 200]
+"""
+import os
+import sys
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+
+try:
+    from .embedder import EmbeddingBackend
+except ImportError:  # imported as a top-level module by the ingest scripts
+    from embedder import EmbeddingBackend
+
+MODEL_DIR = os.environ.get(
+    "FINORA_ONNX_MODEL_DIR",
+    str(Path(__file__).resolve().parents[2] / "models" / "all-MiniLM-L6-v2-onnx"),
+)
+MODEL_FILES = {"onnx": "model.onnx", "onnx-int8": "model.int8.onnx"}
+TOKENIZER_FILE = "tokenizer.json"
+VALIDATION_FILE = "validation.json"
+MAX_SEQ_LENGTH = 256  # max_seq_length of all-MiniLM-L6-v2
+
+# Minimum cosine similarity to the stored (PyTorch) embeddings of any sampled chunk
+DEFAULT_TOLERANCE = {"onnx": 0.9999, "onnx-int8": 0.98}
+
+
+def onnx_available() -> bool:
+    try:
+        import onnxruntime  # noqa: F401
+        import tokenizers  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _file_signature(path: str) -> Dict:
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime": st.st_mtime}
+
+
+def load_validation(model_dir: str = MODEL_DIR) -> Dict:
+    path = os.path.join(model_dir, VALIDATION_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def validated_variant_reason(variant: str, model_dir: str = MODEL_DIR) -> Optional[str]:
+    """None if the variant can be used, otherwise why not."""
+    if variant not in MODEL_FILES:
+        return f"unknown ONNX variant {variant!r}"
+    if not onnx_available():
+        return "onnxruntime/tokenizers not installed"
+    model_path = os.path.join(model_dir, MODEL_FILES[variant])
+    if not os.path.exists(model_path) or not os.path.exists(os.path.join(model_dir, TOKENIZER_FILE)):
+        return f"{model_path} or its tokenizer is missing (run onnx_backend.py)"
+    record = load_validation(model_dir).get(variant)
+    if not record or not record.get("passed"):
+        return f"{variant} has not passed validation (run onnx_backend.py)"
+    if record.get("model_file") != _file_signature(model_path):
+        return f"{variant} model file changed since it was validated (run onnx_backend.py)"
+    return None
+
+
+class OnnxEmbeddingBackend(EmbeddingBackend):
+    """SentenceTransformer-compatible encode() over an ONNX Runtime session."""
+
+    def __init__(self, variant: str = "onnx", model_dir: str = MODEL_DIR, num_threads: int = 0):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.name = variant
+        self.model_path = os.path.join(model_dir, MODEL_FILES[variant])
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(self.model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=MAX_SEQ_LENGTH)
+        self.tokenizer.enable_padding()
+        self._counter = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))  # no truncation, no padding
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        feeds = {
+            "input_ids": np.asarray([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.asarray([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.asarray([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        hidden = self.session.run(None, {k: v for k, v in feeds.items() if k in self.input_names})[0]
+        mask = feeds["attention_mask"][:, :, None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return (pooled / np.clip(norms, 1e-12, None)).astype(np.float32)
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        return [len(e.ids) for e in self._counter.encode_batch(list(texts), add_special_tokens=False)]
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32, convert_to_numpy: bool = True, **_):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        out = np.zeros((len(texts), 0), dtype=np.float32)
+        if texts:
+            # Similar lengths per batch keep padding (and wasted compute) small
+            order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+            blocks = [
+                self._encode_batch([texts[i] for i in order[start:start + batch_size]])
+                for start in range(0, len(texts), batch_size)
+            ]
+            sorted_out = np.concatenate(blocks)
+            out = np.empty_like(sorted_out)
+            out[order] = sorted_out
+        return out[0] if single else out
+
+
+def export_onnx(model_name: str, model_dir: str = MODEL_DIR, opset: int = 14) -> str:
+    """Export the Hugging Face transformer behind a SentenceTransformer model to ONNX."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(model_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    dummy = tokenizer(["Section 80C deduction limit"], return_tensors="pt")
+    names = ["input_ids", "attention_mask", "token_type_ids"]
+    dynamic = {name: {0: "batch", 1: "sequence"} for name in names}
+    dynamic["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    path = os.path.join(model_dir, MODEL_FILES["onnx"])
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(dummy[name] for name in names),
+            path,
+            input_names=names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic,
+            opset_version=opset,
+        )
+    tokenizer.save_pretrained(model_dir)  # writes tokenizer.json for the fast tokenizer
+    print(f"[onnx_backend] Exported {model_name} → {path}")
+    return path
+
+
+def quantize_int8(model_dir: str = MODEL_DIR) -> str:
+    """Dynamic int8 quantization of model.onnx: int8 weights, activations quantized on the fly."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    src = os.path.join(model_dir, MODEL_FILES["onnx"])
+    dst = os.path.join(model_dir, MODEL_FILES["onnx-int8"])
+    quantize_dynamic(src, dst, weight_type=QuantType.QInt8, per_channel=True)
+    print(f"[onnx_backend] Quantized {src} → {dst}")
+    return dst
+
+
+def validate_backend(backend, embed_dir: str, samples_per_index: int = 200, dim: int = 384) -> Dict:
+    """
+    Re-embed sampled chunk texts from every index with `backend` and compare
+    against their stored embeddings. Returns cosine similarity stats.
+    """
+    try:
+        from .binary_index import iter_jsonl
+        from .index_versions import resolve_index_dir
+    except ImportError:  # run as a script from utils/
+        from binary_index import iter_jsonl
+        from index_versions import resolve_index_dir
+
+    rng = np.random.default_rng(0)
+    cosines: List[float] = []
+    for name in sorted(os.listdir(embed_dir)):
+        path = os.path.join(resolve_index_dir(os.path.join(embed_dir, name))[0], "index.jsonl")
+        if not os.path.exists(path):
+            continue
+        entries = [e for e in iter_jsonl(path) if len(e.get("embedding", [])) == dim and e.get("text")]
+        if not entries:
+            continue
+        rows = rng.choice(len(entries), size=min(samples_per_index, len(entries)), replace=False)
+        stored = np.asarray([entries[i]["embedding"] for i in rows], dtype=np.float32)
+        stored /= np.clip(np.linalg.norm(stored, axis=1, keepdims=True), 1e-12, None)
+        fresh = backend.encode([entries[i]["text"] for i in rows], batch_size=32)
+        cosines.extend((stored * fresh).sum(axis=1).tolist())
+    if not cosines:
+        raise ValueError(f"No {dim}-dim index embeddings found in {embed_dir} to validate against")
+    values = np.asarray(cosines)
+    return {
+        "samples": int(values.size),
+        "min_cosine": float(values.min()),
+        "mean_cosine": float(values.mean()),
+        "p01_cosine": float(np.percentile(values, 1)),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    try:
+        from .embedder import EMBED_DIM, EMBEDDING_MODEL_NAME
+    except ImportError:  # run as a script from utils/
+        from embedder import EMBED_DIM, EMBEDDING_MODEL_NAME
+
+    args = list(argv if argv is not None else sys.argv[1:])
+    options = {"--tolerance": None, "--samples": "200"}
+    for flag in options:
+        if flag in args:
+            pos = args.index(flag)
+            options[flag] = args[pos + 1]
+            del args[pos:pos + 2]
+
+    if not os.path.exists(os.path.join(MODEL_DIR, MODEL_FILES["onnx"])):
+        export_onnx(EMBEDDING_MODEL_NAME)
+    if not os.path.exists(os.path.join(MODEL_DIR, MODEL_FILES["onnx-int8"])):
+        quantize_int8()
+
+    embed_dir = str(Path(__file__).resolve().parents[2] / "embeddings")
+    validation = load_validation()
+    for variant in MODEL_FILES:
+        tolerance = float(options["--tolerance"] or DEFAULT_TOLERANCE[variant])
+        stats = validate_backend(OnnxEmbeddingBackend(variant), embed_dir, int(options["--samples"]), EMBED_DIM)
+        stats.update(
+            tolerance=tolerance,
+            passed=stats["min_cosine"] >= tolerance,
+            model_file=_file_signature(os.path.join(MODEL_DIR, MODEL_FILES[variant])),
+        )
+        validation[variant] = stats
+        print(
+            f"[onnx_backend] {variant}: min cosine {stats['min_cosine']:.5f}, mean {stats['mean_cosine']:.5f} "
+            f"over {stats['samples']} chunks → {'PASSED' if stats['passed'] else 'FAILED'} (tolerance {tolerance})"
+        )
+    with open(os.path.join(MODEL_DIR, VALIDATION_FILE), "w", encoding="utf-8") as f:
+        json.dump(validation, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,187 @@
 import os
-from typing import Dict, List
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
 
 import pdfplumber
 
+# Pages handed to one worker at a time; large PDFs are split into several shards
+PAGES_PER_SHARD = int(os.environ.get("FINORA_PDF_PAGES_PER_SHARD", "32"))
 
-def extract_text_from_pdf(pdf_path: str) -> str:
-    """Extract raw text from a PDF file using pdfplumber."""
-    text_parts: List[str] = []
+
+def count_pages(pdf_path: str) -> int:
+    with pdfplumber.open(pdf_path) as pdf:
+        return len(pdf.pages)
+
+
+def extract_page_range(pdf_path: str, start: int, end: int) -> List[str]:
+    """Text of pages [start, end) of one PDF. Runs in a worker process when parallel."""
     with pdfplumber.open(pdf_path) as pdf:
-        for page in pdf.pages:
-            page_text = page.extract_text() or ""
-            text_parts.append(page_text)
-    return "\n".join(text_parts)
+        return [pdf.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+def _page_cache_file(cache_dir: str, file_hash: str, page_no: int) -> str:
+    return os.path.join(cache_dir, file_hash, f"{page_no:05d}.txt")
+
+
+def _read_cached_page(cache_dir: str, file_hash: str, page_no: int) -> Optional[str]:
+    path = _page_cache_file(cache_dir, file_hash, page_no)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def _write_cached_page(cache_dir: str, file_hash: str, page_no: int, text: str) -> None:
+    path = _page_cache_file(cache_dir, file_hash, page_no)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def _read_cached_shard(cache_dir: Optional[str], file_hash: Optional[str], start: int, end: int) -> Optional[List[str]]:
+    """Cached text of pages [start, end), or None unless every page is cached."""
+    if cache_dir is None:
+        return None
+    texts = []
+    for page_no in range(start, end):
+        text = _read_cached_page(cache_dir, file_hash, page_no)
+        if text is None:
+            return None
+        texts.append(text)
+    return texts
+
+
+def iter_pages(
+    pdf_path: str,
+    num_workers: int = 0,
+    cache_dir: Optional[str] = None,
+    file_hash: Optional[str] = None,
+    pages_per_shard: int = PAGES_PER_SHARD,
+) -> Iterator[str]:
+    """
+    Yield the text of every page of a PDF, in page order.
+
+    Pages are processed in shards of pages_per_shard. num_workers > 1
+    extracts shards on a process pool, keeping at most 2 * num_workers shards
+    in flight so memory stays bounded on very large documents. With
+    cache_dir, each page's text is stored as <cache_dir>/<file sha256>/<page>.txt
+    and reused on later runs, so only pages of new or changed PDFs are extracted.
+    """
+    start_time = time.perf_counter()
+    num_pages = count_pages(pdf_path)
+    if cache_dir is not None and file_hash is None:
+        try:
+            from .ingest_cache import file_sha256
+        except ImportError:  # imported as a top-level module by the ingest scripts
+            from ingest_cache import file_sha256
+        file_hash = file_sha256(pdf_path)
+
+    pages_per_shard = max(pages_per_shard, 1)
+    shards = iter([(s, min(s + pages_per_shard, num_pages)) for s in range(0, num_pages, pages_per_shard)])
+    pool = ProcessPoolExecutor(max_workers=num_workers) if num_workers > 1 and num_pages > pages_per_shard else None
+    # (start, end, cached texts | Future | None = extract in this process)
+    in_flight: Deque[Tuple[int, int, object]] = deque()
+    extracted = 0
+
+    def submit_next() -> None:
+        shard = next(shards, None)
+        if shard is None:
+            return
+        start, end = shard
+        cached = _read_cached_shard(cache_dir, file_hash, start, end)
+        if cached is not None:
+            in_flight.append((start, end, cached))
+        elif pool is not None:
+            in_flight.append((start, end, pool.submit(extract_page_range, pdf_path, start, end)))
+        else:
+            in_flight.append((start, end, None))
+
+    try:
+        for _ in range(2 * max(num_workers, 1)):
+            submit_next()
+        while in_flight:
+            start, end, work = in_flight.popleft()
+            submit_next()
+            if isinstance(work, list):
+                texts = work
+            else:
+                texts = work.result() if work is not None else extract_page_range(pdf_path, start, end)
+                extracted += len(texts)
+                if cache_dir is not None:
+                    for offset, text in enumerate(texts):
+                        _write_cached_page(cache_dir, file_hash, start + offset, text)
+            yield from texts
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    elapsed = time.perf_counter() - start_time
+    print(
+        f"[pdf_reader] {os.path.basename(pdf_path)}: {num_pages} pages "
+        f"({extracted} extracted, {num_pages - extracted} cached) in {elapsed:.2f}s "
+        f"({num_pages / max(elapsed, 1e-9):.1f} pages/sec)"
+    )
 
 
-def load_all_pdfs(raw_pdfs_dir: str) -> Dict[str, str]:
+def extract_pages(
+    pdf_path: str,
+    num_workers: int = 0,
+    cache_dir: Optional[str] = None,
+    file_hash: Optional[str] = None,
+    pages_per_shard: int = PAGES_PER_SHARD,
+) -> List[str]:
+    """Text of every page of a PDF, in page order (see iter_pages for the options)."""
+    return list(iter_pages(pdf_path, num_workers, cache_dir, file_hash, pages_per_shard))
+
+
+def extract_text_from_pdf(
+    pdf_path: str,
+    num_workers: int = 0,
+    cache_dir: Optional[str] = None,
+    file_hash: Optional[str] = None,
+) -> str:
+    """Extract raw text from a PDF file using pdfplumber (see extract_pages for the options)."""
+    return "\n".join(extract_pages(pdf_path, num_workers=num_workers, cache_dir=cache_dir, file_hash=file_hash))
+
+
+FILENAME_MAP = {
+    "Income_Tax_Act_2025.pdf": "income_tax_act_2025",
+    "gst_notification_9_2025_rates.pdf": "gst_9_2025",
+    "gst-ct-18-2025.pdf": "gst_ct_18_2025",
+    "hscodewiselistwithgstrates.pdf": "gst_hsn_rates",
+    "14- stcg.pdf": "stcg",
+    "15- ltcg.pdf": "ltcg",
+    "80.deductions-or-allowances-allowed-to-salaried-employee.pdf": "deductions",
+    "presumptive-taxation-english.pdf": "presumptive",
+}
+
+
+def list_pdfs(raw_pdfs_dir: str) -> Dict[str, str]:
+    """
+    Map logical source names to PDF paths without extracting anything:
+    {
+        "income_tax_act_2025": "<raw_pdfs_dir>/Income_Tax_Act_2025.pdf",
+        ...
+    }
+    """
+    mapping: Dict[str, str] = {}
+    for fname in sorted(os.listdir(raw_pdfs_dir)):
+        if not fname.lower().endswith(".pdf"):
+            continue
+        key = FILENAME_MAP.get(fname, os.path.splitext(fname)[0])
+        mapping[key] = os.path.join(raw_pdfs_dir, fname)
+    return mapping
+
+
+def load_all_pdfs(
+    raw_pdfs_dir: str,
+    num_workers: int = 0,
+    cache_dir: Optional[str] = None,
+) -> Dict[str, str]:
     """
     Load all PDFs in a folder and return a mapping:
     {
@@ -26,24 +193,8 @@ def load_all_pdfs(raw_pdfs_dir: str) -> Dict[str, str]:
     """
     mapping: Dict[str, str] = {}
 
-    filename_map = {
-        "Income_Tax_Act_2025.pdf": "income_tax_act_2025",
-        "gst_notification_9_2025_rates.pdf": "gst_9_2025",
-        "gst-ct-18-2025.pdf": "gst_ct_18_2025",
-        "hscodewiselistwithgstrates.pdf": "gst_hsn_rates",
-        "14- stcg.pdf": "stcg",
-        "15- ltcg.pdf": "ltcg",
-        "80.deductions-or-allowances-allowed-to-salaried-employee.pdf": "deductions",
-        "presumptive-taxation-english.pdf": "presumptive",
-    }
-
-    for fname in os.listdir(raw_pdfs_dir):
-        if not fname.lower().endswith(".pdf"):
-            continue
-        fpath = os.path.join(raw_pdfs_dir, fname)
-        key = filename_map.get(fname, os.path.splitext(fname)[0])
-        print(f"[pdf_reader] Extracting {fname} → key='{key}'")
-        text = extract_text_from_pdf(fpath)
-        mapping[key] = text
+    for key, fpath in list_pdfs(raw_pdfs_dir).items():
+        print(f"[pdf_reader] Extracting {os.path.basename(fpath)} → key='{key}'")
+        mapping[key] = extract_text_from_pdf(fpath, num_workers=num_workers, cache_dir=cache_dir)
 
     return mapping
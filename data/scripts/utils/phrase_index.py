@@ -0,0 +1,83 @@
+"""
+Character-trigram index for exact phrase matching.
+
+A lowercased document can only contain a phrase if it contains every
+trigram of that phrase, so intersecting trigram postings yields a small
+candidate set; only those candidates are then checked with a substring test.
+This replaces a full `phrase in text` scan over every chunk per query and
+also serves exact lookups of section numbers and HSN codes.
+"""
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+NGRAM = 3
+
+
+def char_ngrams(text: str, n: int = NGRAM) -> set:
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class PhraseIndex:
+    """Trigram → sorted document ids, over lowercased document texts."""
+
+    def __init__(self, postings: Dict[str, np.ndarray], num_docs: int):
+        self.postings = postings
+        self.num_docs = num_docs
+
+    @classmethod
+    def build(cls, texts: Iterable[str]) -> "PhraseIndex":
+        grams: Dict[str, List[int]] = {}
+        num_docs = 0
+        for doc_id, text in enumerate(texts):
+            num_docs += 1
+            for gram in char_ngrams(text.lower()):
+                grams.setdefault(gram, []).append(doc_id)
+        postings = {g: np.asarray(ids, dtype=np.int32) for g, ids in grams.items()}
+        return cls(postings, num_docs)
+
+    @property
+    def nbytes(self) -> int:
+        return int(sum(ids.nbytes for ids in self.postings.values()))
+
+    def candidates(self, phrase: str) -> np.ndarray:
+        """Documents that may contain the (lowercased) phrase; a superset of the true matches."""
+        grams = char_ngrams(phrase)
+        if not grams:
+            # Phrases shorter than a trigram cannot be narrowed down
+            return np.arange(self.num_docs, dtype=np.int32)
+        lists = []
+        for gram in grams:
+            ids = self.postings.get(gram)
+            if ids is None:
+                return np.zeros(0, dtype=np.int32)
+            lists.append(ids)
+        lists.sort(key=len)
+        result = lists[0]
+        for ids in lists[1:]:
+            result = np.intersect1d(result, ids, assume_unique=True)
+            if result.size == 0:
+                break
+        return result
+
+    def save(self, path: str) -> None:
+        """Persist postings as flat arrays (no pickling) in an .npz file."""
+        grams = sorted(self.postings)
+        offsets = np.zeros(len(grams) + 1, dtype=np.int64)
+        for i, gram in enumerate(grams):
+            offsets[i + 1] = offsets[i] + len(self.postings[gram])
+        doc_ids = np.concatenate([self.postings[g] for g in grams]) if grams else np.zeros(0, np.int32)
+        np.savez(
+            path,
+            grams=np.asarray(grams, dtype=str),
+            offsets=offsets,
+            doc_ids=doc_ids.astype(np.int32),
+            num_docs=np.asarray(self.num_docs),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "PhraseIndex":
+        with np.load(path) as data:
+            grams, offsets, doc_ids = data["grams"], data["offsets"], data["doc_ids"]
+            postings = {str(g): doc_ids[offsets[i]:offsets[i + 1]] for i, g in enumerate(grams)}
+            return cls(postings, int(data["num_docs"]))
@@ -0,0 +1,79 @@
+"""
+Building blocks for the streaming ingest pipeline:
+
+    pages ─▶ chunks ─▶ embedded batches ─▶ index writer
+
+Each stage is a generator. prefetch() runs a stage on a background thread
+behind a bounded queue, so stages overlap while at most `maxsize` items
+wait between any two of them; memory stays flat however large the corpus is.
+"""
+import queue
+import threading
+from typing import Iterable, Iterator, List, TypeVar
+
+T = TypeVar("T")
+
+# Items buffered between two pipeline stages
+DEFAULT_QUEUE_SIZE = 8
+
+_DONE = object()
+
+
+class _StageError:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def prefetch(iterable: Iterable[T], maxsize: int = DEFAULT_QUEUE_SIZE, name: str = "stage") -> Iterator[T]:
+    """
+    Iterate `iterable` on a background thread, handing items over through a
+    queue of at most `maxsize` entries. Errors in the producer are re-raised
+    in the consumer; closing the consumer early stops the producer.
+    """
+    items: "queue.Queue" = queue.Queue(maxsize=max(maxsize, 1))
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+        except BaseException as e:  # surfaced to the consumer below
+            put(_StageError(e))
+            return
+        put(_DONE)
+
+    thread = threading.Thread(target=produce, name=f"finora-{name}", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _StageError):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def batched(iterable: Iterable[T], size: int) -> Iterator[List[T]]:
+    """Consecutive lists of `size` items (the last one may be shorter)."""
+    batch: List[T] = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
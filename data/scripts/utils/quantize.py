@@ -0,0 +1,126 @@
+"""
+Quantized embedding matrices for the similarity scan.
+
+    float16   half-precision rows (2 bytes/dim)
+    int8      rows scaled per vector to [-127, 127] (1 byte/dim + one float32 scale)
+
+Rows are L2-normalized before quantization, so a quantized dot product
+approximates cosine similarity. Callers can rescore the best candidates
+against the exact float32 rows to keep the final ranking stable.
+"""
+import os
+from typing import List, Optional
+
+import numpy as np
+
+QUANTIZATION_MODES = ("none", "float16", "int8")
+
+# Rows scored per block, so the float32 upcast of a quantized block stays small
+SCAN_BLOCK_ROWS = 65536
+
+INT8_FILE = "vectors.int8.npy"
+INT8_SCALES_FILE = "scales.npy"
+FLOAT16_FILE = "vectors.f16.npy"
+
+
+class QuantizedMatrix:
+    """A quantized (n, dim) matrix that can be dot-multiplied with a float32 query."""
+
+    def __init__(self, mode: str, data: np.ndarray, scales: Optional[np.ndarray] = None):
+        if mode not in ("float16", "int8"):
+            raise ValueError(f"Unknown quantization mode: {mode}")
+        self.mode = mode
+        self.data = data
+        self.scales = scales
+        self.shape = data.shape
+
+    @classmethod
+    def from_matrix(cls, matrix: np.ndarray, mode: str) -> "QuantizedMatrix":
+        matrix = np.asarray(matrix, dtype=np.float32)
+        if mode == "float16":
+            return cls(mode, matrix.astype(np.float16))
+        if mode == "int8":
+            max_abs = np.abs(matrix).max(axis=1) if matrix.shape[0] else np.zeros(0, np.float32)
+            scales = (max_abs / 127.0).astype(np.float32)
+            safe = np.where(scales > 0, scales, 1.0)[:, None]
+            data = np.clip(np.rint(matrix / safe), -127, 127).astype(np.int8)
+            return cls(mode, data, scales)
+        raise ValueError(f"Unknown quantization mode: {mode}")
+
+    @classmethod
+    def concatenate(cls, blocks: List["QuantizedMatrix"]) -> "QuantizedMatrix":
+        mode = blocks[0].mode
+        data = np.concatenate([b.data for b in blocks])
+        scales = np.concatenate([b.scales for b in blocks]) if mode == "int8" else None
+        return cls(mode, data, scales)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.data.nbytes + (self.scales.nbytes if self.scales is not None else 0))
+
+    def __getitem__(self, key) -> "QuantizedMatrix":
+        """Row (and optionally column) selection; per-row scales follow the rows."""
+        rows = key[0] if isinstance(key, tuple) else key
+        return QuantizedMatrix(self.mode, self.data[key], self.scales[rows] if self.scales is not None else None)
+
+    def __matmul__(self, query: np.ndarray) -> np.ndarray:
+        return self.dot(query)
+
+    def dot(self, query: np.ndarray) -> np.ndarray:
+        """Approximate row · query for every row."""
+        query = np.asarray(query, dtype=np.float32)
+        out = np.empty(self.shape[0], dtype=np.float32)
+        for start in range(0, self.shape[0], SCAN_BLOCK_ROWS):
+            block = self.data[start:start + SCAN_BLOCK_ROWS].astype(np.float32)
+            out[start:start + block.shape[0]] = block @ query
+        if self.scales is not None:
+            out *= self.scales
+        return out
+
+    def save(self, index_dir: str) -> None:
+        if self.mode == "int8":
+            np.save(os.path.join(index_dir, INT8_FILE), self.data)
+            np.save(os.path.join(index_dir, INT8_SCALES_FILE), self.scales)
+        else:
+            np.save(os.path.join(index_dir, FLOAT16_FILE), self.data)
+
+
+def write_quantized(matrix: np.ndarray, index_dir: str, mode: str, block_rows: int = SCAN_BLOCK_ROWS) -> None:
+    """Quantize a (possibly memory-mapped) matrix block by block straight to disk."""
+    if mode not in ("float16", "int8"):
+        raise ValueError(f"Unknown quantization mode: {mode}")
+    n, dim = matrix.shape
+    if mode == "int8":
+        data = np.lib.format.open_memmap(os.path.join(index_dir, INT8_FILE), mode="w+", dtype=np.int8, shape=(n, dim))
+        scales = np.zeros(n, dtype=np.float32)
+    else:
+        data = np.lib.format.open_memmap(os.path.join(index_dir, FLOAT16_FILE), mode="w+", dtype=np.float16, shape=(n, dim))
+    for start in range(0, n, block_rows):
+        block = QuantizedMatrix.from_matrix(matrix[start:start + block_rows], mode)
+        data[start:start + block.shape[0]] = block.data
+        if mode == "int8":
+            scales[start:start + block.shape[0]] = block.scales
+    data.flush()
+    if mode == "int8":
+        np.save(os.path.join(index_dir, INT8_SCALES_FILE), scales)
+
+
+def load_quantized(index_dir: str, mode: str, expected_rows: int) -> Optional[QuantizedMatrix]:
+    """Memory-map a persisted quantized matrix, or None if absent or stale."""
+    if mode == "int8":
+        data_path = os.path.join(index_dir, INT8_FILE)
+        scales_path = os.path.join(index_dir, INT8_SCALES_FILE)
+        if not (os.path.exists(data_path) and os.path.exists(scales_path)):
+            return None
+        data = np.load(data_path, mmap_mode="r")
+        scales = np.load(scales_path)
+    elif mode == "float16":
+        data_path = os.path.join(index_dir, FLOAT16_FILE)
+        if not os.path.exists(data_path):
+            return None
+        data, scales = np.load(data_path, mmap_mode="r"), None
+    else:
+        return None
+    if data.shape[0] != expected_rows:
+        return None
+    return QuantizedMatrix(mode, data, scales)
@@ -0,0 +1,64 @@
+"""
+Vectorized similarity scoring over an index's embedding matrix.
+"""
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+try:
+    from .embedder import EMBED_DIM
+except ImportError:  # imported as a top-level module by the ingest scripts
+    from embedder import EMBED_DIM
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalize each row; all-zero rows stay zero."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def build_embedding_matrix(entries: List[Dict], dim: int = EMBED_DIM) -> np.ndarray:
+    """Stack entry embeddings into a pre-normalized float32 (n, dim) matrix."""
+    if not entries:
+        return np.zeros((0, dim), dtype=np.float32)
+    matrix = np.asarray([e["embedding"] for e in entries], dtype=np.float32)
+    return normalize_rows(matrix).astype(np.float32, copy=False)
+
+
+def normalize_query(query_vec: Sequence[float]) -> np.ndarray:
+    vec = np.asarray(query_vec, dtype=np.float32)
+    norm = float(np.linalg.norm(vec))
+    return vec / norm if norm > 0 else vec
+
+
+def cosine_scores(matrix, query_vec: Sequence[float]) -> np.ndarray:
+    """
+    Cosine similarity of the query against every row: one matrix-vector product.
+    matrix is a normalized float32 array or a QuantizedMatrix (approximate scores).
+    """
+    if matrix.shape[0] == 0:
+        return np.zeros(0, dtype=np.float64)
+    query = normalize_query(query_vec)
+    # Indexes built with a different embedding model (e.g. 1536-dim custom_index)
+    # are compared on the shared leading dimensions, as the original zip() did
+    dim = min(matrix.shape[1], query.shape[0])
+    if dim != matrix.shape[1] or dim != query.shape[0]:
+        matrix, query = matrix[:, :dim], query[:dim]
+    return np.asarray(matrix @ query, dtype=np.float64)
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the k highest scores, best first.
+    Ties keep their original order, matching a stable descending sort.
+    """
+    n = scores.shape[0]
+    if k <= 0 or n == 0:
+        return np.zeros(0, dtype=np.int64)
+    if k < n:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(n)
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order]
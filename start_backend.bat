@@ -31,7 +31,6 @@ REM Set Flask environment variables
 set FLASK_APP=data\backend\api.py
 set FLASK_ENV=development
 set FLASK_DEBUG=0
-set DISABLE_SIGNAL_TIMEOUT=1
 
 echo [setup] Python virtual environment activated
 echo [setup] Starting Flask API server...